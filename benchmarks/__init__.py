@@ -0,0 +1,2 @@
+# Benchmarks for cmd-call-graph. Each module can be run from the project root
+# with "python -m benchmarks.<module>".
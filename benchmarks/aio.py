@@ -0,0 +1,70 @@
+# Runs hundreds of concurrent build and render requests through
+# aio.AsyncRunner while measuring the event loop lag, i.e. how late a
+# coroutine sleeping in a loop wakes up. For comparison, the same requests
+# are also served by calling the synchronous API directly from the
+# coroutines, which stalls the loop for the whole duration of each request.
+#
+# Usage: python -m benchmarks.aio [num_requests] [num_lines]
+
+import asyncio
+import sys
+import time
+
+from callgraph import aio
+from callgraph import api
+
+from .generate import GenerateScript
+
+TICK = 0.005
+
+
+async def _MeasureLag(lags, done):
+    while not done.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+
+async def _Blocking(source):
+    return api.Render(api.Build(source))
+
+
+async def _Run(name, sources, request):
+    lags = []
+    done = asyncio.Event()
+    monitor = asyncio.create_task(_MeasureLag(lags, done))
+    start = time.perf_counter()
+    outputs = await asyncio.gather(*[request(source) for source in sources])
+    elapsed = time.perf_counter() - start
+    done.set()
+    await monitor
+
+    lags.sort()
+    p99 = lags[int(len(lags) * 0.99)] if lags else 0.0
+    print("  {:22} {:8.3f}s {:8.0f} requests/s  loop lag: max {:7.1f}ms, p99 {:7.1f}ms, {} ticks".format(
+        name, elapsed, len(sources) / elapsed, (lags[-1] if lags else 0.0) * 1000, p99 * 1000, len(lags)))
+    return outputs
+
+
+async def _Main(num_requests, num_lines):
+    sources = [(u"\n".join(GenerateScript(num_lines, max(1, num_lines // 100), seed=i)) + u"\n").encode("ascii")
+               for i in range(num_requests)]
+    print("{} concurrent requests, {} lines each".format(num_requests, num_lines))
+
+    expected = await _Run("blocking", sources, _Blocking)
+    async with aio.AsyncRunner() as runner:
+        outputs = await _Run("threads", sources, runner.RenderSource)
+        assert outputs == expected
+    async with aio.AsyncRunner(processes=True) as runner:
+        outputs = await _Run("processes", sources, runner.RenderSource)
+        assert outputs == expected
+
+
+def main():
+    num_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    num_lines = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    asyncio.run(_Main(num_requests, num_lines))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+# Times the structural analysis (callgraph.analysis) on the call graph of a
+# generated script with many labels. The target is well under a second for
+# 100k nodes.
+#
+# Usage: python -m benchmarks.analysis [num_lines] [num_functions]
+
+import sys
+import timeit
+
+from callgraph import analysis
+from callgraph.core import CallGraph
+
+from .generate import GenerateScript
+
+
+def main():
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    num_functions = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    call_graph = CallGraph.Build(GenerateScript(num_lines, num_functions))
+    num_edges = sum(len(node.connections) for node in call_graph.nodes.values())
+
+    print("{} nodes, {} connections".format(len(call_graph.nodes), num_edges))
+    for name, function in [("components", analysis.StronglyConnectedComponents),
+                           ("reachable", analysis.Reachable),
+                           ("unreachable", analysis.Unreachable),
+                           ("cycles", analysis.Cycles),
+                           ("analyze", analysis.Analyze)]:
+        elapsed = min(timeit.repeat(lambda: function(call_graph), number=1, repeat=3))
+        print("  {:12} {:8.3f}s".format(name, elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# Compares batch.RunBatch with and without deduplication on a generated
+# corpus modeled on real repositories: each script has its own code, plus
+# copies of a few shared boilerplate blocks (usage, logging, error
+# handling), and some scripts are copies of others.
+#
+# Usage: python -m benchmarks.dedup [num_files] [lines_per_file] [copy_ratio]
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import timeit
+
+from callgraph import batch
+
+from .generate import GenerateScript
+
+NUM_BOILERPLATE_BLOCKS = 8
+
+
+def _Boilerplate(rng, index, num_lines):
+    code = [u":common{}".format(index)]
+    for i in range(num_lines):
+        if rng.random() < 0.1:
+            code.append(u"  call :common{}".format(rng.randrange(NUM_BOILERPLATE_BLOCKS)))
+        else:
+            code.append(u"  echo [%date% %time%] step {} >> %LOGFILE%".format(i))
+    code.append(u"exit /b 0")
+    return code
+
+
+# Writes num_files scripts to directory, copy_ratio of which are copies of
+# other ones. Without shared_blocks, the scripts have no boilerplate blocks in
+# common, which is the worst case for the deduplication: every block is
+# hashed and none is reused.
+def GenerateCorpus(directory, num_files, lines_per_file, copy_ratio, seed=0, shared_blocks=True):
+    rng = random.Random(seed)
+    boilerplate = [_Boilerplate(rng, i, lines_per_file // 10) for i in range(NUM_BOILERPLATE_BLOCKS)]
+    scripts = []
+    for i in range(num_files):
+        if scripts and rng.random() < copy_ratio:
+            code = rng.choice(scripts)
+        elif shared_blocks:
+            code = GenerateScript(lines_per_file // 2, 5, seed=rng.randrange(1 << 30))
+            for block in rng.sample(boilerplate, NUM_BOILERPLATE_BLOCKS // 2):
+                code = code + block
+            scripts.append(code)
+        else:
+            code = GenerateScript(lines_per_file, 5, seed=rng.randrange(1 << 30))
+            scripts.append(code)
+        with open(os.path.join(directory, "script{}.cmd".format(i)), "w") as f:
+            f.write(u"\n".join(code) + u"\n")
+
+
+def main():
+    num_files = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    lines_per_file = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    copy_ratio = float(sys.argv[3]) if len(sys.argv) > 3 else 0.3
+
+    root = tempfile.mkdtemp()
+    try:
+        # The corpus with shared blocks and copies, then the worst case: no
+        # shared blocks and no copies.
+        corpora = [("in", copy_ratio, True), ("unique", 0.0, False)]
+        for input_name, corpus_copy_ratio, shared_blocks in corpora:
+            input_dir = os.path.join(root, input_name)
+            os.makedirs(input_dir)
+            GenerateCorpus(input_dir, num_files, lines_per_file, corpus_copy_ratio, shared_blocks=shared_blocks)
+            print("{} files of about {} lines, {:.0%} copies, {}".format(
+                num_files, lines_per_file, corpus_copy_ratio, "shared blocks" if shared_blocks else "no shared blocks"))
+
+            for name, use_dedup in [("no dedup", False), ("dedup", True)]:
+                output_dir = os.path.join(root, "out")
+                summaries = []
+                elapsed = min(timeit.repeat(lambda: summaries.append(batch.RunBatch(
+                    [input_dir], output_dir, jobs=1, use_dedup=use_dedup)), number=1, repeat=3))
+                print("  {:10} {:8.3f}s".format(name, elapsed))
+                print("    " + batch.FormatSummary(summaries[-1]))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
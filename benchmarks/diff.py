@@ -0,0 +1,37 @@
+# Compares the time taken by diff.Diff with the time taken to parse both
+# versions of a generated script, with a few small edits in between. The
+# target is for the diff to take no longer than the parsing.
+#
+# Usage: python -m benchmarks.diff [num_lines] [num_functions]
+
+import sys
+import timeit
+
+from callgraph import diff
+from callgraph.core import CallGraph
+
+from .generate import GenerateScript
+
+
+def main():
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    num_functions = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    old = GenerateScript(num_lines, num_functions)
+    new = list(old)
+    new[len(new) // 3] = u"  call :function1"
+    new.insert(len(new) // 2, u":inserted")
+    new.insert(2 * len(new) // 3, u"  ; a new line moves all the following blocks.")
+
+    old_graph = CallGraph.Build(old)
+    new_graph = CallGraph.Build(new)
+    print("{} lines, {} labels".format(len(old), num_functions))
+    for name, function in [("parse both", lambda: (CallGraph.Build(old), CallGraph.Build(new))),
+                           ("diff", lambda: diff.Diff(old_graph, new_graph)),
+                           ("diff dot", lambda: sum(len(chunk) for chunk in
+                                                    diff.GenerateDot(diff.Diff(old_graph, new_graph))))]:
+        elapsed = min(timeit.repeat(function, number=1, repeat=3))
+        print("  {:10} {:8.3f}s".format(name, elapsed))
+
+
+if __name__ == "__main__":
+    main()
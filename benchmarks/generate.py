@@ -0,0 +1,78 @@
+# Generation of synthetic CMD scripts of arbitrary size, following the same
+# model as the original scripts/generate-sample-cmd.py, which now runs this
+# module.
+#
+# Usage: python -m benchmarks.generate [output file] [--functions N]
+#            [--lines N] [--seed N]
+
+import argparse
+import random
+
+# Probability for any line of code to be a call to a random function.
+CALL_PROBABILITY = 0.05
+
+# Probability for any function to not terminate with "exit /b 0", which
+# results in a "nested" link in cmd-call-graph
+NESTED_PROBABILITY = 0.01
+
+# Default number of functions to generate from the command line.
+NUM_FUNCTIONS = 30
+
+# Default maximum number of LoC to generate for each function from the
+# command line.
+MAX_LENGTH = 100
+
+
+# Returns a list of lines (without line terminators) of a script containing
+# num_functions labels and roughly num_lines lines of code overall.
+# Unless seed is None, the output only depends on the arguments, so that
+# benchmark runs are comparable.
+def GenerateScript(num_lines, num_functions, call_probability=CALL_PROBABILITY,
+                   nested_probability=NESTED_PROBABILITY, seed=0):
+    rng = random.Random(seed)
+    functions = [u"function{}".format(i) for i in range(num_functions)]
+    average_length = max(1, num_lines // max(1, num_functions))
+
+    code = [u"@echo off", u"call :function0", u"exit /b 0"]
+
+    for function in functions:
+        code.append(u":{}".format(function))
+        loc = rng.randint(1, 2 * average_length - 1) if average_length > 1 else 1
+
+        for i in range(loc):
+            if rng.random() < call_probability:
+                target = rng.choice(functions)
+                code.append(u"  call :{}".format(target))
+            else:
+                code.append(u"  ; some code goes here.")
+
+        if rng.random() > nested_probability:
+            code.append(u"exit /b 0")
+
+    return code
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("output", help="Output file. If it's not set, stdout is used.", nargs="?")
+    parser.add_argument("--functions", help="Number of functions to generate.", type=int, default=NUM_FUNCTIONS)
+    parser.add_argument("--lines", help="Approximate number of lines of code to generate.", type=int,
+                        default=None)
+    parser.add_argument("--seed", help="Seed of the random generator, for reproducible output.", type=int,
+                        default=None)
+    args = parser.parse_args()
+
+    num_lines = args.lines
+    if num_lines is None:
+        num_lines = args.functions * MAX_LENGTH // 2
+    code = GenerateScript(num_lines, args.functions, seed=args.seed)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(u"\n".join(code))
+    else:
+        print(u"\n".join(code))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+# Times the built-in layered layout and the SVG output on the call graph of a
+# generated script with many labels. The target is a few seconds for 50k
+# nodes.
+#
+# Usage: python -m benchmarks.layout [num_lines] [num_functions]
+
+import sys
+import timeit
+
+from callgraph import layout
+from callgraph import render
+from callgraph.core import CallGraph
+
+from .generate import GenerateScript
+
+
+def main():
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    num_functions = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+    call_graph = CallGraph.Build(GenerateScript(num_lines, num_functions))
+    nodes = sorted(call_graph.nodes.values(), key=lambda node: (node.line_number < 0, node.line_number, node.name))
+    index = {node.name: i for i, node in enumerate(nodes)}
+    edges = [(index[node.name], index[c.dst]) for node in nodes for c in node.connections if c.dst in index]
+    sizes = [(100, 50)] * len(nodes)
+
+    drawing = layout.Layered(sizes, edges)
+    print("{} nodes, {} connections, {} layers, {:.0f}x{:.0f}".format(
+        len(nodes), len(edges), max(box.layer for box in drawing.boxes) + 1, drawing.width, drawing.height))
+    for name, function in [("layout", lambda: layout.Layered(sizes, edges)),
+                           ("svg", lambda: sum(len(chunk) for chunk in render.GenerateSvg(call_graph)))]:
+        elapsed = min(timeit.repeat(function, number=1, repeat=3))
+        print("  {:8} {:8.3f}s".format(name, elapsed))
+
+
+if __name__ == "__main__":
+    main()
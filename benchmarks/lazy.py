@@ -0,0 +1,51 @@
+# Compares the time taken to list the labels of a generated script, and to
+# focus on the neighborhood of one of them, with the full build and with
+# lazy.LazyCallGraph, which only annotates the blocks it needs.
+#
+# Usage: python -m benchmarks.lazy [num_lines] [num_functions]
+
+import sys
+import time
+
+from callgraph import lazy
+from callgraph import reader
+from callgraph.core import CallGraph
+
+from .generate import GenerateScript
+
+
+def main():
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    num_functions = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    lines = GenerateScript(num_lines, num_functions)
+    data = u"\r\n".join(lines).encode("utf-8")
+    label = u"function{}".format(num_functions // 2)
+    print("{} lines, {} labels".format(len(lines), num_functions))
+
+    start = time.perf_counter()
+    call_graph = CallGraph.Build(reader.IterDecodedLines(data, "utf-8"))
+    build_time = time.perf_counter() - start
+    print("  {:24} {:8.1f} ms".format("full build", build_time * 1000))
+    start = time.perf_counter()
+    call_graph.Neighborhood([label])
+    print("  {:24} {:8.1f} ms".format("full build + focus", (build_time + time.perf_counter() - start) * 1000))
+
+    start = time.perf_counter()
+    call_graph = lazy.LazyCallGraph(data, "utf-8")
+    call_graph.Labels()
+    print("  {:24} {:8.1f} ms".format("lazy labels", (time.perf_counter() - start) * 1000))
+
+    start = time.perf_counter()
+    call_graph = lazy.LazyCallGraph(data, "utf-8")
+    call_graph.Neighborhood([label])
+    elapsed = time.perf_counter() - start
+    print("  {:24} {:8.1f} ms ({} of {} blocks annotated)".format("lazy focus", elapsed * 1000,
+                                                                  *call_graph.AnnotatedBlocks()))
+
+    start = time.perf_counter()
+    lazy.LazyCallGraph(data, "utf-8").Evaluate()
+    print("  {:24} {:8.1f} ms".format("lazy, whole graph", (time.perf_counter() - start) * 1000))
+
+
+if __name__ == "__main__":
+    main()
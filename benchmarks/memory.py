@@ -0,0 +1,117 @@
+# Tracks the memory used by CallGraph.Build.
+#
+# Each measurement runs in a fresh process, so that the peak RSS reported by
+# the OS only accounts for that build. The allocations made while building are
+# also measured with tracemalloc, which gives the bytes per line figure that
+# is compared with TARGET_BYTES_PER_LINE.
+#
+# Usage: python -m benchmarks.memory [num_lines ...]
+
+import multiprocessing
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from callgraph.core import CallGraph
+
+from .generate import GenerateScript
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Documented target for the memory retained by CallGraph.Build for each line
+# of a typical generated script (lines are about 25 characters long).
+TARGET_BYTES_PER_LINE = 200
+
+DEFAULT_SCALES = [10000, 100000, 1000000]
+
+
+def _PeakRssBytes():
+    # On Linux ru_maxrss is inherited across exec, so it may reflect the
+    # memory used by the parent process; VmHWM is reset instead.
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, in kilobytes elsewhere.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# Runs in the child process. tracemalloc has a large overhead of its own, so
+# peak RSS and traced allocations are measured in two separate runs.
+def _Measure(path, queue, trace):
+    rss_before = _PeakRssBytes()
+    if trace:
+        tracemalloc.start()
+    with open(path, "r") as f:
+        call_graph = CallGraph.Build(f)
+    lines = sum(node.loc for node in call_graph.nodes.values())
+
+    if trace:
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        queue.put(dict(lines=lines, retained_bytes=retained, peak_traced_bytes=peak))
+    else:
+        rss_after = _PeakRssBytes()
+        queue.put(dict(peak_rss_delta_bytes=rss_after - rss_before if rss_before is not None else None))
+
+
+def _RunInChild(path, trace):
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_Measure, args=(path, queue, trace))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+# Builds the call graph of a generated script with num_lines lines in
+# separate processes, and returns a dictionary with the memory statistics.
+def MeasureBuild(num_lines, num_functions=None):
+    if num_functions is None:
+        num_functions = max(10, num_lines // 100)
+
+    fd, path = tempfile.mkstemp(suffix=".cmd")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write("\n".join(GenerateScript(num_lines, num_functions)))
+        result = dict(file_bytes=os.path.getsize(path))
+        result.update(_RunInChild(path, trace=True))
+        result.update(_RunInChild(path, trace=False))
+    finally:
+        os.remove(path)
+
+    result["bytes_per_line"] = result["retained_bytes"] / max(1, result["lines"])
+    return result
+
+
+def main():
+    scales = [int(x) for x in sys.argv[1:]] or DEFAULT_SCALES
+    print("{:>10} {:>14} {:>14} {:>14} {:>10}".format("lines", "retained", "peak traced", "peak RSS", "B/line"))
+    over_target = False
+    for num_lines in scales:
+        result = MeasureBuild(num_lines)
+        rss = result["peak_rss_delta_bytes"]
+        print("{:>10} {:>14} {:>14} {:>14} {:>10.1f}".format(
+            result["lines"], result["retained_bytes"], result["peak_traced_bytes"],
+            "n/a" if rss is None else rss, result["bytes_per_line"]))
+        over_target = over_target or result["bytes_per_line"] > TARGET_BYTES_PER_LINE
+
+    if over_target:
+        print("Memory usage above the target of {} bytes per line.".format(TARGET_BYTES_PER_LINE))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
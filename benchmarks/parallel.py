@@ -0,0 +1,52 @@
+# Compares the sequential CallGraph.Build with parallel.BuildParallel on a
+# generated script, for an increasing number of worker processes, and checks
+# that both give the same graph.
+#
+# Usage: python -m benchmarks.parallel [num_lines] [num_functions]
+
+import os
+import sys
+import tempfile
+import timeit
+
+from callgraph import parallel
+from callgraph.core import CallGraph
+from callgraph.render import GenerateJson
+
+from .generate import GenerateScript
+
+
+def _BuildSequential(path):
+    with open(path, "r") as f:
+        return CallGraph.Build(f)
+
+
+def main():
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 2000000
+    num_functions = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    code = GenerateScript(num_lines, num_functions)
+
+    fd, path = tempfile.mkstemp(suffix=".cmd")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write("\n".join(code))
+        print("{} lines, {} labels, {:.1f} MB, {} CPUs".format(len(code), num_functions, os.path.getsize(path) / 1e6,
+                                                               os.cpu_count()))
+
+        expected = "".join(GenerateJson(_BuildSequential(path), show_node_stats=True))
+        elapsed = min(timeit.repeat(lambda: _BuildSequential(path), number=1, repeat=3))
+        print("  {:14} {:8.3f}s {:12.0f} lines/s".format("sequential", elapsed, len(code) / elapsed))
+
+        for jobs in [2, 4, 8]:
+            actual = "".join(GenerateJson(parallel.BuildParallel(path, jobs), show_node_stats=True))
+            if actual != expected:
+                print("  {} jobs: the graph differs from the sequential one".format(jobs))
+                sys.exit(1)
+            elapsed = min(timeit.repeat(lambda: parallel.BuildParallel(path, jobs), number=1, repeat=3))
+            print("  {:14} {:8.3f}s {:12.0f} lines/s".format("{} jobs".format(jobs), elapsed, len(code) / elapsed))
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# Compares the memory-mapped reader (callgraph.reader) with a text-mode file
+# object, both for reading the lines alone and for the whole CallGraph.Build,
+# on generated scripts with LF and CRLF line endings.
+#
+# Usage: python -m benchmarks.reader [num_lines] [num_functions]
+
+import os
+import sys
+import tempfile
+import timeit
+
+from callgraph import reader
+from callgraph.core import CallGraph
+
+from .generate import GenerateScript
+
+
+def _ReadText(path):
+    with open(path, "r") as f:
+        return sum(1 for _ in f)
+
+
+def _ReadMmap(path):
+    with reader.MappedFile(path) as f:
+        return sum(1 for _ in f)
+
+
+def _BuildText(path):
+    with open(path, "r") as f:
+        return CallGraph.Build(f)
+
+
+def _BuildMmap(path):
+    with reader.MappedFile(path) as f:
+        return CallGraph.Build(f)
+
+
+def _ScanLabels(path):
+    with reader.MappedFile(path) as f:
+        return f.ScanLabels()
+
+
+def main():
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    num_functions = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    code = GenerateScript(num_lines, num_functions)
+
+    for newline in ["\n", "\r\n"]:
+        fd, path = tempfile.mkstemp(suffix=".cmd")
+        try:
+            with os.fdopen(fd, "w", newline="") as f:
+                f.write(newline.join(code))
+            print("{} lines, {} labels, {} line endings, {:.1f} MB".format(
+                len(code), num_functions, "CRLF" if newline == "\r\n" else "LF", os.path.getsize(path) / 1e6))
+            for name, function in [("read (text)", _ReadText), ("read (mmap)", _ReadMmap),
+                                   ("build (text)", _BuildText), ("build (mmap)", _BuildMmap),
+                                   ("scan labels", _ScanLabels)]:
+                elapsed = min(timeit.repeat(lambda: function(path), number=1, repeat=3))
+                print("  {:14} {:8.3f}s {:12.0f} lines/s".format(name, elapsed, len(code) / elapsed))
+        finally:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+# Benchmark suite: times each phase of CallGraph.Build and PrintDot on
+# generated scripts of several sizes, records the peak memory usage, and
+# writes the results as JSON so that runs on different commits can be
+# compared.
+#
+# Usage: python -m benchmarks [--scales small,medium] [--output results.json]
+#            [--compare baseline.json] [--threshold 0.1]
+#
+# With --compare, the exit code is 1 if any phase got slower than the
+# baseline by more than the threshold.
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from callgraph import __version__
+from callgraph.core import CallGraph
+from callgraph.render import PrintDot
+
+from .generate import GenerateScript
+from .memory import MeasureBuild
+
+# Name -> (number of lines, number of labels).
+SCALES = {
+    "small": (1000, 10),
+    "medium": (100000, 1000),
+    "large": (1000000, 10000),
+    "xlarge": (10000000, 100000),
+}
+
+DEFAULT_SCALES = ["small", "medium", "large"]
+
+DEFAULT_THRESHOLD = 0.1
+
+# Phases shorter than this are too noisy to be compared with a baseline.
+MIN_COMPARABLE_SECONDS = 0.01
+
+
+# Runs all the phases once on the script at path, returning the time taken
+# by each of them in seconds.
+def _TimePhases(path):
+    timings = {}
+
+    def Timed(name, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        timings[name] = time.perf_counter() - start
+        return result
+
+    def Annotate(call_graph):
+        for node in call_graph.nodes.values():
+            call_graph._AnnotateNode(node)
+
+    with open(path, "r") as f:
+        call_graph = Timed("parse", CallGraph._ParseSource, f)
+    Timed("annotate", Annotate, call_graph)
+    Timed("prune_eof", call_graph._PruneEof)
+    Timed("nested_connections", call_graph._AddNestedConnections)
+    Timed("mark_last_node", call_graph._MarkLastNode)
+    Timed("mark_exit_nodes", call_graph._MarkExitNodes)
+    with open(os.devnull, "w") as out_file:
+        Timed("render", PrintDot, call_graph, out_file)
+    return timings
+
+
+def RunScale(name, repeat=3, measure_memory=True):
+    num_lines, num_labels = SCALES[name]
+    fd, path = tempfile.mkstemp(suffix=".cmd")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write("\n".join(GenerateScript(num_lines, num_labels)))
+        with open(path, "r") as f:
+            lines = sum(1 for _ in f)
+
+        # Keep the best time for each phase.
+        phases = {}
+        for _ in range(repeat):
+            for phase, elapsed in _TimePhases(path).items():
+                phases[phase] = min(elapsed, phases.get(phase, elapsed))
+    finally:
+        os.remove(path)
+
+    total = sum(phases.values())
+    result = dict(lines=lines, labels=num_labels, phases=phases, total=total, lines_per_second=lines / total)
+    if measure_memory:
+        memory = MeasureBuild(num_lines, num_labels)
+        result["peak_traced_bytes"] = memory["peak_traced_bytes"]
+        result["peak_rss_delta_bytes"] = memory["peak_rss_delta_bytes"]
+    return result
+
+
+def _GitCommit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Returns a list of human-readable regressions of results compared to
+# baseline (both as written by main).
+def Compare(baseline, results, threshold=DEFAULT_THRESHOLD):
+    regressions = []
+    for scale, result in sorted(results["results"].items()):
+        old = baseline.get("results", {}).get(scale)
+        if old is None:
+            continue
+        for phase, elapsed in sorted(result["phases"].items()):
+            old_elapsed = old["phases"].get(phase)
+            if old_elapsed is None or old_elapsed < MIN_COMPARABLE_SECONDS:
+                continue
+            if elapsed > old_elapsed * (1 + threshold):
+                regressions.append("{}/{}: {:.3f}s -> {:.3f}s (+{:.0%})".format(
+                    scale, phase, old_elapsed, elapsed, elapsed / old_elapsed - 1))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", help="Comma-separated list of scales to run, among: {}.".format(
+                        ", ".join(SCALES)), default=",".join(DEFAULT_SCALES))
+    parser.add_argument("--repeat", help="Number of runs for each scale; the best time is kept.", type=int,
+                        default=3)
+    parser.add_argument("--no-memory", help="Do not measure the peak memory usage.", action="store_true",
+                        dest="nomemory")
+    parser.add_argument("-o", "--output", help="Output JSON file. If it's not set, stdout is used.")
+    parser.add_argument("--compare", help="Baseline JSON file to compare the results with.")
+    parser.add_argument("--threshold", help="Relative slowdown reported as a regression.", type=float,
+                        default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    scales = [scale.strip() for scale in args.scales.split(",") if scale.strip()]
+    for scale in scales:
+        if scale not in SCALES:
+            parser.error("unknown scale: {}".format(scale))
+
+    results = dict(
+        version=__version__,
+        commit=_GitCommit(),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        timestamp=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        results={},
+    )
+    for scale in scales:
+        print("Running {}...".format(scale), file=sys.stderr)
+        result = RunScale(scale, repeat=args.repeat, measure_memory=not args.nomemory)
+        results["results"][scale] = result
+        print("  {} lines in {:.3f}s ({:.0f} lines/s)".format(result["lines"], result["total"],
+              result["lines_per_second"]), file=sys.stderr)
+
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = Compare(baseline, results, args.threshold)
+        for regression in regressions:
+            print("REGRESSION: " + regression, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("No regressions above {:.0%}.".format(args.threshold), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
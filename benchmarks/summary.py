@@ -0,0 +1,68 @@
+# Compares the consumers of the per-node command summary (exit node
+# marking and node statistics) with the per-line scans they replaced, on a
+# script with few, large blocks.
+#
+# Usage: python -m benchmarks.summary [num_lines] [num_functions]
+
+import collections
+import itertools
+import sys
+import timeit
+
+from callgraph.core import CallGraph, Command
+
+from .generate import GenerateScript
+
+
+# The exit node marking previously in CallGraph._MarkExitNodes.
+def _LegacyMarkExitNodes(call_graph):
+    for node in call_graph.nodes.values():
+        all_commands = set(itertools.chain.from_iterable(line.commands for line in node.code))
+        if Command("exit", "") in all_commands:
+            node.is_exit_node = True
+
+    q = [call_graph.first_node]
+    visited = set()
+    while q:
+        cur = q.pop()
+        visited.add(cur.name)
+        if cur.is_last_node:
+            cur.is_exit_node = True
+        else:
+            for command in itertools.chain.from_iterable(line.commands for line in cur.code):
+                if command[0] == "exit" or (command[0] == "goto" and command[1] == "eof"):
+                    cur.is_exit_node = True
+                    break
+        for connection in cur.connections:
+            if connection.dst not in call_graph.nodes or connection.dst in visited:
+                continue
+            if connection.kind == "nested" or connection.kind == "goto":
+                q.append(call_graph.nodes[connection.dst])
+
+
+# The node statistics previously computed by render (Node.GetCommandCount).
+def _LegacyNodeStats(call_graph):
+    return [collections.Counter(command.command for line in node.code for command in line.commands)["external_call"]
+            for node in call_graph.nodes.values()]
+
+
+def _NodeStats(call_graph):
+    return [node.summary.Count("external_call") for node in call_graph.nodes.values()]
+
+
+def main():
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    num_functions = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    call_graph = CallGraph.Build(GenerateScript(num_lines, num_functions))
+
+    print("{} lines, {} labels".format(num_lines, num_functions))
+    for description, legacy, current in [("mark exit nodes", _LegacyMarkExitNodes, CallGraph._MarkExitNodes),
+                                         ("node stats", _LegacyNodeStats, _NodeStats)]:
+        print(description)
+        for name, function in [("line scan", legacy), ("summary", current)]:
+            elapsed = min(timeit.repeat(lambda: function(call_graph), number=1, repeat=3))
+            print("  {:12} {:10.4f}s".format(name, elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# Microbenchmark comparing callgraph.tokenizer.Tokenize with the per-token
+# split/strip loop it replaced, on mostly plain lines of code (like real
+# scripts), on lines which all contain commands, and on calls to as many
+# distinct labels as there are lines (like scripts with many small functions),
+# which exercise the cache of Command instances.
+#
+# Usage: python -m benchmarks.tokenizer [num_lines]
+
+import sys
+import timeit
+
+from callgraph.tokenizer import Command, Tokenize
+
+PLAIN_LINES = [
+    "set path=%path%;c:\\tools",
+    "echo building %project% in %cd%",
+    "if exist out.txt del out.txt",
+    "for %%f in (*.txt) do type %%f",
+    "",
+]
+
+COMMAND_LINES = [
+    "call :build %1",
+    "if errorlevel 1 goto :error",
+    "exit /b 0",
+    "rem this is a comment",
+    "call tools\\sign.cmd %target%",
+]
+
+
+# The tokenization loop previously in CallGraph._AnnotateNode.
+def _LegacyTokenize(text):
+    noop = False
+    commands = []
+    tokens = text.strip().lower().split()
+    if not tokens:
+        return True, commands
+
+    for i, token in enumerate(tokens):
+        token = token.lstrip("(").rstrip(")")
+
+        if token.startswith("::") or token == "rem" or token.startswith("@::") or token == "@rem":
+            noop = True
+            break
+
+        if token == "goto" or token == "@goto":
+            target = tokens[i+1].lstrip("(").rstrip(")")
+            block_name = target[1:]
+            if not block_name:
+                continue
+            commands.append(Command("goto", block_name))
+            continue
+
+        if token == "call" or token == "@call":
+            target = tokens[i+1].lstrip("(").rstrip(")")
+            if target[0] != ":":
+                commands.append(Command("external_call", target))
+                continue
+            block_name = target[1:]
+            if not block_name:
+                continue
+            commands.append(Command("call", block_name))
+            continue
+
+        if token == "exit" or token == "@exit":
+            target = ""
+            if i+1 < len(tokens):
+                target = tokens[i+1]
+            commands.append(Command("exit", target))
+
+    return noop, commands
+
+
+# Returns num_lines lines, of which one in command_ratio contains a command.
+def _Lines(num_lines, command_ratio):
+    lines = []
+    for i in range(num_lines):
+        if i % command_ratio == 0:
+            lines.append(COMMAND_LINES[(i // command_ratio) % len(COMMAND_LINES)])
+        else:
+            lines.append(PLAIN_LINES[i % len(PLAIN_LINES)])
+    return lines
+
+
+# Returns num_lines calls, each to a different label.
+def _DistinctCalls(num_lines):
+    return ["call :label{}".format(i) for i in range(num_lines)]
+
+
+def main():
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    cases = [("95% plain code", _Lines(num_lines, 20)), ("all commands", _Lines(num_lines, 1)),
+             ("distinct call targets", _DistinctCalls(num_lines))]
+    for description, lines in cases:
+        print("{} ({} lines)".format(description, num_lines))
+        for name, function in [("legacy loop", _LegacyTokenize), ("tokenizer", Tokenize)]:
+            elapsed = min(timeit.repeat(lambda: [function(line) for line in lines], number=1, repeat=3))
+            print("  {:12} {:8.3f}s {:12.0f} lines/s".format(name, elapsed, num_lines / elapsed))
+
+
+if __name__ == "__main__":
+    main()
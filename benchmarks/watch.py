@@ -0,0 +1,45 @@
+# Compares the time taken by watch.IncrementalGraph to update the call graph
+# of a generated script after a one-line edit with the time taken to build
+# it from scratch. The target is for the update to take a small fraction of
+# the full build, wherever the edit is.
+#
+# Usage: python -m benchmarks.watch [num_lines] [num_functions]
+
+import sys
+import time
+
+from callgraph import watch
+from callgraph.core import CallGraph
+
+from .generate import GenerateScript
+
+
+def main():
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    num_functions = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    lines = GenerateScript(num_lines, num_functions)
+    print("{} lines, {} labels".format(len(lines), num_functions))
+
+    start = time.perf_counter()
+    CallGraph.Build(lines)
+    print("  {:24} {:8.1f} ms".format("full build", (time.perf_counter() - start) * 1000))
+
+    graph = watch.IncrementalGraph()
+    graph.Update(lines)
+    for name, position in [("edit at the start", 3), ("edit in the middle", len(lines) // 2),
+                           ("edit at the end", len(lines) - 2)]:
+        for action in ["change", "insert"]:
+            edited = list(graph.lines)
+            if action == "change":
+                edited[position] = u"  call :function1"
+            else:
+                edited.insert(position, u"  ; a new line moves all the following blocks.")
+            start = time.perf_counter()
+            graph.Update(edited)
+            elapsed = time.perf_counter() - start
+            print("  {:24} {:8.1f} ms ({} lines parsed)".format("{}: {}".format(name, action), elapsed * 1000,
+                                                               graph.reparsed_lines))
+
+
+if __name__ == "__main__":
+    main()
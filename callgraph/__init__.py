@@ -1 +1,3 @@
 __version__ = "1.2.1"
+
+from .api import Build, BuildFile, BuildOptions, BuildText, Render, RenderOptions
@@ -0,0 +1,140 @@
+# asyncio front-end of the library API (see api.py), for services running an
+# event loop: building and rendering run in a bounded pool of worker threads
+# or processes, so that they never block the loop.
+#
+# asyncio has no non-blocking file I/O, so input files are read by the
+# workers, like everything else. Backpressure is applied at two points: at
+# most max_pending requests are handed to the workers at any time (the
+# others wait on a semaphore, without using any thread), and streamed output
+# is passed through a bounded queue, so that a worker producing chunks
+# faster than they are consumed simply waits.
+
+import asyncio
+import concurrent.futures
+import functools
+
+from . import api
+from . import render
+
+DEFAULT_MAX_PENDING = 64
+
+# Size of the blocks of text yielded by AsyncRunner.Stream, and number of
+# blocks which can be waiting to be consumed.
+DEFAULT_STREAM_BLOCK_SIZE = 64 * 1024
+DEFAULT_STREAM_QUEUE_SIZE = 4
+
+_END = object()
+
+
+# Builds and renders source, in a worker.
+def _BuildAndRender(source, build_options, render_options):
+    return api.Render(api.Build(source, build_options), render_options)
+
+
+# Runs the library API in a pool of max_workers workers (the default of
+# concurrent.futures if None): threads, or processes if processes is set.
+# Call graphs returned by Build live in the event loop's process, so with
+# processes they are pickled back, which is slow for large graphs:
+# RenderSource, which only returns the rendered text, is then preferable.
+# Streaming always runs in a thread.
+#
+# Must be created and used within the same event loop, and closed with
+# Close (or used as an async context manager).
+class AsyncRunner:
+    def __init__(self, max_workers=None, processes=False, max_pending=DEFAULT_MAX_PENDING):
+        self._threads = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers,
+                                                              thread_name_prefix="callgraph")
+        self._executor = self._threads
+        if processes:
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+        self._pending = asyncio.Semaphore(max_pending)
+
+    async def _Run(self, executor, function, *args):
+        async with self._pending:
+            return await asyncio.get_running_loop().run_in_executor(executor, function, *args)
+
+    # Builds the call graph of source. See api.Build for the arguments.
+    async def Build(self, source, options=None, **overrides):
+        options = api._Options(options, api.DEFAULT_BUILD_OPTIONS, overrides)
+        return await self._Run(self._executor, api.Build, source, options)
+
+    # Renders call_graph to a string. See api.Render for the arguments.
+    async def Render(self, call_graph, options=None, analysis=None, **overrides):
+        options = api._Options(options, api.DEFAULT_RENDER_OPTIONS, overrides)
+        return await self._Run(self._threads, functools.partial(api.Render, call_graph, options, analysis=analysis))
+
+    # Builds the call graph of source and renders it to a string, entirely in
+    # a worker.
+    async def RenderSource(self, source, build_options=None, render_options=None):
+        build_options = api._Options(build_options, api.DEFAULT_BUILD_OPTIONS, None)
+        render_options = api._Options(render_options, api.DEFAULT_RENDER_OPTIONS, None)
+        return await self._Run(self._executor, _BuildAndRender, source, build_options, render_options)
+
+    # Renders call_graph, yielding the output in blocks of about block_size
+    # characters as they are generated. See api.Render for the other
+    # arguments. The worker is stopped if the iteration is abandoned.
+    async def Stream(self, call_graph, options=None, analysis=None, block_size=DEFAULT_STREAM_BLOCK_SIZE,
+                     **overrides):
+        options = api._Options(options, api.DEFAULT_RENDER_OPTIONS, overrides)
+        output_format, render_options = api._RenderArguments(options, analysis)
+        generate = render.GetFormat(output_format).generate
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(DEFAULT_STREAM_QUEUE_SIZE)
+        cancelled = [False]
+
+        def Put(item):
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+        def Produce():
+            try:
+                block = []
+                size = 0
+                for chunk in generate(call_graph, **render_options):
+                    if cancelled[0]:
+                        return
+                    block.append(chunk)
+                    size += len(chunk)
+                    if size >= block_size:
+                        Put(u"".join(block))
+                        block = []
+                        size = 0
+                if block and not cancelled[0]:
+                    Put(u"".join(block))
+            finally:
+                if not cancelled[0]:
+                    Put(_END)
+
+        async with self._pending:
+            producer = loop.run_in_executor(self._threads, Produce)
+            try:
+                while True:
+                    item = await queue.get()
+                    if item is _END:
+                        break
+                    yield item
+                # Raises the exceptions of the producer, if any.
+                await producer
+            finally:
+                if not producer.done():
+                    cancelled[0] = True
+                    # Makes room for the chunk the producer may be waiting
+                    # to put, so that it can see it was cancelled.
+                    while not queue.empty():
+                        queue.get_nowait()
+                    try:
+                        await producer
+                    except Exception:
+                        pass
+
+    # Shuts down the workers.
+    async def Close(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._executor.shutdown)
+        if self._executor is not self._threads:
+            await loop.run_in_executor(None, self._threads.shutdown)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.Close()
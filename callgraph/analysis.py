@@ -0,0 +1,190 @@
+# Structural analysis of call graphs: strongly connected components, nodes
+# reachable from the start of the script, unreachable (dead) blocks and
+# cycles, i.e. goto loops and recursive calls.
+#
+# All the connection kinds (call, goto, nested) are followed, and only
+# connections to existing nodes are considered. Everything runs in time
+# linear in the size of the graph, without recursion, so it works on graphs
+# of any depth.
+
+import collections
+import json
+import logging
+
+from . import core
+
+logger = logging.getLogger(__name__)
+
+# Strongly connected component with more than one node, or with a node
+# connected to itself. nodes are sorted by name; recursive is True if there
+# is at least a call connection inside the cycle (i.e., a block can call
+# itself, directly or indirectly), otherwise it is a goto/nested loop;
+# calls are the (src, dst, line number) tuples of these call connections.
+Cycle = collections.namedtuple("Cycle", ["nodes", "recursive", "calls"])
+
+# Result of Analyze. components are all the strongly connected components,
+# each as a sorted list of node names, in reverse topological order (a
+# component only connects to components before it); reachable is the set of
+# nodes reachable from the first node; unreachable are the defined nodes which
+# are not reachable, in order of definition; cycles is a list of Cycle.
+Analysis = collections.namedtuple("Analysis", ["components", "reachable", "unreachable", "cycles"])
+
+
+_NO_SUCCESSORS = ()
+
+
+def _Successors(call_graph):
+    nodes = call_graph.nodes
+    successors = {}
+    for name, node in nodes.items():
+        connections = node.connections
+        successors[name] = [c.dst for c in connections if c.dst in nodes] if connections else _NO_SUCCESSORS
+    return successors
+
+
+# Returns the strongly connected components of call_graph, computed with an
+# iterative version of Tarjan's algorithm.
+def StronglyConnectedComponents(call_graph, successors=None):
+    if successors is None:
+        successors = _Successors(call_graph)
+
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    components = []
+
+    for root, root_successors in successors.items():
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        if not root_successors:
+            # Most nodes have no successors, and are components on their own.
+            components.append([root])
+            continue
+
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(root_successors))]
+
+        while work:
+            v, children = work[-1]
+            for w in children:
+                if w not in index:
+                    index[w] = low[w] = len(index)
+                    w_successors = successors[w]
+                    if not w_successors:
+                        components.append([w])
+                        continue
+                    stack.append(w)
+                    on_stack.add(w)
+                    work.append((w, iter(w_successors)))
+                    break
+                if w in on_stack and index[w] < low[v]:
+                    low[v] = index[w]
+            else:
+                # All the successors of v have been visited.
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    if low[v] < low[parent]:
+                        low[parent] = low[v]
+                if low[v] == index[v]:
+                    w = stack.pop()
+                    on_stack.discard(w)
+                    if w == v:
+                        components.append([w])
+                        continue
+                    component = [w]
+                    while w != v:
+                        w = stack.pop()
+                        on_stack.discard(w)
+                        component.append(w)
+                    component.sort()
+                    components.append(component)
+
+    return components
+
+
+# Returns the set of the names of the nodes reachable from start (by default,
+# the first node of call_graph), start included.
+def Reachable(call_graph, start=None):
+    if start is None:
+        start = call_graph.first_node
+    if start is None:
+        return set()
+
+    reachable = set([start.name])
+    q = [start]
+    while q:
+        cur = q.pop()
+        for c in cur.connections:
+            if c.dst not in reachable and c.dst in call_graph.nodes:
+                reachable.add(c.dst)
+                q.append(call_graph.nodes[c.dst])
+    return reachable
+
+
+# Returns the nodes defined in call_graph (i.e., not virtual) which are not
+# reachable from its first node, in order of definition.
+def Unreachable(call_graph, reachable=None):
+    if reachable is None:
+        reachable = Reachable(call_graph)
+    return [node for node in call_graph.nodes_in_order if node.name not in reachable]
+
+
+# Returns the cycles among the strongly connected components of call_graph,
+# sorted by their nodes.
+def Cycles(call_graph, components=None, successors=None):
+    if successors is None:
+        successors = _Successors(call_graph)
+    if components is None:
+        components = StronglyConnectedComponents(call_graph, successors)
+
+    cycles = []
+    for component in components:
+        if len(component) == 1 and component[0] not in successors[component[0]]:
+            continue
+        members = set(component)
+        calls = []
+        for name in component:
+            for c in call_graph.nodes[name].connections:
+                if c.dst not in members:
+                    continue
+                if c.kind == "call":
+                    calls.append((name, c.dst, c.line_number))
+        cycles.append(Cycle(component, bool(calls), sorted(calls)))
+    return sorted(cycles)
+
+
+def Analyze(call_graph):
+    successors = _Successors(call_graph)
+    components = StronglyConnectedComponents(call_graph, successors)
+    reachable = Reachable(call_graph)
+    unreachable = Unreachable(call_graph, reachable)
+    cycles = Cycles(call_graph, components, successors)
+    logger.info("%d components, %d unreachable nodes, %d cycles (%d recursive)", len(components), len(unreachable),
+                len(cycles), sum(1 for cycle in cycles if cycle.recursive))
+    return Analysis(components, reachable, unreachable, cycles)
+
+
+def ToDict(call_graph, analysis):
+    return collections.OrderedDict([
+        ("nodes", len(call_graph.nodes)),
+        ("components", len(analysis.components)),
+        ("first_node", call_graph.first_node.name if call_graph.first_node is not None else None),
+        ("reachable", sorted(analysis.reachable)),
+        ("unreachable", [collections.OrderedDict([("name", node.name), ("line_number", node.line_number)])
+                         for node in analysis.unreachable]),
+        ("cycles", [collections.OrderedDict([
+            ("nodes", cycle.nodes),
+            ("recursive", cycle.recursive),
+            ("calls", [collections.OrderedDict([("src", src), ("dst", dst),
+                                                ("line_number", None if line_number == core.NO_LINE_NUMBER else line_number)])
+                       for src, dst, line_number in cycle.calls]),
+        ]) for cycle in analysis.cycles]),
+    ])
+
+
+def ToJson(call_graph, analysis):
+    return json.dumps(ToDict(call_graph, analysis), indent=2)
@@ -0,0 +1,160 @@
+# Library API: builds call graphs from paths, strings or bytes and renders
+# them to strings, with the same behavior as the command line but without
+# parsing arguments, opening the standard streams or catching exceptions.
+#
+# Options are immutable namedtuples which can be created once and reused
+# across calls, overriding single fields with keyword arguments. Nothing is
+# shared between calls, so the functions can be called from many threads at
+# once. Diagnostics go to the "callgraph" logger, which is left unconfigured.
+
+import collections
+import io
+import os
+
+from . import cache
+from . import core
+from . import parallel
+from . import project
+from . import reader
+from . import render
+from .profiling import NULL_PROFILER
+
+# Options of Build. encoding is used for paths and bytes (the encoding of
+# the system if None); use_mmap (see reader.MappedFile), jobs (more than 1
+# parses large scripts in parallel shards, or the called scripts in parallel
+# with follow_calls) and follow_calls (see project.ProjectGraph, with
+# search_path) only apply to paths; cache_dir, if set, is the directory of a
+# cache.ParseCache used for paths and bytes.
+BuildOptions = collections.namedtuple("BuildOptions", ["encoding", "use_mmap", "jobs", "cache_dir", "cache_max_size",
+                                                       "follow_calls", "search_path"],
+                                      defaults=[None, False, 1, None, cache.DEFAULT_MAX_SIZE, False, ()])
+
+# Options of Render: the output format (one of render.FORMATS) and the
+# arguments of render.GenerateDot. nodes_to_hide are matched
+# case-insensitively, like labels.
+RenderOptions = collections.namedtuple("RenderOptions", ["output_format", "show_all_calls", "show_node_stats",
+                                                         "nodes_to_hide", "represent_node_size", "min_node_size",
+                                                         "max_node_size", "font_scale_factor"],
+                                       defaults=[render.DEFAULT_FORMAT, True, False, (), False, 3, 7, 7])
+
+DEFAULT_BUILD_OPTIONS = BuildOptions()
+DEFAULT_RENDER_OPTIONS = RenderOptions()
+
+
+def _Options(options, default, overrides):
+    if options is None:
+        options = default
+    if overrides:
+        # Unknown fields are reported like unknown arguments of a function.
+        unknown = set(overrides) - set(options._fields)
+        if unknown:
+            raise TypeError("unexpected options: {}".format(", ".join(sorted(unknown))))
+        options = options._replace(**overrides)
+    return options
+
+
+# Builds the call graph of source, which can be:
+#  - a path (str or os.PathLike), like for open(). The content of a script
+#    as a str must be passed to BuildText instead;
+#  - the content of a script, as bytes (decoded with options.encoding);
+#  - an open text-mode file object, or any iterable of lines.
+# options is a BuildOptions, whose fields can be overridden by keyword
+# arguments. Errors are raised: OSError if the file cannot be read,
+# ValueError for invalid options.
+def Build(source, options=None, profiler=NULL_PROFILER, **overrides):
+    options = _Options(options, DEFAULT_BUILD_OPTIONS, overrides)
+    if isinstance(source, (str, os.PathLike)):
+        return BuildFile(source, options, profiler)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return BuildText(source, options, profiler)
+    if options.follow_calls:
+        raise ValueError("follow_calls requires a path")
+    return core.CallGraph.Build(source, profiler=profiler)
+
+
+# Builds the call graph of the script at path. See Build.
+def BuildFile(path, options=None, profiler=NULL_PROFILER, **overrides):
+    options = _Options(options, DEFAULT_BUILD_OPTIONS, overrides)
+    path = os.fspath(path)
+    if options.jobs < 1:
+        raise ValueError("jobs should be at least 1")
+    if options.encoding is not None:
+        reader.CheckEncoding(options.encoding)
+
+    if options.follow_calls:
+        with profiler.Phase("build_project") as phase:
+            project_graph = project.ProjectGraph.Build(path, options.search_path, jobs=options.jobs,
+                                                       cache_dir=options.cache_dir,
+                                                       cache_max_size=options.cache_max_size,
+                                                       encoding=options.encoding, use_mmap=options.use_mmap)
+            call_graph = project_graph.Link()
+            phase["nodes"] = len(call_graph.nodes)
+        return call_graph
+
+    if options.cache_dir is not None:
+        with profiler.Phase("build_cached") as phase:
+            call_graph = cache.ParseCache(options.cache_dir, options.cache_max_size).BuildFile(path, options.encoding)
+            phase["nodes"] = len(call_graph.nodes)
+        return call_graph
+
+    if options.jobs > 1:
+        return parallel.BuildParallel(path, options.jobs, options.encoding, profiler=profiler)
+
+    with reader.OpenInput(path, options.encoding, options.use_mmap) as input_file:
+        return core.CallGraph.Build(input_file, profiler=profiler)
+
+
+# Builds the call graph of a script whose content is text (str, or bytes
+# decoded with options.encoding). See Build.
+def BuildText(text, options=None, profiler=NULL_PROFILER, **overrides):
+    options = _Options(options, DEFAULT_BUILD_OPTIONS, overrides)
+    if options.follow_calls:
+        raise ValueError("follow_calls requires a path")
+
+    if isinstance(text, str):
+        # Universal newlines, like a text-mode file.
+        return core.CallGraph.Build(io.StringIO(text, newline=None), profiler=profiler)
+
+    data = bytes(text)
+    if options.cache_dir is not None:
+        with profiler.Phase("build_cached") as phase:
+            call_graph = cache.ParseCache(options.cache_dir, options.cache_max_size).BuildData(data, options.encoding)
+            phase["nodes"] = len(call_graph.nodes)
+        return call_graph
+    return core.CallGraph.Build(reader.IterDecodedLines(data, options.encoding), profiler=profiler)
+
+
+# Returns the output format and the arguments of its generate function
+# (see render.FORMATS) for options, a RenderOptions.
+def _RenderArguments(options, analysis=None):
+    if options.min_node_size > options.max_node_size:
+        raise ValueError("min_node_size should be less than max_node_size")
+    if options.font_scale_factor < 0:
+        raise ValueError("font_scale_factor should be greater than zero")
+    if analysis is not None and options.output_format != "dot":
+        raise ValueError("analysis can only be rendered in the dot format")
+    render.GetFormat(options.output_format)
+
+    render_options = options._asdict()
+    output_format = render_options.pop("output_format")
+    nodes_to_hide = render_options["nodes_to_hide"]
+    render_options["nodes_to_hide"] = set(name.lower() for name in nodes_to_hide) if nodes_to_hide else None
+    if analysis is not None:
+        render_options["analysis"] = analysis
+    return output_format, render_options
+
+
+# Renders call_graph with options (a RenderOptions, whose fields can be
+# overridden by keyword arguments). The output is written to out_file if
+# set, otherwise it is returned as a string. analysis (see
+# analysis.Analyze) is highlighted in the DOT format.
+def Render(call_graph, options=None, out_file=None, analysis=None, **overrides):
+    options = _Options(options, DEFAULT_RENDER_OPTIONS, overrides)
+    output_format, render_options = _RenderArguments(options, analysis)
+
+    if out_file is not None:
+        render.Render(call_graph, out_file, output_format, **render_options)
+        return None
+    output = io.StringIO()
+    render.Render(call_graph, output, output_format, **render_options)
+    return output.getvalue()
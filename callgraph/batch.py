@@ -0,0 +1,299 @@
+# Batch mode: analyzes whole directory trees of CMD / batch files, fanning
+# the work out across a pool of worker processes.
+
+from __future__ import print_function
+
+import collections
+import concurrent.futures
+import glob
+import logging
+import os
+import shutil
+import time
+
+from . import cache
+from . import core
+from . import dedup
+from . import reader
+from . import render
+
+logger = logging.getLogger(__name__)
+
+# File name patterns picked up when walking a directory.
+DEFAULT_EXTENSIONS = (".cmd", ".bat")
+
+# Upper bound on the number of files sent to a worker in a single round trip.
+# Most batch files are small, so amortizing the IPC overhead matters more
+# than perfect load balancing.
+MAX_CHUNK_SIZE = 64
+
+# Outcome of processing a single input file. error is None on success.
+# cache_hit is None if no cache is used. duplicate_of is the path of the
+# identical input whose output was copied, if any. elapsed is the time spent
+# building and rendering the file, reused_lines the number of lines whose
+# tokenization was reused (see dedup.BlockTable), and saved an estimate of
+# the time saved by the deduplication, in seconds, net of the time spent
+# hashing the blocks (so it may be negative).
+BatchResult = collections.namedtuple("BatchResult", ["path", "output", "lines", "nodes", "error", "cache_hit",
+                                                     "duplicate_of", "elapsed", "reused_lines", "saved"],
+                                     defaults=[None, 0.0, 0, 0.0])
+
+# Aggregated outcome of a batch run. hash_time is the time spent hashing the
+# inputs to find the identical ones, in seconds.
+BatchSummary = collections.namedtuple("BatchSummary", ["results", "elapsed", "hash_time"], defaults=[0.0])
+
+
+def _HasMagic(pattern):
+    return any(c in pattern for c in "*?[")
+
+
+# Returns the leading part of a glob pattern that contains no wildcards, which
+# is used as the root when computing output paths.
+def _GlobRoot(pattern):
+    parts = []
+    for part in pattern.replace("\\", "/").split("/"):
+        if _HasMagic(part):
+            break
+        parts.append(part)
+    return "/".join(parts) or "."
+
+
+# Expands the given list of files, directories and glob patterns into a
+# sorted list of (path, relative_path) tuples. relative_path is used to mirror
+# the input tree under the output directory.
+def FindInputs(inputs, extensions=DEFAULT_EXTENSIONS):
+    found = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(extensions):
+                        path = os.path.join(root, name)
+                        found.append((path, os.path.relpath(path, item)))
+        elif _HasMagic(item):
+            root = _GlobRoot(item)
+            for path in sorted(glob.glob(item, recursive=True)):
+                if os.path.isfile(path):
+                    found.append((path, os.path.relpath(path, root)))
+        else:
+            found.append((item, os.path.basename(item)))
+    return found
+
+
+# Returns found (see FindInputs) with the relative paths made unique: inputs
+# given separately (e.g., a/x.cmd and b/x.cmd, or two directories with the
+# same layout) may have the same relative path, and would overwrite each
+# other's output. The first one keeps it; the others get a "-2", "-3", ...
+# suffix before their extension.
+def _UniqueRelativePaths(found):
+    used = set(os.path.normcase(relative_path) for _, relative_path in found)
+    seen = set()
+    unique = []
+    for path, relative_path in found:
+        key = os.path.normcase(relative_path)
+        if key in seen:
+            base, extension = os.path.splitext(relative_path)
+            counter = 2
+            while os.path.normcase("{}-{}{}".format(base, counter, extension)) in used:
+                counter += 1
+            unique_path = "{}-{}{}".format(base, counter, extension)
+            logger.warning("%s has the same relative path as another input (%s), using %s instead",
+                           path, relative_path, unique_path)
+            relative_path = unique_path
+            key = os.path.normcase(relative_path)
+            used.add(key)
+        seen.add(key)
+        unique.append((path, relative_path))
+    return unique
+
+
+# Builds the call graph for a single file and renders it to output_path.
+# Runs in the worker processes, so it must never raise: failures are reported
+# through the error field of the result.
+def _ProcessFile(task):
+    path, output_path, output_format, render_options, cache_options, read_options, use_dedup = task
+    encoding, use_mmap = read_options
+    cache_hit = None
+    reused_lines = 0
+    saved = 0.0
+    start = time.perf_counter()
+    try:
+        build = core.CallGraph.Build
+        if use_dedup:
+            block_table = dedup.GetProcessTable()
+            build = block_table.Build
+            reused_lines = block_table.reused_lines
+            saved = block_table.SavedTime()
+
+        if cache_options is not None:
+            # The cache reads the whole file to hash it, so use_mmap does not
+            # apply; the call graphs not found are built with build.
+            parse_cache = cache.GetProcessCache(*cache_options)
+            hits = parse_cache.hits
+            call_graph = parse_cache.BuildFile(path, encoding, build)
+            cache_hit = parse_cache.hits > hits
+        else:
+            with reader.OpenInput(path, encoding, use_mmap) as input_file:
+                call_graph = build(input_file)
+
+        if use_dedup:
+            reused_lines = block_table.reused_lines - reused_lines
+            saved = block_table.SavedTime() - saved
+
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        with open(output_path, "w") as output_file:
+            render.Render(call_graph, output_file, output_format, **render_options)
+
+        lines = sum(node.loc for node in call_graph.nodes.values())
+        return BatchResult(path, output_path, lines, len(call_graph.nodes), None, cache_hit,
+                           elapsed=time.perf_counter() - start, reused_lines=reused_lines, saved=saved)
+    except Exception as e:
+        return BatchResult(path, output_path, 0, 0, "{}: {}".format(type(e).__name__, e), cache_hit,
+                           elapsed=time.perf_counter() - start)
+
+
+# Returns the result of the input at path, identical to the one of result,
+# copying its output to output_path.
+def _ReuseResult(result, path, output_path):
+    if result.error is not None:
+        return BatchResult(path, output_path, 0, 0, result.error, None, result.path)
+    try:
+        if os.path.abspath(output_path) != os.path.abspath(result.output):
+            output_dir = os.path.dirname(output_path)
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+            shutil.copyfile(result.output, output_path)
+    except OSError as e:
+        return BatchResult(path, output_path, 0, 0, "{}: {}".format(type(e).__name__, e), None, result.path)
+    return BatchResult(path, output_path, result.lines, result.nodes, None, None, result.path,
+                       reused_lines=result.lines, saved=result.elapsed)
+
+
+# Returns the size of the file at path, or None if it cannot be read.
+def _FileSize(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+
+# Returns the content hash of the file at path, or None if it cannot be read
+# or the encoding is not supported. Either way the error is reported when
+# processing the file; until then it is simply not deduplicated, which only
+# costs the time of processing it (an unknown encoding makes it fail anyway).
+def _FileKey(path, encoding):
+    try:
+        with open(path, "rb") as f:
+            return cache.ParseCache.Key(f.read(), encoding)
+    except (OSError, LookupError, ValueError):
+        return None
+
+
+# Analyzes all the files matched by inputs (files, directories or glob
+# patterns), writing one file per input under output_dir, in output_format
+# (see render.FORMATS). Inputs with the same path relative to their root get
+# distinct output files (see _UniqueRelativePaths).
+# jobs is the number of worker processes (None means one per CPU, 1 means
+# processing everything in the current process). render_options are passed
+# as-is to render.Render. If cache_dir is set, call graphs are looked up in
+# and stored to a cache.ParseCache in that directory, shared by all workers.
+# Inputs are decoded with encoding (see reader.OpenInput, which also
+# describes use_mmap; it is ignored with a cache). A failure in one file does not abort the run; on_result, if set, is called
+# with each BatchResult as soon as it is available.
+# If use_dedup is set, inputs with the same content are only processed once,
+# the output of the first one being copied for the others (their results
+# follow its result), and identical blocks are only tokenized once by each
+# worker (see dedup.BlockTable). Only the inputs with the same size as another
+# one are read and hashed beforehand, so that a corpus without copies does
+# not wait for all of its files to be hashed before the workers start.
+# Deduplication is off by default: on a corpus without copies or shared
+# blocks, the hashing makes the run slower (see benchmarks/dedup.py).
+def RunBatch(inputs, output_dir, jobs=None, render_options=None, on_result=None,
+             cache_dir=None, cache_max_size=cache.DEFAULT_MAX_SIZE, output_format=render.DEFAULT_FORMAT,
+             encoding=None, use_mmap=False, use_dedup=False):
+    extension = render.GetFormat(output_format).extension
+    if render_options is None:
+        render_options = {}
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+
+    cache_options = None
+    if cache_dir is not None:
+        cache_options = (cache_dir, cache_max_size)
+
+    start = time.perf_counter()
+    tasks = []
+    # Inputs identical to the one of tasks[i], by i.
+    duplicates = collections.defaultdict(list)
+    first_tasks = {}
+    found = _UniqueRelativePaths(FindInputs(inputs))
+    sizes = [_FileSize(path) for path, _ in found] if use_dedup else [None] * len(found)
+    size_counts = collections.Counter(sizes)
+    hash_time = 0.0
+    for (path, relative_path), size in zip(found, sizes):
+        output_path = os.path.join(output_dir, relative_path + extension)
+        key = None
+        if size is not None and size_counts[size] > 1:
+            hash_start = time.perf_counter()
+            key = _FileKey(path, encoding)
+            hash_time += time.perf_counter() - hash_start
+        if key is not None and key in first_tasks:
+            duplicates[first_tasks[key]].append((path, output_path))
+            continue
+        if key is not None:
+            first_tasks[key] = len(tasks)
+        tasks.append((path, output_path, output_format, render_options, cache_options, (encoding, use_mmap),
+                      use_dedup))
+
+    results = []
+
+    if jobs <= 1 or len(tasks) <= 1:
+        # Like the table of a new worker process, and so that the statistics
+        # only cover this run.
+        dedup.ResetProcessTable()
+        result_iterator = map(_ProcessFile, tasks)
+        executor = None
+    else:
+        chunk_size = max(1, min(MAX_CHUNK_SIZE, len(tasks) // (jobs * 4)))
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+        result_iterator = executor.map(_ProcessFile, tasks, chunksize=chunk_size)
+
+    try:
+        for index, result in enumerate(result_iterator):
+            results.append(result)
+            if on_result:
+                on_result(result)
+            for path, output_path in duplicates.get(index, ()):
+                results.append(_ReuseResult(result, path, output_path))
+                if on_result:
+                    on_result(results[-1])
+    finally:
+        if executor:
+            executor.shutdown()
+
+    return BatchSummary(results, time.perf_counter() - start, hash_time)
+
+
+def FormatSummary(summary):
+    files = len(summary.results)
+    failures = sum(1 for r in summary.results if r.error is not None)
+    lines = sum(r.lines for r in summary.results)
+    elapsed = max(summary.elapsed, 1e-9)
+    text = "Processed {} files ({} failed), {} lines in {:.2f}s: {:.1f} files/s, {:.0f} lines/s".format(
+        files, failures, lines, summary.elapsed, files / elapsed, lines / elapsed)
+
+    cache_results = [r.cache_hit for r in summary.results if r.cache_hit is not None]
+    if cache_results:
+        hits = sum(1 for hit in cache_results if hit)
+        text += "; cache: {} hits, {} misses".format(hits, len(cache_results) - hits)
+
+    duplicates = sum(1 for r in summary.results if r.duplicate_of is not None)
+    reused_lines = sum(r.reused_lines for r in summary.results)
+    if duplicates or reused_lines:
+        saved = sum(r.saved for r in summary.results) - summary.hash_time
+        text += "; dedup: {} identical files, {} of {} lines reused ({:.1%}), about {:.2f}s saved net of hashing".format(
+            duplicates, reused_lines, lines, reused_lines / max(lines, 1), saved)
+    return text
@@ -0,0 +1,183 @@
+# Persistent on-disk cache of the call graphs built by CallGraph.Build.
+#
+# Entries are keyed on a hash of the content of the input file and of the
+# version of the tool, so unchanged inputs skip parsing entirely. The cache
+# directory is bounded in size: when it grows too large, the least recently
+# used entries (by modification time, which is refreshed on every hit) are
+# evicted.
+#
+# Several processes can share the same cache directory: entries are written
+# to a temporary file and atomically renamed, and entries which disappear or
+# cannot be read (e.g., evicted by another process) are simply treated as
+# misses. Entries are pickled, so the cache directory must not be writable by
+# untrusted users.
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+from . import __version__
+from . import core
+from . import reader
+
+logger = logging.getLogger(__name__)
+
+# Bump when the pickled representation of CallGraph changes in a way which
+# is not reflected by __version__.
+CACHE_FORMAT = 4
+
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+
+# After an eviction, the cache is shrunk to this fraction of its maximum
+# size, so that evictions (which scan the whole directory) are infrequent.
+EVICTION_LOW_WATERMARK = 0.9
+
+_SUFFIX = ".pickle"
+
+# Caches used by the current process, by (directory, max_size).
+_process_caches = {}
+
+
+class ParseCache:
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Estimate of the size of the cache directory, computed lazily. It
+        # only accounts for the writes of this process, and it is refreshed
+        # every time the directory is scanned.
+        self._size = None
+        os.makedirs(directory, exist_ok=True)
+
+    # Returns the key of an input file with content data, decoded with
+    # encoding (the default encoding if None). The key depends on the
+    # resolved encoding, so that entries are not shared by processes with
+    # different default encodings.
+    @staticmethod
+    def Key(data, encoding=None):
+        digest = hashlib.sha256()
+        digest.update("{}/{}\0".format(__version__, CACHE_FORMAT).encode("ascii"))
+        digest.update("{}\0".format(reader.CheckEncoding(encoding)).encode("ascii"))
+        digest.update(data)
+        return digest.hexdigest()
+
+    def _Path(self, key):
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    # Returns the call graph stored for key, or None.
+    def Get(self, key):
+        path = self._Path(key)
+        try:
+            with open(path, "rb") as f:
+                call_graph = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError) as e:
+            logger.warning("Ignoring unreadable cache entry %s: %s", path, e)
+            self.misses += 1
+            return None
+
+        # Mark the entry as recently used.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return call_graph
+
+    def Put(self, key, call_graph):
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(call_graph, f, protocol=pickle.HIGHEST_PROTOCOL)
+                size = f.tell()
+            os.replace(temp_path, self._Path(key))
+        except OSError as e:
+            # E.g., on Windows the entry may be in use by another process,
+            # which is writing the very same content.
+            logger.debug("Could not write cache entry %s: %s", key, e)
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return
+
+        if self._size is None:
+            self._size = self._ScanSize()
+        else:
+            self._size += size
+        if self._size > self.max_size:
+            self.Evict()
+
+    def _Entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(_SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _ScanSize(self):
+        return sum(size for _, size, _ in self._Entries())
+
+    # Removes the least recently used entries until the cache is below its
+    # low watermark.
+    def Evict(self):
+        entries = sorted(self._Entries())
+        size = sum(size for _, size, _ in entries)
+        target = self.max_size * EVICTION_LOW_WATERMARK
+        for _, entry_size, path in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except OSError:
+                # Already evicted by another process, or in use.
+                pass
+            size -= entry_size
+        self._size = size
+
+    # Builds the call graph of the file at path, decoded with encoding,
+    # going through the cache.
+    def BuildFile(self, path, encoding=None, build=None):
+        with open(path, "rb") as f:
+            data = f.read()
+        return self.BuildData(data, encoding, build)
+
+    # Builds the call graph of a script with content data (bytes), decoded
+    # with encoding, going through the cache. On a miss, the call graph is
+    # built by calling build (by default, core.CallGraph.Build) with the
+    # lines, e.g. to use dedup.BlockTable.Build.
+    def BuildData(self, data, encoding=None, build=None):
+        key = self.Key(data, encoding)
+        call_graph = self.Get(key)
+        if call_graph is None:
+            # Decode the same way open(path, "r", encoding=encoding) would.
+            if build is None:
+                build = core.CallGraph.Build
+            call_graph = build(reader.IterDecodedLines(data, encoding))
+            self.Put(key, call_graph)
+        return call_graph
+
+    def Stats(self):
+        return dict(hits=self.hits, misses=self.misses, evictions=self.evictions)
+
+
+# Returns a ParseCache for directory, reusing the instance already created by
+# the current process if any. Meant for worker processes, which handle many
+# files each.
+def GetProcessCache(directory, max_size=DEFAULT_MAX_SIZE):
+    key = (directory, max_size)
+    if key not in _process_caches:
+        _process_caches[key] = ParseCache(directory, max_size)
+    return _process_caches[key]
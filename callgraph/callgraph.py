@@ -3,23 +3,50 @@
 from __future__ import print_function
 
 import argparse
-import io
+import logging
 import os
 import sys
 
+from . import analysis
+from . import batch
+from . import cache
 from . import core
+from . import diff
+from . import lazy
+from . import log
+from . import parallel
+from . import profiling
+from . import project
+from . import reader
 from . import render
+from . import server
+from . import watch
 from . import __version__
 
+logger = logging.getLogger(__name__)
+
 DEFAULT_MIN_NODE_SIZE = 3
 DEFAULT_MAX_NODE_SIZE = 7
 DEFAULT_FONT_SCALE_FACTOR = 7
+DEFAULT_CACHE_MAX_SIZE_MB = cache.DEFAULT_MAX_SIZE // (1024 * 1024)
+DEFAULT_FOCUS_DEPTH = 1
+
+SUBCOMMANDS = {
+    "diff": diff.main,
+    "serve": server.main,
+}
 
 def main():
+    # Subcommands have their own options. An input file with the same name as
+    # a subcommand can still be passed as e.g. ./serve.
+    if len(sys.argv) > 1 and sys.argv[1] in SUBCOMMANDS:
+        SUBCOMMANDS[sys.argv[1]](sys.argv[2:])
+        return
+
     parser = argparse.ArgumentParser()
     parser.add_argument("--version", action="version", version=f"%(prog)s {__version__}")
-    parser.add_argument("input", help="Input cmd file.",
-                        type=str)
+    parser.add_argument("input", help="Input cmd file. In batch mode (--output-dir), any number of files, "
+                        "directories or glob patterns.", type=str, nargs="+")
     parser.add_argument("--simplify-calls",
                         help="Only show one edge for each type of call.",
                         dest="simplifycalls", action="store_true")
@@ -31,10 +58,24 @@ def main():
                         action="store_true", dest="nodesize")
     parser.add_argument("--nodes-to-hide", type=str, nargs="+", dest="nodestohide",
                         help="List of space-separated nodes to hide.")
-    parser.add_argument("-v", "--verbose", action="store_true", dest="verbose",
-                        help="Output extra information about what the program does.")
-    parser.add_argument("-o", "--output", help="Output file. If it's not set, stdout is used.",
+    parser.add_argument("--focus", help="Only output the neighborhood of this label (see --depth and --direction). "
+                        "Can be repeated.", type=str, dest="focus", action="append")
+    parser.add_argument("--depth", help="Maximum distance from the --focus labels of the nodes to output.",
+                        type=int, dest="depth", default=DEFAULT_FOCUS_DEPTH)
+    parser.add_argument("--direction", help="Connections followed from the --focus labels: towards their callers, "
+                        "their callees or both.", choices=core.NEIGHBORHOOD_DIRECTIONS, default="both",
+                        dest="direction")
+    parser.add_argument("--analyze", help="Analyze the structure of the graph (components, unreachable blocks, "
+                        "loops and recursion): output the results as JSON, or highlight them in the DOT output.",
+                        choices=["json", "dot"], dest="analyze")
+    parser.add_argument("-v", "--verbose", action="count", dest="verbose", default=0,
+                        help="Output extra information about what the program does. "
+                        "Repeat for more detail (-v: info, -vv: debug, -vvv: trace).")
+    parser.add_argument("-o", "--output", help="Output file. If it's not set, stdout is used. "
+                        "If its name ends with .gz, the output is compressed with gzip.",
                         type=str)
+    parser.add_argument("--format", help="Output format.", choices=list(render.FORMATS),
+                        default=render.DEFAULT_FORMAT, dest="format")
     parser.add_argument("-l", "--log-file", help="Log file. If it's not set, stderr is used.",
                         type=str, dest="logfile")
     parser.add_argument("--min-node-size", help="Set minimum rendered node size.", 
@@ -43,9 +84,80 @@ def main():
                         dest="max_node_size", action="store", type=int, default=DEFAULT_MAX_NODE_SIZE)
     parser.add_argument("--font-scale-factor", help="Set the font scale factor", 
                         dest="font_scale_factor", action="store", type=int, default=DEFAULT_FONT_SCALE_FACTOR)
+    parser.add_argument("--output-dir", help="Enable batch mode: write one output file per input under this directory.",
+                        type=str, dest="outputdir")
+    parser.add_argument("-j", "--jobs", help="Number of worker processes used in batch mode. Defaults to the number of CPUs. "
+                        "In single-file mode, a value greater than 1 parses large inputs in parallel shards.",
+                        type=int, dest="jobs", default=None)
+    parser.add_argument("--dedup", help="In batch mode, process identical inputs only once, and tokenize identical "
+                        "blocks only once per worker.", dest="dedup", action="store_true")
+
+    parser.add_argument("--cache-dir", help="Cache the parsed call graphs in this directory, so that unchanged "
+                        "inputs are not parsed again.", type=str, dest="cachedir")
+    parser.add_argument("--cache-max-size", help="Maximum size of the cache directory, in megabytes.",
+                        type=int, dest="cachemaxsize", default=DEFAULT_CACHE_MAX_SIZE_MB)
+
+    parser.add_argument("--follow-calls", help="Follow the external calls to other scripts, and output a single "
+                        "graph for all of them.", dest="followcalls", action="store_true")
+    parser.add_argument("--search-path", help="Directory where scripts called by --follow-calls are searched, after "
+                        "the directory of the calling script. Can be repeated.", type=str, dest="searchpath",
+                        action="append", default=[])
+
+    parser.add_argument("--encoding", help="Encoding of the input files, e.g. cp437 or cp1252 for scripts written "
+                        "with legacy code pages. Defaults to the encoding of the system.", type=str, dest="encoding")
+    parser.add_argument("--mmap", help="Memory-map the input files and read them as raw bytes. This is not a "
+                        "performance option: reading the lines takes 1.3 to 2 times as long as without it "
+                        "(see benchmarks/reader.py).", action="store_true", dest="mmap")
+
+    parser.add_argument("--profile", help="Report time, throughput and peak memory of each processing phase to "
+                        "the log file.", action="store_true", dest="profile")
+    parser.add_argument("--profile-format", help="Format of the --profile report.", choices=["text", "json"],
+                        default="text", dest="profileformat")
+
+    parser.add_argument("--watch", help="Keep running, and write the output again whenever the input file changes, "
+                        "parsing only the blocks which changed. Requires --output.", action="store_true", dest="watch")
+    parser.add_argument("--watch-interval", help="Interval between two checks of the input file in --watch mode, in "
+                        "seconds.", type=float, dest="watchinterval", default=watch.DEFAULT_INTERVAL)
 
     args = parser.parse_args()
 
+    if args.outputdir is None and (len(args.input) > 1 or os.path.isdir(args.input[0])):
+        parser.error("multiple inputs or directories require --output-dir")
+
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs should be at least 1")
+
+    if args.encoding is not None:
+        try:
+            reader.CheckEncoding(args.encoding)
+        except (LookupError, ValueError) as e:
+            parser.error(str(e))
+
+    if args.focus and args.outputdir is not None:
+        parser.error("--focus is not supported in batch mode")
+
+    if args.depth < 0:
+        parser.error("--depth should be at least 0")
+
+    if args.analyze and args.outputdir is not None:
+        parser.error("--analyze is not supported in batch mode")
+
+    if args.profile and args.outputdir is not None:
+        parser.error("--profile is not supported in batch mode")
+
+    if args.analyze == "dot" and args.format != "dot":
+        parser.error("--analyze dot requires --format dot")
+
+    if args.watch:
+        if args.outputdir is not None:
+            parser.error("--watch is not supported in batch mode")
+        if not args.output:
+            parser.error("--watch requires --output")
+        if args.followcalls or args.cachedir or args.profile:
+            parser.error("--watch does not support --follow-calls, --cache-dir and --profile")
+        if args.watchinterval <= 0:
+            parser.error("--watch-interval should be greater than zero")
+
     nodes_to_hide = None
     if args.nodestohide:
         nodes_to_hide = set(x.lower() for x in args.nodestohide)
@@ -58,46 +170,179 @@ def main():
             print(u"Error opening {}: {}".format(args.logfile, e), file=sys.stderr)
             sys.exit(1)
 
-    if not args.verbose:
-        log_file = io.StringIO()  # will just be ignored
+    log_handler = log.Configure(log_file, args.verbose)
+
+    if args.min_node_size > args.max_node_size:
+        print("Minimum node size should be less than maximum node size", file=sys.stderr)
+        sys.exit(1)
+
+    if args.font_scale_factor < 0:
+        print("Font scale factor should be greater than zero", file=sys.stderr)
+        sys.exit(1)
 
+    render_options = dict(show_all_calls=not args.simplifycalls, show_node_stats=not args.hidenodestats,
+                          nodes_to_hide=nodes_to_hide, represent_node_size=args.nodesize,
+                          min_node_size=args.min_node_size, max_node_size=args.max_node_size,
+                          font_scale_factor=args.font_scale_factor)
+
+    if args.outputdir is not None:
+        _RunBatch(args, render_options, log_file, log_handler)
+        return
+
+    if args.watch:
+        _RunWatch(args, render_options, log_file, log_handler)
+        return
+
+    input_path = args.input[0]
     input_file = sys.stdin
-    if args.input:
-        try:
-            input_file = open(args.input, 'r')
-        except IOError as e:
-            print(u"Error opening {}: {}".format(args.input, e), file=sys.stderr)
-            sys.exit(1)
+    parallel_parse = bool(input_path) and not args.cachedir and not args.followcalls and (args.jobs or 1) > 1
+    # With --focus, only the blocks around the focused labels are annotated.
+    lazy_build = bool(input_path) and bool(args.focus) and not args.cachedir and not args.followcalls and \
+        not parallel_parse
+    open_input = bool(input_path) and not args.cachedir and not args.followcalls and not parallel_parse and \
+        not lazy_build
+    try:
+        if open_input:
+            input_file = reader.OpenInput(input_path, args.encoding, args.mmap)
+        elif input_path:
+            # The other build modes open the input later, where errors are
+            # reported as processing errors: check that it can be read first.
+            with open(input_path, "rb"):
+                pass
+    except IOError as e:
+        print(u"Error opening {}: {}".format(input_path, e), file=sys.stderr)
+        sys.exit(1)
 
     output_file = sys.stdout
     if args.output:
         try:
-            output_file = open(args.output, 'w')
+            output_file = render.OpenOutput(args.output)
         except IOError as e:
             print(u"Error opening {}: {}".format(args.output, e), file=sys.stderr)
             sys.exit(1)
 
-    if args.min_node_size > args.max_node_size:
-        print("Minimum node size should be less than maximum node size", file=sys.stderr)
-        sys.exit(1)
-
-    if args.font_scale_factor < 0:
-        print("Font scale factor should be greater than zero", file=sys.stderr)
-        sys.exit(1)
+    profiler = profiling.Profiler() if args.profile else profiling.NULL_PROFILER
 
     try:
-        call_graph = core.CallGraph.Build(input_file, log_file=log_file)
-        render.PrintDot(call_graph, out_file=output_file, log_file=log_file, show_all_calls=not args.simplifycalls,          
-                        show_node_stats=not args.hidenodestats, nodes_to_hide=nodes_to_hide, represent_node_size=args.nodesize, 
-                        min_node_size=args.min_node_size, max_node_size=args.max_node_size, 
-                        font_scale_factor=args.font_scale_factor)
+        if args.followcalls:
+            with profiler.Phase("build_project") as phase:
+                project_graph = project.ProjectGraph.Build(input_path, args.searchpath, jobs=args.jobs or 1,
+                                                           cache_dir=args.cachedir,
+                                                           cache_max_size=args.cachemaxsize * 1024 * 1024,
+                                                           encoding=args.encoding, use_mmap=args.mmap)
+                for path, node, line_number, target in project_graph.unresolved:
+                    logger.info("Unresolved external call to %s in %s (line %d)", target, path, line_number)
+                call_graph = project_graph.Link()
+                phase["nodes"] = len(call_graph.nodes)
+        elif args.cachedir:
+            with profiler.Phase("build_cached") as phase:
+                parse_cache = cache.ParseCache(args.cachedir, args.cachemaxsize * 1024 * 1024)
+                call_graph = parse_cache.BuildFile(input_path, args.encoding)
+                phase["nodes"] = len(call_graph.nodes)
+            logger.info("Cache: %(hits)d hits, %(misses)d misses, %(evictions)d evictions", parse_cache.Stats())
+        elif parallel_parse:
+            call_graph = parallel.BuildParallel(input_path, args.jobs, args.encoding, profiler=profiler)
+        elif lazy_build:
+            call_graph = lazy.LazyCallGraph.FromFile(input_path, args.encoding, profiler)
+        else:
+            call_graph = core.CallGraph.Build(input_file, profiler=profiler)
+
+        _WriteOutput(args, call_graph, output_file, render_options, profiler)
+        if lazy_build:
+            logger.info("Annotated %d of %d blocks", *call_graph.AnnotatedBlocks())
+
+        if args.profile:
+            report = profiler.ToJson() if args.profileformat == "json" else profiler.Report()
+            print(report, file=log_file)
     except Exception as e:
         print(u"Error processing the call graph: {}".format(e))
 
     finally:
-        if args.input:
+        if args.profile:
+            profiler.Close()
+        if open_input:
             input_file.close()
         if args.output:
             output_file.close()
+        log.Unconfigure(log_handler)
+        if args.logfile:
+            log_file.close()
+
+
+# Writes call_graph to output_file, applying the --focus and --analyze
+# options.
+def _WriteOutput(args, call_graph, output_file, render_options, profiler=profiling.NULL_PROFILER):
+    if args.focus:
+        with profiler.Phase("focus") as phase:
+            call_graph = call_graph.Neighborhood(args.focus, args.depth, args.direction)
+            phase["nodes"] = len(call_graph.nodes)
+
+    graph_analysis = None
+    if args.analyze:
+        with profiler.Phase("analyze") as phase:
+            graph_analysis = analysis.Analyze(call_graph)
+            phase["nodes"] = len(call_graph.nodes)
+
+    with profiler.Phase("render") as phase:
+        if args.analyze == "json":
+            print(analysis.ToJson(call_graph, graph_analysis), file=output_file)
+        elif args.analyze == "dot":
+            render.PrintDot(call_graph, out_file=output_file, analysis=graph_analysis, **render_options)
+        else:
+            render.Render(call_graph, output_file, args.format, **render_options)
+        phase["nodes"] = len(call_graph.nodes)
+
+
+# Watch mode: writes the output again whenever the input file changes (see
+# watch.py), until interrupted.
+def _RunWatch(args, render_options, log_file, log_handler):
+    def WriteOutput(call_graph):
+        try:
+            output_file = render.OpenOutput(args.output)
+        except IOError as e:
+            print(u"Error opening {}: {}".format(args.output, e), file=sys.stderr)
+            return
+        try:
+            _WriteOutput(args, call_graph, output_file, render_options)
+        except Exception as e:
+            print(u"Error processing the call graph: {}".format(e), file=sys.stderr)
+        finally:
+            output_file.close()
+        logger.info("Wrote %s (%d nodes)", args.output, len(call_graph.nodes))
+
+    try:
+        watch.Watch(args.input[0], WriteOutput, args.encoding, args.watchinterval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log.Unconfigure(log_handler)
         if args.logfile:
             log_file.close()
+
+
+# Batch mode: processes every input file in a pool of worker processes,
+# reporting failures as they happen and a throughput summary at the end.
+def _RunBatch(args, render_options, log_file, log_handler):
+    def ReportResult(result):
+        if result.error is not None:
+            print(u"Error processing {}: {}".format(result.path, result.error), file=sys.stderr)
+        else:
+            if result.duplicate_of is not None:
+                logger.info("Wrote %s (identical to %s)", result.output, result.duplicate_of)
+            else:
+                logger.info("Wrote %s (%d lines, %d nodes)", result.output, result.lines, result.nodes)
+
+    try:
+        summary = batch.RunBatch(args.input, args.outputdir, jobs=args.jobs,
+                                 render_options=render_options, on_result=ReportResult,
+                                 cache_dir=args.cachedir, cache_max_size=args.cachemaxsize * 1024 * 1024,
+                                 output_format=args.format, encoding=args.encoding, use_mmap=args.mmap,
+                                 use_dedup=args.dedup)
+    finally:
+        log.Unconfigure(log_handler)
+        if args.logfile:
+            log_file.close()
+
+    print(batch.FormatSummary(summary), file=sys.stderr)
+    if any(r.error is not None for r in summary.results):
+        sys.exit(1)
@@ -1,28 +1,120 @@
 from __future__ import print_function
 
 import collections
-import itertools
+import logging
 import sys
 
+from .log import TRACE
+from .profiling import NULL_PROFILER
+from .tokenizer import Command, MakeCommand, Tokenize
+
+logger = logging.getLogger(__name__)
+
 NO_LINE_NUMBER = -1
 
-Command = collections.namedtuple("Command", ["command", "target"])
+# Directions in which CallGraph.Neighborhood follows the connections:
+# towards the nodes connecting to the selected ones, the nodes they connect
+# to, or both.
+NEIGHBORHOOD_DIRECTIONS = ("callers", "callees", "both")
+
+# Returns the (original name, lowercase name) of the label defined by line,
+# which must be stripped and start with ":" but not with "::".
+def ParseLabel(line):
+    # In the off chance that there are multiple words,
+    # cmd considers the first word the label name.
+    original_block_name = line[1:].split()[0].strip()
+
+    # Since cmd is case-insensitive, let's convert block names to
+    # lowercase.
+    return original_block_name, original_block_name.lower()
+
+
+# Returns True if a line with commands (a sequence of Command) terminates the
+# execution of its block: "goto :eof" or exit.
+def IsTerminating(commands):
+    for command, target in commands:
+        if (command == "goto" and target == "eof") or command == "exit":
+            return True
+    return False
+
+
+# Tokenizes lines (an iterable of str) without building a graph, returning
+# the (texts, noops, terminating, commands, labels) arguments of
+# CallGraph._AppendLines for them.
+def TokenizeLines(lines):
+    texts = []
+    noops = []
+    terminating = []
+    commands = {}
+    labels = []
+    for index, line in enumerate(lines):
+        line = line.strip()
+        if line.startswith(":") and not line.startswith("::"):
+            original_block_name, block_name = ParseLabel(line)
+            if block_name:
+                labels.append((index, original_block_name, block_name))
+
+        text = line.lower()
+        noop, line_commands = Tokenize(text)
+        texts.append(text)
+        noops.append(noop)
+        if line_commands:
+            commands[index] = line_commands
+            terminating.append(IsTerminating(line_commands))
+        else:
+            terminating.append(False)
+    return texts, noops, terminating, commands, labels
+
+
+# Returns the CodeLine objects of lines tokenized by TokenizeLines, numbered
+# from first_line_number.
+def MakeCodeLines(first_line_number, texts, noops, terminating, commands):
+    code_lines = list(map(CodeLine, range(first_line_number, first_line_number + len(texts)), texts,
+                          terminating, noops))
+    for index, line_commands in commands.items():
+        code_lines[index].commands = tuple(MakeCommand(command, target) for command, target in line_commands)
+    return code_lines
+
+
+# Returns True if the execution flows from the end of code (a list of
+# CodeLine) into the next block, i.e. if its last line which is not a
+# comment or empty contains neither a goto nor an exit, or if there is no
+# such line.
+def FallsThrough(code):
+    for line in reversed(code):
+        if line.noop:
+            continue
+        commands = set(c.command for c in line.commands)
+        return "exit" not in commands and "goto" not in commands
+    return True
+
 
 # Line of code. Not a namedtuple because we need mutability.
+#
+# Scripts can have millions of lines, so lines are kept as small as possible:
+# attributes are stored in slots, and commands in a tuple which is shared
+# (empty) by the vast majority of lines, which contain no commands at all.
+# The command counter is only created when asked for.
+# The target is to retain at most 200 bytes per line of typical length,
+# text included (see benchmarks/memory.py).
 
 
 class CodeLine:
+    __slots__ = ("number", "text", "terminating", "noop", "commands")
+
     def __init__(self, number, text, terminating=False, noop=False):
         self.number = number
         self.text = text
         self.terminating = terminating
         self.noop = noop
-        self.commands = []
-        self.commands_counter = collections.Counter()
+        self.commands = ()
 
     def AddCommand(self, command):
-        self.commands.append(command)
-        self.commands_counter[command.command] += 1
+        self.commands += (command,)
+
+    @property
+    def commands_counter(self):
+        return collections.Counter(command.command for command in self.commands)
 
     def __repr__(self):
         return "[{0} (terminating: {1}, noop: {2}, commands: {3})] {4}".format(self.number, self.terminating, self.noop, self.commands, self.text)
@@ -35,10 +127,63 @@ class CodeLine:
 # line_number is the line where the call/goto happens.
 Connection = collections.namedtuple("Connection", ["dst", "kind", "line_number"])
 
+# Connection seen from its destination: src is the name of the node the
+# connection starts from.
+IncomingConnection = collections.namedtuple("IncomingConnection", ["src", "kind", "line_number"])
+
+_NO_CONNECTIONS = frozenset()
+
+
+# Summary of the commands in the code of a node, computed once when the node
+# is annotated so that the processing steps and the renderers don't need to
+# scan the code again:
+# - command_counts: (command, count) pairs, sorted by command;
+# - has_exit: whether the node contains an exit command with no target;
+# - has_terminating: whether the node contains an exit or a "goto :eof";
+# - external_calls: (line number, target) pairs of the external calls, in
+#   order.
+class NodeSummary(collections.namedtuple("NodeSummary", ["command_counts", "has_exit", "has_terminating",
+                                                         "external_calls"])):
+    __slots__ = ()
+
+    def Count(self, command):
+        for name, count in self.command_counts:
+            if name == command:
+                return count
+        return 0
+
+    # Summarizes the given (line number, commands) pairs.
+    @staticmethod
+    def FromCommands(line_commands):
+        counts = collections.Counter()
+        has_exit = False
+        has_terminating = False
+        external_calls = []
+        for line_number, commands in line_commands:
+            for command, target in commands:
+                counts[command] += 1
+                if command == "exit":
+                    has_terminating = True
+                    if target == "":
+                        has_exit = True
+                elif command == "goto" and target == "eof":
+                    has_terminating = True
+                elif command == "external_call":
+                    external_calls.append((line_number, target))
+        if not counts:
+            return EMPTY_SUMMARY
+        return NodeSummary(tuple(sorted(counts.items())), has_exit, has_terminating, tuple(external_calls))
+
+
+EMPTY_SUMMARY = NodeSummary((), False, False, ())
+
 # Node in the call graph.
 
 
 class Node:
+    __slots__ = ("name", "connections", "line_number", "original_name", "is_exit_node",
+                 "is_last_node", "code", "loc", "node_width", "node_height", "summary")
+
     def __init__(self, name):
         self.name = name
         self.connections = set()
@@ -50,21 +195,45 @@ class Node:
         self.loc = 0
         self.node_width = 0
         self.node_height = 0
+        # NodeSummary of the code, set when the node is annotated.
+        self.summary = EMPTY_SUMMARY
 
+    # Adds a connection to this node only. Use CallGraph.AddConnection to also
+    # keep the index of incoming connections of the graph up to date.
     def AddConnection(self, dst, kind, line_number=NO_LINE_NUMBER):
-        self.connections.add(Connection(dst, kind, line_number))
+        connection = Connection(dst, kind, line_number)
+        self.connections.add(connection)
+        return connection
+
+    def RemoveConnection(self, connection):
+        self.connections.discard(connection)
+
+    # Returns the connections of the given kind. Nodes have few connections,
+    # so they are filtered rather than indexed by kind.
+    def GetConnections(self, kind):
+        return [c for c in self.connections if c.kind == kind]
+
+    # Returns a copy of this node called name (by default, the same name),
+    # without connections. The code and its summary are shared.
+    def Copy(self, name=None):
+        copy = Node(self.name if name is None else name)
+        copy.original_name = self.original_name
+        copy.line_number = self.line_number
+        copy.is_exit_node = self.is_exit_node
+        copy.is_last_node = self.is_last_node
+        copy.code = self.code
+        copy.loc = self.loc
+        copy.summary = self.summary
+        return copy
 
     def AddCodeLine(self, line_number, code):
-        self.code.append(CodeLine(line_number, code.strip().lower(), False))
+        line = CodeLine(line_number, code.strip().lower(), False)
+        self.code.append(line)
         self.loc += 1
+        return line
 
     def GetCommandCount(self):
-        node_counter = collections.Counter()
-
-        for line in self.code:
-            for command, count in line.commands_counter.items():
-                node_counter[command] += count
-        return node_counter
+        return collections.Counter(dict(self.summary.command_counts))
 
     def __repr__(self):
         return "{0}. {1}, {2}".format(self.name, self.code, self.connections)
@@ -75,11 +244,27 @@ class Node:
         return self.name < other.name
 
 
+# log_file arguments are accepted for backwards compatibility but ignored:
+# diagnostics are sent to the "callgraph" logger (see log.py).
+#
+# Besides the nodes, the call graph keeps indexes which are updated as nodes
+# and connections are added, so that the processing steps and later queries
+# don't need to scan the whole graph:
+# - nodes_in_order: the nodes defined in the code (i.e., with a line number),
+#   in order of definition;
+# - the names of the nodes with connections to each node (a list, possibly
+#   with repetitions), by destination name (which may not be the name of a
+#   node, e.g. for dynamic labels). The incoming connections themselves are
+#   found in the connections of these nodes, so that at most a reference to
+#   a name is stored per connection.
+# Connections must be added through CallGraph.AddConnection, and nodes
+# through GetOrCreateNode/AddNode/DefineNode/RemoveNode, to keep them in sync.
 class CallGraph:
-    def __init__(self, log_file=sys.stderr):
+    def __init__(self, log_file=None):
         self.nodes = {}
-        self.log_file = log_file
         self.first_node = None
+        self.nodes_in_order = []
+        self._sources = {}
 
     def GetOrCreateNode(self, name):
         if name in self.nodes:
@@ -89,6 +274,139 @@ class CallGraph:
         self.nodes[name] = node
         return node
 
+    # Adds an existing node, with its connections, at the end of the
+    # definition order.
+    def AddNode(self, node):
+        self.nodes[node.name] = node
+        if node.line_number != NO_LINE_NUMBER:
+            self.nodes_in_order.append(node)
+        for c in node.connections:
+            self._IndexConnection(node.name, c)
+
+    # Marks node as defined at line_number, i.e. as the last node in the
+    # definition order. If a label is defined more than once, the last
+    # definition wins.
+    def DefineNode(self, node, line_number):
+        if node.line_number != NO_LINE_NUMBER:
+            self.nodes_in_order.remove(node)
+        node.line_number = line_number
+        self.nodes_in_order.append(node)
+
+    # Removes the node called name, and all the connections from and to it.
+    def RemoveNode(self, name):
+        node = self.nodes.pop(name)
+        if node.line_number != NO_LINE_NUMBER:
+            self.nodes_in_order.remove(node)
+        for dst in set(c.dst for c in node.connections):
+            sources = self._sources.get(dst)
+            if sources is not None:
+                sources[:] = [src_name for src_name in sources if src_name != name]
+        for src_name in set(self._sources.pop(name, ())):
+            src = self.nodes.get(src_name)
+            if src is not None:
+                src.connections.difference_update([c for c in src.connections if c.dst == name])
+
+    def AddConnection(self, src, dst, kind, line_number=NO_LINE_NUMBER):
+        connection = src.AddConnection(dst, kind, line_number)
+        self._IndexConnection(src.name, connection)
+        return connection
+
+    def _IndexConnection(self, src_name, connection):
+        sources = self._sources.get(connection.dst)
+        if sources is None:
+            self._sources[connection.dst] = [src_name]
+        elif sources[-1] != src_name:
+            # The connections of a node are mostly added one after the other,
+            # so few names are repeated.
+            sources.append(src_name)
+
+    # Returns the set of IncomingConnection to the node called name.
+    def GetIncoming(self, name):
+        sources = self._sources.get(name)
+        if not sources:
+            return _NO_CONNECTIONS
+        incoming = set()
+        for src_name in set(sources):
+            # The source may have been removed, or the connection removed
+            # from it, since it was indexed.
+            src = self.nodes.get(src_name)
+            if src is not None:
+                for c in src.connections:
+                    if c.dst == name:
+                        incoming.add(IncomingConnection(src_name, c.kind, c.line_number))
+        return incoming
+
+    # The incoming connections of all the nodes, as a dict mapping each
+    # destination name to the set returned by GetIncoming.
+    @property
+    def incoming(self):
+        incoming = {}
+        for name in self._sources:
+            connections = self.GetIncoming(name)
+            if connections:
+                incoming[name] = connections
+        return incoming
+
+    # Returns the nodes defined in the code in order of definition, followed
+    # by the virtual nodes (e.g., eof).
+    def OrderedNodes(self):
+        defined = set(node.name for node in self.nodes_in_order)
+        return self.nodes_in_order + [node for node in self.nodes.values() if node.name not in defined]
+
+    # Returns a new CallGraph with the nodes reachable in at most depth steps
+    # (any number if depth is None) from the nodes called labels, following
+    # the connections in direction (see NEIGHBORHOOD_DIRECTIONS), and all the
+    # connections among them. Labels are case-insensitive; a ValueError is
+    # raised if one of them does not exist. The cost is proportional to the
+    # size of the neighborhood, not of the whole graph.
+    def Neighborhood(self, labels, depth=1, direction="both"):
+        if direction not in NEIGHBORHOOD_DIRECTIONS:
+            raise ValueError("unknown direction: {} (available: {})".format(direction, ", ".join(NEIGHBORHOOD_DIRECTIONS)))
+
+        frontier = []
+        for label in labels:
+            name = label if label in self.nodes else label.lower()
+            if name not in self.nodes:
+                raise ValueError("unknown label: {}".format(label))
+            frontier.append(name)
+
+        included = set(frontier)
+        steps = 0
+        while frontier and (depth is None or steps < depth):
+            next_frontier = []
+            for name in frontier:
+                if direction != "callers":
+                    for c in self.nodes[name].connections:
+                        if c.dst in self.nodes and c.dst not in included:
+                            included.add(c.dst)
+                            next_frontier.append(c.dst)
+                if direction != "callees":
+                    for c in self.GetIncoming(name):
+                        if c.src not in included:
+                            included.add(c.src)
+                            next_frontier.append(c.src)
+            frontier = next_frontier
+            steps += 1
+        logger.info("Neighborhood of %s: %d of %d nodes", ", ".join(labels), len(included), len(self.nodes))
+
+        # Same order as OrderedNodes, without scanning the whole graph.
+        order = sorted((self.nodes[name] for name in included), key=lambda node: (
+            node.line_number == NO_LINE_NUMBER, node.line_number, node.name))
+
+        subgraph = CallGraph()
+        for node in order:
+            copy = node.Copy()
+            for c in node.connections:
+                if c.dst in included:
+                    copy.AddConnection(c.dst, c.kind, c.line_number)
+            subgraph.AddNode(copy)
+
+        if self.first_node is not None and self.first_node.name in included:
+            subgraph.first_node = subgraph.nodes[self.first_node.name]
+        elif order:
+            subgraph.first_node = subgraph.nodes[order[0].name]
+        return subgraph
+
     def _MarkExitNodes(self):
         # A node is an exit node if:
         # 1. it contains an "exit" command with no target
@@ -99,131 +417,111 @@ class CallGraph:
 
         # Identify all nodes with an exit command with no targets.
         for node in self.nodes.values():
-            all_commands = set(itertools.chain.from_iterable(line.commands for line in node.code))
-            exit_cmd = Command("exit", "")
-            if exit_cmd in all_commands:
+            if node.summary.has_exit:
                 node.is_exit_node = True
 
         # Visit the call graph to find nodes satisfying condition #2.
         q = [self.first_node]
-        visited = set()   # Used to avoid loops, since the call graph is not acyclic.
+        visited = set([self.first_node.name])   # Used to avoid loops, since the call graph is not acyclic.
 
         while q:
             cur = q.pop()
-            visited.add(cur.name)
 
             # Evaluate condition for marking exit node.
-            if cur.is_last_node:
+            if cur.is_last_node or cur.summary.has_terminating:
                 cur.is_exit_node = True
-            else:
-                all_commands = itertools.chain.from_iterable(line.commands for line in cur.code)
-                for command in all_commands:
-                    if command[0] == "exit" or (command[0] == "goto" and command[1] == "eof"):
-                        cur.is_exit_node = True
-                        break
-
-            for connection in cur.connections:
-                if connection.dst not in self.nodes or connection.dst in visited:
-                    continue
-                if connection.kind == "nested" or connection.kind == "goto":
+
+            for kind in ("nested", "goto"):
+                for connection in cur.GetConnections(kind):
+                    if connection.dst not in self.nodes or connection.dst in visited:
+                        continue
+                    visited.add(connection.dst)
                     q.append(self.nodes[connection.dst])
 
     # Adds to each node information depending on the
     # contents of the code, such as connections
     # deriving from goto/call commands and
     # whether the node is terminating or not.
+    # The text of the lines is expected to be already stripped and lowercased
+    # (see _ParseSource). Most lines have no commands, and are only tokenized.
     def _AnnotateNode(self, node):
-        print(u"Annotating node {0} (line {1})".format(node.original_name, node.line_number), file=self.log_file)
-        for i in range(len(node.code)):
-            line = node.code[i]
-            line_number = line.number
-            text = line.text
-
-            # Tokenize the line of code, and store all elements that
-            #  warrant augmenting the
-            # node in a list (interesting_commands), which will then
-            # be processed later.
-            tokens = text.strip().lower().split()
-            if not tokens:
-                line.noop = True
+        logger.debug("Annotating node %s (line %s)", node.original_name, node.line_number)
+        trace = logger.isEnabledFor(TRACE)
+        line_commands = []
+        for line in node.code:
+            line.noop, commands = Tokenize(line.text)
+            if not commands:
                 continue
 
-            for i, token in enumerate(tokens):
-                # Remove open/close parenthesis from the start/end of the command, to deal with inline commands
-                # enclosed in parentheses.
-                token = token.lstrip("(").rstrip(")")
-
-                # Comment; stop processing the rest of the line.
-                if token.startswith("::") or token == "rem" or token.startswith("@::") or token == "@rem":
-                    line.noop = True
-                    break
-
-                if token == "goto" or token == "@goto":
-                    # Strip parentheses from the target before extracting the label name
-                    target = tokens[i+1].lstrip("(").rstrip(")")
-                    block_name = target[1:]
-                    if not block_name:
-                        continue
-                    line.AddCommand(Command("goto", block_name))
-                    continue
-
-                if token == "call" or token == "@call":
-                    # Strip parentheses from the target before processing
-                    target = tokens[i+1].lstrip("(").rstrip(")")
-                    if target[0] != ":":
-                        line.AddCommand(Command("external_call", target))
-                        continue
-                    block_name = target[1:]
-                    if not block_name:
-                        continue
-                    line.AddCommand(Command("call", block_name))
-                    continue
-
-                if token == "exit" or token == "@exit":
-                    target = ""
-                    if i+1 < len(tokens):
-                        target = tokens[i+1]
-                    line.AddCommand(Command("exit", target))
-
-            for command, target in line.commands:
+            line.commands = commands
+            line_number = line.number
+            for command, target in commands:
                 if command == "call" or command == "goto":
-                    node.AddConnection(target, command, line_number)
-                    print(u"Line {} has a goto towards: <{}>. Current block: {}".format(line_number, target, node.name), file=self.log_file)
+                    self.AddConnection(node, target, command, line_number)
+                    if trace:
+                        logger.log(TRACE, "Line %s has a goto towards: <%s>. Current block: %s", line_number, target, node.name)
 
-                if (command == "goto" and target == "eof") or command == "exit":
-                    line.terminating = True
+            if IsTerminating(commands):
+                line.terminating = True
+            line_commands.append((line_number, commands))
 
-                if command == "exit" and target == "":
-                    line.terminating = True
+        node.summary = NodeSummary.FromCommands(line_commands)
 
+    # Builds the call graph of input_file, which can be any iterable of lines.
+    # If set, profiler (a profiling.Profiler) measures each phase.
     @staticmethod
-    def Build(input_file, log_file=sys.stderr):
-        call_graph = CallGraph._ParseSource(input_file, log_file)
-        for node in call_graph.nodes.values():
-            call_graph._AnnotateNode(node)
+    def Build(input_file, log_file=None, profiler=NULL_PROFILER):
+        with profiler.Phase("parse") as phase:
+            call_graph = CallGraph._ParseSource(input_file)
+            phase["lines"] = sum(node.loc for node in call_graph.nodes.values())
+            phase["nodes"] = len(call_graph.nodes)
 
-        # Prune away EOF if it is a virtual node (no line number) and
-        # there are no call/nested connections to it.
-        eof = call_graph.GetOrCreateNode("eof")
-        all_connections = itertools.chain.from_iterable(n.connections for n in call_graph.nodes.values())
-        destinations = set((c.dst, c.kind) for c in all_connections)
-        if eof.line_number == NO_LINE_NUMBER and ("eof", "call") not in destinations and ("eof", "nested") not in destinations:
-            print(u"Removing the eof node, since there are no call/nested connections to it and it's not a real node", file=log_file)
-            del call_graph.nodes["eof"]
+        with profiler.Phase("annotate") as phase:
             for node in call_graph.nodes.values():
-                eof_connections = [c for c in node.connections if c.dst == "eof"]
-                print(u"Removing {} eof connections in node {}".format(len(eof_connections), node.name), file=log_file)
-                for c in eof_connections:
-                    node.connections.remove(c)
-
-        # Warn the user if there are goto connections to eof
-        # which will not be executed by CMD.
-        if eof.line_number != NO_LINE_NUMBER and ("eof", "goto") in destinations:
-            print(u"WARNING: there are goto connections to eof, but CMD will not execute that code via goto.", file=log_file)
-
-        # Find and mark the "nested" connections.
-        nodes = [n for n in call_graph.nodes.values() if n.line_number != NO_LINE_NUMBER]
-        nodes_by_line_number = sorted(nodes, key=lambda x: x.line_number)
+                call_graph._AnnotateNode(node)
+            phase["lines"] = sum(node.loc for node in call_graph.nodes.values())
+            phase["nodes"] = len(call_graph.nodes)
+
+        call_graph._PostProcess(profiler)
+        return call_graph
+
+    # Runs the processing steps which follow the parsing of the whole input,
+    # adding the information which crosses the boundaries of the blocks.
+    def _PostProcess(self, profiler=NULL_PROFILER):
+        call_graph = self
+        with profiler.Phase("prune_eof") as phase:
+            call_graph._PruneEof()
+            phase["nodes"] = len(call_graph.nodes)
+
+        with profiler.Phase("nested_connections") as phase:
+            call_graph._AddNestedConnections()
+            phase["nodes"] = len(call_graph.nodes)
+
+        with profiler.Phase("mark_exit_nodes") as phase:
+            call_graph._MarkLastNode()
+            call_graph._MarkExitNodes()
+            phase["nodes"] = len(call_graph.nodes)
+
+    # Prunes away EOF if it is a virtual node (no line number) and
+    # there are no call/nested connections to it.
+    def _PruneEof(self):
+        eof = self.GetOrCreateNode("eof")
+        kinds = set(c.kind for c in self.GetIncoming("eof"))
+        if eof.line_number == NO_LINE_NUMBER and "call" not in kinds and "nested" not in kinds:
+            logger.info("Removing the eof node, since there are no call/nested connections to it and it's not a real node")
+            if logger.isEnabledFor(logging.DEBUG):
+                for src, count in sorted(collections.Counter(c.src for c in self.GetIncoming("eof")).items()):
+                    logger.debug("Removing %d eof connections in node %s", count, src)
+            self.RemoveNode("eof")
+
+        # Tell the user (with -v, as before logging was used) if there are
+        # goto connections to eof which will not be executed by CMD.
+        if eof.line_number != NO_LINE_NUMBER and "goto" in kinds:
+            logger.info("There are goto connections to eof, but CMD will not execute that code via goto.")
+
+    # Finds and marks the "nested" connections.
+    def _AddNestedConnections(self):
+        nodes_by_line_number = list(self.nodes_in_order)
         for i in range(1, len(nodes_by_line_number)):
             cur_node = nodes_by_line_number[i]
             prev_node = nodes_by_line_number[i-1]
@@ -232,82 +530,138 @@ class CallGraph:
             # comments / empty lines.
             all_noop = all(line.noop for line in prev_node.code)
             if not prev_node.code or all_noop:
-                print(u"Adding nested connection between {0} and {1} because all_noop ({2}) or empty code ({3})".format(
-                    prev_node.name, cur_node.name, all_noop, not prev_node.code), file=log_file)
-                prev_node.AddConnection(cur_node.name, "nested")
-                break
-
-            # Heuristic for "nested" connections:
-            # iterate the previous node's commands, and create a nested
-            # connection only if the command that logically precedes the
-            # current node does not contain a goto or an exit (which would mean
-            # that the current node is not reached by "flowing" from the
-            # previous node to the current node.)
-            for line in reversed(prev_node.code):
-                # Skip comments and empty lines.
-                if line.noop:
-                    continue
-
-                commands = set(c.command for c in line.commands)
-                if "exit" not in commands and "goto" not in commands:
-                    print(u"Adding nested connection between {0} and {1} because there is a non-exit or non-goto command.".format(
-                        prev_node.name, cur_node.name), file=log_file)
-                    prev_node.AddConnection(cur_node.name, "nested")
-
+                logger.debug("Adding nested connection between %s and %s because all_noop (%s) or empty code (%s)",
+                             prev_node.name, cur_node.name, all_noop, not prev_node.code)
+                self.AddConnection(prev_node, cur_node.name, "nested")
                 break
 
-        # Mark all exit nodes.
-        last_node = max(call_graph.nodes.values(), key=lambda x: x.line_number)
-        print(u"{0} is the last node, marking it as exit node.".format(last_node.name), file=log_file)
+            # Heuristic for "nested" connections: create a nested connection
+            # only if the command that logically precedes the current node
+            # does not contain a goto or an exit (which would mean that the
+            # current node is not reached by "flowing" from the previous node
+            # to the current node.)
+            if FallsThrough(prev_node.code):
+                logger.debug("Adding nested connection between %s and %s because there is a non-exit or non-goto command.",
+                             prev_node.name, cur_node.name)
+                self.AddConnection(prev_node, cur_node.name, "nested")
+
+    def _MarkLastNode(self):
+        if self.nodes_in_order:
+            last_node = self.nodes_in_order[-1]
+        else:
+            last_node = max(self.nodes.values(), key=lambda x: x.line_number)
+        logger.info("%s is the last node, marking it as exit node.", last_node.name)
         last_node.is_last_node = True
-        call_graph._MarkExitNodes()
-
-        return call_graph
 
     # Creates a call graph from an input file, parsing the file in blocks and
     # creating one node for each block. Note that the nodes don't contain any
     # information that depend on the contents of the node, as this is just the
-    # starting point for the processing.
+    # starting point for the processing (see _AnnotateNode).
     @staticmethod
-    def _ParseSource(input_file, log_file=sys.stderr):
-        call_graph = CallGraph(log_file)
-        # Special node to signal the start of the script.
-        cur_node = call_graph.GetOrCreateNode("__begin__")
-        cur_node.line_number = 1
-        call_graph.first_node = cur_node
-
-        # Special node used by cmd to signal the end of the script.
-        eof = call_graph.GetOrCreateNode("eof")
-        eof.is_exit_node = True
+    def _ParseSource(input_file, log_file=None):
+        call_graph = CallGraph._NewGraph()
+        cur_node = call_graph.first_node
 
+        code = cur_node.code
+        debug = logger.isEnabledFor(logging.DEBUG)
         for line_number, line in enumerate(input_file, 1):
             line = line.strip()
 
             # Start of new block.
             if line.startswith(":") and not line.startswith("::"):
-                # In the off chance that there are multiple words,
-                # cmd considers the first word the label name.
-                original_block_name = line[1:].split()[0].strip()
-
-                # Since cmd is case-insensitive, let's convert block names to
-                # lowercase.
-                block_name = original_block_name.lower()
-
-                print(u"Line {} defines a new block: <{}>".format(line_number, block_name), file=log_file)
+                original_block_name, block_name = ParseLabel(line)
+                if debug:
+                    logger.debug("Line %s defines a new block: <%s>", line_number, block_name)
                 if block_name:
-                    next_node = call_graph.GetOrCreateNode(block_name)
-                    next_node.line_number = line_number
-                    next_node.original_name = original_block_name
+                    cur_node = call_graph._StartBlock(line_number, original_block_name, block_name)
+                    code = cur_node.code
 
-                    # If this node is defined on line one, remove __begin__,
-                    # so we avoid having two
-                    # nodes with the same line number.
-                    if line_number == 1:
-                        del call_graph.nodes["__begin__"]
-                        call_graph.first_node = next_node
+            # Same as cur_node.AddCodeLine, without stripping the line again;
+            # the lines of code are counted at the end.
+            code.append(CodeLine(line_number, line.lower()))
 
-                    cur_node = next_node
+        for node in call_graph.nodes.values():
+            node.loc = len(node.code)
+        return call_graph
 
-            cur_node.AddCodeLine(line_number, line)
+    # Returns a new call graph with the special nodes every script starts
+    # with.
+    @staticmethod
+    def _NewGraph():
+        call_graph = CallGraph()
+        # Special node to signal the start of the script.
+        begin = call_graph.GetOrCreateNode("__begin__")
+        call_graph.DefineNode(begin, 1)
+        call_graph.first_node = begin
 
+        # Special node used by cmd to signal the end of the script.
+        eof = call_graph.GetOrCreateNode("eof")
+        eof.is_exit_node = True
         return call_graph
+
+    # Starts the block of the label defined at line_number (see ParseLabel),
+    # returning its node.
+    def _StartBlock(self, line_number, original_block_name, block_name):
+        original_block_name = sys.intern(original_block_name)
+        block_name = sys.intern(block_name)
+
+        # If this node is defined on line one, remove __begin__,
+        # so we avoid having two
+        # nodes with the same line number.
+        if line_number == 1:
+            self.RemoveNode("__begin__")
+
+        node = self.GetOrCreateNode(block_name)
+        self.DefineNode(node, line_number)
+        node.original_name = original_block_name
+
+        if line_number == 1:
+            self.first_node = node
+        return node
+
+    # Sets the summary of each node from command_lines, which maps node names
+    # to the (line number, commands) pairs of their lines with commands.
+    def _SetSummaries(self, command_lines):
+        for name, line_commands in command_lines.items():
+            node = self.nodes.get(name)
+            if node is not None:
+                node.summary = NodeSummary.FromCommands(line_commands)
+
+    # Appends already tokenized lines to the graph, starting from the block
+    # of cur_node, and returns the node of the block of the last line. This
+    # does what _ParseSource and _AnnotateNode do, for lines tokenized
+    # separately (see TokenizeLines): the lines have consecutive numbers
+    # starting from first_line_number; texts, noops and terminating have one
+    # item per line; commands maps the indexes of the lines with commands to
+    # their commands; labels are the (index, original name, name) of the label
+    # lines, in order. The (line number, commands) pairs of the lines with
+    # commands are appended to command_lines, by node name, for
+    # _SetSummaries.
+    def _AppendLines(self, cur_node, first_line_number, texts, noops, terminating, commands, labels, command_lines):
+        code_lines = MakeCodeLines(first_line_number, texts, noops, terminating, commands)
+
+        # Each label line starts a new block, and belongs to it.
+        starts = [index for index, _, _ in labels] + [len(texts)]
+        block_lines = code_lines[:starts[0]]
+        cur_node.code.extend(block_lines)
+        cur_node.loc += len(block_lines)
+        blocks = [(cur_node, 0, starts[0])]
+        for (index, original_block_name, block_name), end in zip(labels, starts[1:]):
+            cur_node = self._StartBlock(first_line_number + index, original_block_name, block_name)
+            block_lines = code_lines[index:end]
+            cur_node.code.extend(block_lines)
+            cur_node.loc += len(block_lines)
+            blocks.append((cur_node, index, end))
+
+        block_index = 0
+        for index in sorted(commands):
+            while index >= blocks[block_index][2]:
+                block_index += 1
+            node = blocks[block_index][0]
+            line = code_lines[index]
+            for command, target in line.commands:
+                if command == "call" or command == "goto":
+                    self.AddConnection(node, target, command, line.number)
+            command_lines[node.name].append((line.number, line.commands))
+
+        return cur_node
@@ -0,0 +1,137 @@
+# Content-addressed deduplication of blocks: corpora of scripts are often
+# made of copies of the same boilerplate blocks (usage, logging, error
+# handling, ...), which only need to be tokenized once.
+#
+# A BlockTable maps the hash of the normalized lines of a block (stripped,
+# as the parser sees them), from its label line to the line before the next
+# label, to the result of core.TokenizeLines for them. Tokenized lines do not
+# depend on their line numbers, so the result is appended to each graph with
+# the lines of the block (see CallGraph._AppendLines), giving the same graph
+# as CallGraph.Build. Identical files are deduplicated by batch.RunBatch.
+
+import collections
+import hashlib
+import time
+
+from . import core
+from .profiling import NULL_PROFILER
+
+# Maximum number of blocks kept by a BlockTable; the oldest ones are
+# forgotten first.
+DEFAULT_MAX_ENTRIES = 65536
+
+_process_table = None
+
+
+def _IsLabel(line):
+    return line.startswith(":") and not line.startswith("::") and bool(core.ParseLabel(line)[1])
+
+
+class BlockTable:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = {}
+        # Number of blocks found in the table or tokenized, and their lines.
+        self.hits = 0
+        self.misses = 0
+        self.reused_lines = 0
+        self.tokenized_lines = 0
+        # Time spent tokenizing the missing blocks, and hashing all of them,
+        # in seconds.
+        self.tokenize_time = 0.0
+        self.hash_time = 0.0
+
+    # Builds the call graph of lines (an iterable of str, like the lines of a
+    # file), the same as CallGraph.Build(lines), reusing the tokenized
+    # blocks already in the table.
+    def Build(self, lines, profiler=NULL_PROFILER):
+        # The same phases as CallGraph.Build: the lines are split into
+        # blocks first, then each block is looked up in the table (or
+        # tokenized) and appended to the graph.
+        with profiler.Phase("parse") as phase:
+            blocks = []
+            block = []
+            for line in lines:
+                line = line.strip()
+                # Most lines are not labels, and are ruled out by the first
+                # character.
+                if line[:1] == ":" and block and _IsLabel(line):
+                    blocks.append(block)
+                    block = []
+                block.append(line)
+            if block:
+                blocks.append(block)
+            num_lines = sum(len(block) for block in blocks)
+            phase["lines"] = num_lines
+            phase["nodes"] = len(blocks)
+
+        with profiler.Phase("annotate") as phase:
+            call_graph = core.CallGraph._NewGraph()
+            cur_node = call_graph.first_node
+            command_lines = collections.defaultdict(list)
+            first_line_number = 1
+            for block in blocks:
+                cur_node = self._Append(call_graph, cur_node, first_line_number, block, command_lines)
+                first_line_number += len(block)
+            call_graph._SetSummaries(command_lines)
+            phase["lines"] = num_lines
+            phase["nodes"] = len(call_graph.nodes)
+
+        call_graph._PostProcess(profiler)
+        return call_graph
+
+    def _Append(self, call_graph, cur_node, first_line_number, block, command_lines):
+        start = time.perf_counter()
+        key = hashlib.sha256(u"\n".join(block).encode("utf-8", "surrogatepass")).digest()
+        hashed = time.perf_counter()
+        self.hash_time += hashed - start
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = core.TokenizeLines(block)
+            self.tokenize_time += time.perf_counter() - hashed
+            self.misses += 1
+            self.tokenized_lines += len(block)
+            if len(self._entries) >= self.max_entries:
+                del self._entries[next(iter(self._entries))]
+            self._entries[key] = entry
+        else:
+            self.hits += 1
+            self.reused_lines += len(block)
+        texts, noops, terminating, commands, labels = entry
+        return call_graph._AppendLines(cur_node, first_line_number, texts, noops, terminating, commands, labels,
+                                       command_lines)
+
+    # Returns an estimate of the time it would have taken to tokenize the
+    # reused blocks, in seconds, from the average time taken to tokenize a
+    # line.
+    def ReusedTime(self):
+        if not self.tokenized_lines:
+            return 0.0
+        return self.reused_lines * self.tokenize_time / self.tokenized_lines
+
+    # Returns an estimate of the time saved by the table, in seconds: the
+    # time of tokenizing the reused blocks, minus the time spent hashing all
+    # the blocks. It is negative if there were too few blocks to reuse.
+    def SavedTime(self):
+        return self.ReusedTime() - self.hash_time
+
+    def Stats(self):
+        return dict(hits=self.hits, misses=self.misses, reused_lines=self.reused_lines,
+                    tokenized_lines=self.tokenized_lines, reused_time=self.ReusedTime(),
+                    hash_time=self.hash_time, saved=self.SavedTime())
+
+
+# Returns the BlockTable of the current process, creating it the first time.
+# Meant for worker processes, which handle many files each.
+def GetProcessTable():
+    global _process_table
+    if _process_table is None:
+        _process_table = BlockTable()
+    return _process_table
+
+
+# Forgets the BlockTable of the current process, so that the next call to
+# GetProcessTable starts with an empty one.
+def ResetProcessTable():
+    global _process_table
+    _process_table = None
@@ -0,0 +1,264 @@
+# Diff of the call graphs of two versions of a script (cmd-call-graph diff),
+# showing how a change reshaped the control flow.
+#
+# Blocks are matched by label. Each block has a fingerprint computed from
+# its code and its outgoing connections, but not from its line numbers, so
+# blocks which only moved because of changes elsewhere are unchanged; they
+# are recognized by comparing the fingerprints alone, and only the changed
+# blocks have their connections compared in detail. Connections are compared
+# as multisets of (destination, kind), since their line numbers change as
+# well.
+
+import argparse
+import collections
+import hashlib
+import json
+import logging
+import sys
+
+from . import api
+from . import core
+from . import log
+from . import reader
+from . import render
+
+logger = logging.getLogger(__name__)
+
+ADDED = "added"
+REMOVED = "removed"
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+
+DIFF_COLORS = {
+    ADDED:   '"#107c10"',  # Green
+    REMOVED: '"#e81123"',  # Red
+    CHANGED: '"#ca5010"',  # Dark orange
+}
+
+# Difference of a block: old and new are its Node in each version (None if
+# it does not exist there).
+NodeDelta = collections.namedtuple("NodeDelta", ["name", "status", "old", "new"])
+
+# Difference of the connections from src to dst of a kind: old_count and
+# new_count are their number in each version.
+EdgeDelta = collections.namedtuple("EdgeDelta", ["src", "dst", "kind", "status", "old_count", "new_count"])
+
+# Result of Diff: nodes and edges are sorted lists of NodeDelta and EdgeDelta.
+GraphDiff = collections.namedtuple("GraphDiff", ["nodes", "edges"])
+
+
+# Returns the fingerprint of node: a digest of its code, of its outgoing
+# connections and of whether it is an exit node, which does not depend on
+# line numbers.
+def Fingerprint(node):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update("\n".join([line.text for line in node.code]).encode("utf-8", "surrogatepass"))
+    digest.update(b"\0")
+    digest.update(" ".join(sorted(c.kind + ":" + c.dst for c in node.connections)).encode("utf-8", "surrogatepass"))
+    digest.update(b"\1" if node.is_exit_node else b"\0")
+    return digest.digest()
+
+
+def _EdgeCounts(node):
+    return collections.Counter((c.dst, c.kind) for c in node.connections)
+
+
+def _EdgeDeltas(name, old_node, new_node):
+    old_counts = _EdgeCounts(old_node) if old_node is not None else collections.Counter()
+    new_counts = _EdgeCounts(new_node) if new_node is not None else collections.Counter()
+    deltas = []
+    for dst, kind in set(old_counts) | set(new_counts):
+        old_count = old_counts[dst, kind]
+        new_count = new_counts[dst, kind]
+        if old_count == 0:
+            status = ADDED
+        elif new_count == 0:
+            status = REMOVED
+        elif old_count != new_count:
+            status = CHANGED
+        else:
+            status = UNCHANGED
+        deltas.append(EdgeDelta(name, dst, kind, status, old_count, new_count))
+    return deltas
+
+
+# Compares old_graph and new_graph (CallGraph), returning a GraphDiff.
+def Diff(old_graph, new_graph):
+    nodes = []
+    edges = []
+    for name in sorted(set(old_graph.nodes) | set(new_graph.nodes)):
+        old_node = old_graph.nodes.get(name)
+        new_node = new_graph.nodes.get(name)
+        if old_node is None:
+            status = ADDED
+        elif new_node is None:
+            status = REMOVED
+        elif Fingerprint(old_node) == Fingerprint(new_node):
+            nodes.append(NodeDelta(name, UNCHANGED, old_node, new_node))
+            for (dst, kind), count in _EdgeCounts(new_node).items():
+                edges.append(EdgeDelta(name, dst, kind, UNCHANGED, count, count))
+            continue
+        else:
+            status = CHANGED
+        nodes.append(NodeDelta(name, status, old_node, new_node))
+        edges.extend(_EdgeDeltas(name, old_node, new_node))
+
+    edges.sort()
+    counts = collections.Counter(delta.status for delta in nodes)
+    logger.info("%d added, %d removed, %d changed and %d unchanged blocks", counts[ADDED], counts[REMOVED],
+                counts[CHANGED], counts[UNCHANGED])
+    return GraphDiff(nodes, edges)
+
+
+def _Summary(deltas):
+    counts = collections.Counter(delta.status for delta in deltas)
+    return collections.OrderedDict((status, counts[status]) for status in [ADDED, REMOVED, CHANGED, UNCHANGED])
+
+
+def _LineNumber(node):
+    if node is None or node.line_number == core.NO_LINE_NUMBER:
+        return None
+    return node.line_number
+
+
+# Generates graph_diff as a JSON document, in chunks:
+#   {"summary": {"nodes": {"added": ..., ...}, "edges": {...}},
+#    "nodes": [{"name": ..., "status": ..., "old_line_number": ..., "new_line_number": ...}, ...],
+#    "edges": [{"src": ..., "dst": ..., "kind": ..., "status": ..., "old_count": ..., "new_count": ...}, ...]}
+# Unchanged nodes and edges are only included if show_unchanged is set.
+def GenerateJson(graph_diff, show_unchanged=True):
+    summary = collections.OrderedDict([("nodes", _Summary(graph_diff.nodes)), ("edges", _Summary(graph_diff.edges))])
+    yield u'{{"summary": {},\n"nodes": [\n'.format(json.dumps(summary))
+    separator = u""
+    for delta in graph_diff.nodes:
+        if delta.status == UNCHANGED and not show_unchanged:
+            continue
+        yield separator + json.dumps(collections.OrderedDict([
+            ("name", delta.name), ("status", delta.status),
+            ("old_line_number", _LineNumber(delta.old)), ("new_line_number", _LineNumber(delta.new)),
+        ]))
+        separator = u",\n"
+    yield u'\n],\n"edges": [\n'
+    separator = u""
+    for delta in graph_diff.edges:
+        if delta.status == UNCHANGED and not show_unchanged:
+            continue
+        yield separator + json.dumps(collections.OrderedDict([
+            ("src", delta.src), ("dst", delta.dst), ("kind", delta.kind), ("status", delta.status),
+            ("old_count", delta.old_count), ("new_count", delta.new_count),
+        ]))
+        separator = u",\n"
+    yield u"\n]}\n"
+
+
+# Generates the DOT code of the delta graph: the union of both graphs, with
+# added (green), removed (red, dashed) and changed (orange) nodes and edges
+# highlighted. Unchanged edges keep the colors of their kind. Unchanged
+# nodes and edges are only included if show_unchanged is set; otherwise
+# only the unchanged nodes connected to a difference are kept.
+def GenerateDot(graph_diff, show_unchanged=True):
+    edges = [delta for delta in graph_diff.edges if show_unchanged or delta.status != UNCHANGED]
+    connected = set()
+    for delta in edges:
+        connected.add(delta.src)
+        connected.add(delta.dst)
+
+    yield u"digraph g {\n"
+    for delta in graph_diff.nodes:
+        if delta.status == UNCHANGED and not show_unchanged and delta.name not in connected:
+            continue
+        node = delta.new if delta.new is not None else delta.old
+        pretty_name = node.original_name or node.name
+        label_lines = ["<b>{}</b>".format(pretty_name)]
+        old_line, new_line = _LineNumber(delta.old), _LineNumber(delta.new)
+        if old_line is not None and new_line is not None and old_line != new_line:
+            label_lines.append("(line {} &rarr; {})".format(old_line, new_line))
+        elif new_line is not None or old_line is not None:
+            label_lines.append("(line {})".format(new_line if new_line is not None else old_line))
+
+        attributes = []
+        if delta.status != UNCHANGED:
+            label_lines.append("<sub>[{}]</sub>".format(delta.status))
+            attributes.append("color={}".format(DIFF_COLORS[delta.status]))
+            attributes.append("fontcolor={}".format(DIFF_COLORS[delta.status]))
+            attributes.append("penwidth=2")
+        if delta.status == REMOVED:
+            attributes.append("style=dashed")
+        attributes.append("label=<{}>".format("<br/>".join(label_lines)))
+        yield u"\"{}\" [{}]\n".format(delta.name, ",".join(attributes))
+
+    for delta in edges:
+        label = delta.kind
+        if delta.old_count > 1 or delta.new_count > 1 or delta.status == CHANGED:
+            label = "{} ({} &rarr; {})".format(delta.kind, delta.old_count, delta.new_count)
+        if delta.status == UNCHANGED:
+            attributes = "color={}".format(render.COLORS[delta.kind])
+        else:
+            attributes = "color={},fontcolor={},penwidth=2".format(DIFF_COLORS[delta.status], DIFF_COLORS[delta.status])
+            if delta.status == REMOVED:
+                attributes += ",style=dashed"
+        yield u"\"{}\" -> \"{}\" [label=<{}>,{}]\n".format(render._Escape(delta.src), render._Escape(delta.dst),
+                                                           label, attributes)
+    yield u"}\n"
+
+
+FORMATS = collections.OrderedDict([("dot", GenerateDot), ("json", GenerateJson)])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="cmd-call-graph diff",
+                                     description="Compare the call graphs of two versions of a script.")
+    parser.add_argument("old", help="Old version of the script.", type=str)
+    parser.add_argument("new", help="New version of the script.", type=str)
+    parser.add_argument("-o", "--output", help="Output file. If it's not set, stdout is used. "
+                        "If its name ends with .gz, the output is compressed with gzip.", type=str)
+    parser.add_argument("--format", help="Output format.", choices=list(FORMATS), default="dot", dest="format")
+    parser.add_argument("--changes-only", help="Leave out the unchanged blocks and connections, except for the "
+                        "blocks connected to a change.", action="store_true", dest="changesonly")
+    parser.add_argument("--encoding", help="Encoding of the input files. Defaults to the encoding of the system.",
+                        type=str, dest="encoding")
+    parser.add_argument("-v", "--verbose", action="count", dest="verbose", default=0,
+                        help="Output extra information about what the program does.")
+    parser.add_argument("-l", "--log-file", help="Log file. If it's not set, stderr is used.",
+                        type=str, dest="logfile")
+    args = parser.parse_args(argv)
+
+    if args.encoding is not None:
+        try:
+            reader.CheckEncoding(args.encoding)
+        except (LookupError, ValueError) as e:
+            parser.error(str(e))
+
+    log_file = sys.stderr
+    if args.logfile:
+        try:
+            log_file = open(args.logfile, 'w')
+        except IOError as e:
+            print(u"Error opening {}: {}".format(args.logfile, e), file=sys.stderr)
+            sys.exit(1)
+    log_handler = log.Configure(log_file, args.verbose)
+
+    try:
+        graphs = []
+        for path in [args.old, args.new]:
+            try:
+                graphs.append(api.BuildFile(path, encoding=args.encoding))
+            except IOError as e:
+                print(u"Error opening {}: {}".format(path, e), file=sys.stderr)
+                sys.exit(1)
+            except (LookupError, ValueError) as e:
+                # E.g., a file which cannot be decoded with the encoding.
+                print(u"Error reading {}: {}".format(path, e), file=sys.stderr)
+                sys.exit(1)
+
+        graph_diff = Diff(*graphs)
+        output_file = render.OpenOutput(args.output) if args.output else sys.stdout
+        try:
+            render.WriteChunks(output_file, FORMATS[args.format](graph_diff, show_unchanged=not args.changesonly))
+        finally:
+            if args.output:
+                output_file.close()
+    finally:
+        log.Unconfigure(log_handler)
+        if args.logfile:
+            log_file.close()
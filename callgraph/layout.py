@@ -0,0 +1,188 @@
+# Built-in layered (Sugiyama-style) layout, used to draw call graphs which
+# are too large for Graphviz.
+#
+# The nodes are given in the order of their definition in the script, which
+# is used to break the cycles: every connection is laid out as going from
+# the node defined first to the other one, so the order is a topological
+# order of the resulting acyclic graph. Then:
+#  1. each node is assigned to the first layer after all of its
+#     predecessors (longest path layering), with a bound on the number of
+#     nodes per layer like in the Coffman-Graham algorithm, so that graphs
+#     with short paths do not end up in a few extremely wide layers;
+#  2. the crossings are reduced by sweeping the layers down and up, sorting
+#     the nodes of each layer by the barycenter of the x coordinates of
+#     their neighbors in the previous (or next) layers;
+#  3. the layers are stacked vertically, each one centered horizontally.
+#
+# Long connections are not split into chains of dummy nodes, which could
+# make the layout quadratic; they simply count towards the barycenters of
+# their endpoints. Everything runs in O((V log V + E) * sweeps).
+
+import collections
+import math
+
+DEFAULT_SWEEPS = 4
+DEFAULT_NODE_GAP = 20
+DEFAULT_LAYER_GAP = 60
+DEFAULT_MARGIN = 20
+
+# Position of a node: x and y are the coordinates of its center.
+Box = collections.namedtuple("Box", ["x", "y", "width", "height", "layer"])
+
+# Result of Layered: boxes has a Box for each node, in the same order as the
+# sizes; width and height are the size of the whole drawing.
+Layout = collections.namedtuple("Layout", ["boxes", "width", "height"])
+
+
+# Layers with a bounded number of nodes, supporting the search of the first
+# layer with room at or after a given one (or at or before it) in almost
+# constant time, like a union-find structure.
+class _Layers:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.sizes = []
+        # next_free[l] (prev_free[l]) is l if l has room, otherwise a layer
+        # after (before) it from which to continue the search; -1 if none.
+        self._next_free = []
+        self._prev_free = []
+
+    # Follows links from layer to a layer with room, -1 or the end.
+    def _Find(self, links, layer):
+        end = len(links)
+        root = layer
+        while 0 <= root < end and links[root] != root:
+            root = links[root]
+        while 0 <= layer < end and links[layer] != layer:
+            links[layer], layer = root, links[layer]
+        return root
+
+    # Returns the first layer with room at or after layer, adding it if
+    # needed.
+    def Forward(self, layer):
+        layer = self._Find(self._next_free, layer)
+        if layer == len(self.sizes):
+            self.sizes.append(0)
+            self._next_free.append(layer)
+            self._prev_free.append(layer)
+        return layer
+
+    # Returns the last layer with room at or before layer, or -1.
+    def Backward(self, layer):
+        return self._Find(self._prev_free, layer)
+
+    def Add(self, layer):
+        self.sizes[layer] += 1
+        if self.sizes[layer] >= self.max_size:
+            self._next_free[layer] = layer + 1
+            self._prev_free[layer] = layer - 1
+
+
+# Returns the layer of each node, given the successors and predecessors of
+# each node in the acyclic graph where edges go from lower to higher
+# indexes. Each node goes to the first layer with room after all of its
+# predecessors. The nodes with no predecessors but the first (the start of
+# the script) would all crowd the first layers, so they are placed last, in
+# the last layer with room above all of their successors.
+def _Layering(successors, predecessors, max_layer_size):
+    n = len(successors)
+    slots = _Layers(max_layer_size)
+    layers = [0] * n
+    bounds = [0] * n
+    sources = []
+    for v in range(n):
+        if v and not predecessors[v]:
+            sources.append(v)
+            layer = 0
+        else:
+            layer = slots.Forward(bounds[v])
+            slots.Add(layer)
+            layers[v] = layer
+        next_layer = layer + 1
+        for w in successors[v]:
+            if bounds[w] < next_layer:
+                bounds[w] = next_layer
+
+    for v in sources:
+        if successors[v]:
+            above = min(layers[w] for w in successors[v]) - 1
+            layer = slots.Backward(above)
+            if layer < 0:
+                # No room above: the closest layer below will do.
+                layer = slots.Forward(above)
+        else:
+            layer = slots.Forward(0)
+        slots.Add(layer)
+        layers[v] = layer
+    return layers
+
+
+# Lays out a graph of len(sizes) nodes, whose (width, height) are sizes, and
+# edges are (src, dst) pairs of indexes. Nodes should be sorted by the order
+# of their definition; self-loops are ignored. Layers have at most
+# max_layer_size nodes, by default the square root of the number of nodes,
+# which gives roughly square drawings.
+def Layered(sizes, edges, sweeps=DEFAULT_SWEEPS, max_layer_size=None, node_gap=DEFAULT_NODE_GAP,
+            layer_gap=DEFAULT_LAYER_GAP, margin=DEFAULT_MARGIN):
+    n = len(sizes)
+    if max_layer_size is None:
+        max_layer_size = max(1, int(math.ceil(math.sqrt(n))))
+    successors = [[] for _ in range(n)]
+    predecessors = [[] for _ in range(n)]
+    for src, dst in edges:
+        if src == dst:
+            continue
+        if src > dst:
+            src, dst = dst, src
+        successors[src].append(dst)
+        predecessors[dst].append(src)
+
+    layer_of = _Layering(successors, predecessors, max_layer_size)
+    layers = [[] for _ in range(max(layer_of) + 1 if n else 0)]
+    for v in range(n):
+        layers[layer_of[v]].append(v)
+
+    widths = [width for width, _ in sizes]
+    x = [0.0] * n
+
+    def Place(members):
+        total = sum(widths[v] for v in members) + node_gap * (len(members) - 1)
+        left = -total / 2.0
+        for v in members:
+            x[v] = left + widths[v] / 2.0
+            left += widths[v] + node_gap
+
+    for members in layers:
+        Place(members)
+
+    for sweep in range(sweeps):
+        if sweep % 2 == 0:
+            order, neighbors = range(1, len(layers)), predecessors
+        else:
+            order, neighbors = range(len(layers) - 2, -1, -1), successors
+        for index in order:
+            members = layers[index]
+            if len(members) < 2:
+                continue
+            barycenters = {}
+            for v in members:
+                adjacent = neighbors[v]
+                barycenters[v] = sum(x[u] for u in adjacent) / len(adjacent) if adjacent else x[v]
+            # The sort is stable, so ties keep the current order.
+            members.sort(key=barycenters.__getitem__)
+            Place(members)
+
+    min_x = min(x[v] - widths[v] / 2.0 for v in range(n)) if n else 0.0
+    max_x = max(x[v] + widths[v] / 2.0 for v in range(n)) if n else 0.0
+    shift = margin - min_x
+
+    boxes = [None] * n
+    top = margin
+    for index, members in enumerate(layers):
+        layer_height = max(sizes[v][1] for v in members) if members else 0
+        center = top + layer_height / 2.0
+        for v in members:
+            boxes[v] = Box(x[v] + shift, center, sizes[v][0], sizes[v][1], index)
+        top += layer_height + layer_gap
+    height = top - layer_gap + margin if layers else 2 * margin
+
+    return Layout(boxes, max_x - min_x + 2 * margin, height)
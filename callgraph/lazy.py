@@ -0,0 +1,354 @@
+# Lazy call graph: the labels are found first by a quick scan of the raw
+# bytes (see reader.ScanLabels), and each block is decoded, tokenized and
+# annotated only when its node is first accessed, for the uses which only
+# need a few blocks: listing labels, checking whether one exists, or
+# focusing on the neighborhood of one (see CallGraph.Neighborhood).
+#
+# The nodes are the same as CallGraph.Build's, computed block by block:
+#  - the nested connection of a block only depends on its own code, and on
+#    whether the code of __begin__ (if any) is empty or made only of
+#    comments, which stops the nested connections at the first block;
+#  - exit nodes are found by visiting the nodes reachable from the first one
+#    through nested and goto connections, which are usually few;
+#  - the callers of a label can only be in the blocks which contain its name
+#    (or a non-ASCII byte, for names with a "k", which the Kelvin sign is
+#    lowercased into), plus the block before it for the nested connection;
+#    the bytes are searched for those, and only the matching blocks are
+#    annotated. The lines calling eof are found the same way, which tells
+#    whether a virtual eof node exists (it is pruned without calls to it,
+#    with the gotos to it).
+#
+# Anything else which needs the whole graph (nodes_in_order, incoming, ...)
+# evaluates every block transparently; the nodes stay the same objects.
+# Scripts which define a label more than once, or whose labels cannot be
+# found reliably in the bytes (lines ended by a bare carriage return, or
+# starting with unusual whitespace), are built eagerly.
+
+import bisect
+import collections.abc
+import logging
+import re
+
+from . import core
+from . import reader
+from .profiling import NULL_PROFILER
+
+logger = logging.getLogger(__name__)
+
+_NON_ASCII = re.compile(rb"[\x80-\xff]")
+
+# States of the blocks.
+_NEW = 0
+_PARSED = 1
+_ANNOTATED = 2
+
+# Lines starting with characters which str.strip may take for whitespace,
+# but reader.ScanLabels does not. Looking for those characters first (see
+# _HasAmbiguousLineStart) is much faster, and they are rare.
+_AMBIGUOUS_CHARACTERS = [b"\x1c", b"\x1d", b"\x1e", b"\x1f"]
+_AMBIGUOUS_LINE_START = re.compile(rb"(?:^|\n)[ \t\r\x0b\x0c]*[\x1c-\x1f\x80-\xff]")
+
+
+def _HasAmbiguousLineStart(data):
+    if data.isascii() and not any(c in data for c in _AMBIGUOUS_CHARACTERS):
+        return False
+    return _AMBIGUOUS_LINE_START.search(data) is not None
+
+
+class _LazyNodes(collections.abc.Mapping):
+    def __init__(self, call_graph):
+        self._call_graph = call_graph
+
+    def __contains__(self, name):
+        return self._call_graph._Contains(name)
+
+    def __getitem__(self, name):
+        node = self._call_graph._GetNode(name)
+        if node is None:
+            raise KeyError(name)
+        return node
+
+    def __iter__(self):
+        return iter(self._call_graph._Names())
+
+    def __len__(self):
+        return len(self._call_graph._Names())
+
+
+# Call graph of a script, evaluated lazily. Behaves like the CallGraph built
+# by CallGraph.Build from the same script, but is read-only.
+class LazyCallGraph(core.CallGraph):
+    # data is the content of the script (bytes), decoded with encoding. The
+    # label scan is reported to profiler as the "scan_labels" phase, or the
+    # eager build as CallGraph.Build's phases.
+    def __init__(self, data, encoding=None, profiler=NULL_PROFILER):
+        self._data = bytes(data)
+        self._encoding = reader.CheckEncoding(encoding)
+        self._graph = None
+        self._blocks = None
+        self._lazy_nodes = _LazyNodes(self)
+
+        with profiler.Phase("scan_labels") as phase:
+            labels = reader.ScanLabels(self._data, self._encoding)
+            phase["nodes"] = len(labels)
+        names = [label.name.lower() for label in labels]
+        if len(set(names)) != len(names) or "__begin__" in names or reader.HasBareCarriageReturns(self._data) or \
+                _HasAmbiguousLineStart(self._data) or any(len(label.name.split()) != 1 for label in labels):
+            logger.info("Building the call graph eagerly")
+            self._graph = core.CallGraph.Build(reader.IterDecodedLines(self._data, self._encoding), profiler=profiler)
+            return
+
+        self._blocks = []
+        offsets = [offset for _, offset in reader.LabelLineOffsets(self._data)]
+        if not labels or labels[0].line_number != 1:
+            begin = core.Node("__begin__")
+            begin.line_number = 1
+            self._blocks.append(begin)
+            offsets.insert(0, 0)
+        for label, name in zip(labels, names):
+            node = core.Node(name)
+            node.original_name = label.name
+            node.line_number = label.line_number
+            # Like the virtual one, a real eof is always an exit node.
+            node.is_exit_node = name == "eof"
+            self._blocks.append(node)
+        # Byte offsets where each block starts and ends.
+        self._offsets = offsets + [len(self._data)]
+        self._index = dict((node.name, index) for index, node in enumerate(self._blocks))
+        self._state = [_NEW] * len(self._blocks)
+        self._num_annotated = 0
+        self._exits_marked = False
+        self._eof = None
+        # The data with ASCII letters lowercased, searched for names.
+        self._lower_data = None
+        # Sets of core.IncomingConnection, by name.
+        self._incoming = {}
+
+    @staticmethod
+    def FromFile(path, encoding=None, profiler=NULL_PROFILER):
+        with open(path, "rb") as f:
+            return LazyCallGraph(f.read(), encoding, profiler)
+
+    # Returns the labels defined in the script, as reader.Label tuples, in
+    # order, without annotating anything.
+    def Labels(self):
+        nodes = self._graph.nodes_in_order if self._blocks is None else self._blocks
+        return [reader.Label(node.line_number, node.original_name) for node in nodes if node.name != "__begin__"]
+
+    # Returns True if the script defines label (case-insensitive).
+    def HasLabel(self, label):
+        name = label.lower()
+        if self._blocks is None:
+            node = self._graph.nodes.get(name)
+            return node is not None and node.line_number != core.NO_LINE_NUMBER and name != "__begin__"
+        return name in self._index and name != "__begin__"
+
+    # Returns the number of blocks annotated so far, and the number of blocks.
+    def AnnotatedBlocks(self):
+        if self._blocks is None:
+            return len(self._graph.nodes_in_order), len(self._graph.nodes_in_order)
+        return self._num_annotated, len(self._blocks)
+
+    @property
+    def nodes(self):
+        return self._lazy_nodes if self._graph is None else self._graph.nodes
+
+    @property
+    def first_node(self):
+        if self._graph is not None:
+            return self._graph.first_node
+        return self._GetNode(self._blocks[0].name) if self._blocks else None
+
+    @property
+    def nodes_in_order(self):
+        return self.Evaluate().nodes_in_order
+
+    @property
+    def incoming(self):
+        return self.Evaluate().incoming
+
+    def GetIncoming(self, name):
+        if self._graph is not None:
+            return self._graph.GetIncoming(name)
+        incoming = self._incoming.get(name)
+        if incoming is None:
+            incoming = self._incoming[name] = self._FindIncoming(name)
+        return incoming
+
+    def AddNode(self, node):
+        raise TypeError("LazyCallGraph is read-only")
+
+    AddConnection = DefineNode = GetOrCreateNode = RemoveNode = AddNode
+
+    # Annotates every block, returning the whole CallGraph.
+    def Evaluate(self):
+        if self._graph is not None:
+            return self._graph
+        for index in range(len(self._blocks)):
+            self._Annotate(index)
+
+        call_graph = core.CallGraph()
+        for name in self._Names():
+            node = call_graph.nodes[name] = self._GetNode(name)
+            for c in node.connections:
+                call_graph._IndexConnection(name, c)
+        call_graph.nodes_in_order = list(self._blocks)
+        call_graph.first_node = self._blocks[0] if self._blocks else None
+        logger.info("Evaluated the whole graph (%d blocks)", len(self._blocks))
+        self._graph = call_graph
+        return call_graph
+
+    def _Names(self):
+        # Same order as CallGraph.Build: __begin__, eof, then the labels.
+        names = [node.name for node in self._blocks if node.name != "eof"]
+        if self._Contains("eof"):
+            names.insert(1 if names and names[0] == "__begin__" else 0, "eof")
+        return names
+
+    def _Contains(self, name):
+        if name in self._index:
+            return True
+        return name == "eof" and self._Eof() is not None
+
+    # Returns the node called name, annotated, or None.
+    def _GetNode(self, name):
+        index = self._index.get(name)
+        if index is None:
+            return self._Eof() if name == "eof" else None
+        node = self._Annotate(index)
+        self._MarkExits()
+        return node
+
+    # Decodes and tokenizes the block at index, if not done yet, adding its
+    # connections (see _Annotate).
+    def _Parse(self, index):
+        node = self._blocks[index]
+        if self._state[index] != _NEW:
+            return node
+        self._state[index] = _PARSED
+        self._num_annotated += 1
+        logger.debug("Annotating node %s (line %s)", node.original_name, node.line_number)
+
+        data = self._data[self._offsets[index]:self._offsets[index + 1]]
+        texts, noops, terminating, commands, _ = core.TokenizeLines(reader.IterDecodedLines(data, self._encoding))
+        node.code = core.MakeCodeLines(node.line_number, texts, noops, terminating, commands)
+        node.loc = len(node.code)
+
+        line_commands = []
+        for line_index in sorted(commands):
+            line = node.code[line_index]
+            for command, target in line.commands:
+                if command == "call" or command == "goto":
+                    node.AddConnection(target, command, line.number)
+            line_commands.append((line.number, line.commands))
+        node.summary = core.NodeSummary.FromCommands(line_commands)
+        if node.summary.has_exit:
+            node.is_exit_node = True
+
+        if index + 1 < len(self._blocks):
+            if core.FallsThrough(node.code) and (index == 0 or not self._BeginIsEmpty()):
+                node.AddConnection(self._blocks[index + 1].name, "nested")
+        else:
+            node.is_last_node = True
+        return node
+
+    # Returns the node of the block at index, parsed, without its gotos to
+    # eof if eof is pruned (which removes them).
+    def _Annotate(self, index):
+        node = self._Parse(index)
+        if self._state[index] == _PARSED:
+            self._state[index] = _ANNOTATED
+            if not self._Contains("eof"):
+                for c in list(node.GetConnections("goto")):
+                    if c.dst == "eof":
+                        node.RemoveConnection(c)
+        return node
+
+    # Returns True if there is a __begin__ block with only comments and empty
+    # lines, after which CallGraph._AddNestedConnections stops.
+    def _BeginIsEmpty(self):
+        if self._blocks[0].name != "__begin__":
+            return False
+        return all(line.noop for line in self._Parse(0).code)
+
+    # Marks the exit nodes reachable from the first node, like
+    # CallGraph._MarkExitNodes (the other ones are marked when parsed).
+    def _MarkExits(self):
+        if self._exits_marked or not self._blocks:
+            return
+        self._exits_marked = True
+        q = [self._Annotate(0)]
+        visited = set([q[0].name])
+        while q:
+            cur = q.pop()
+            if cur.is_last_node or cur.summary.has_terminating:
+                cur.is_exit_node = True
+            for kind in ("nested", "goto"):
+                for connection in cur.GetConnections(kind):
+                    index = self._index.get(connection.dst)
+                    # The virtual eof has no connections, and is already an
+                    # exit node.
+                    if index is None or connection.dst in visited:
+                        continue
+                    visited.add(connection.dst)
+                    q.append(self._Annotate(index))
+
+    # Yields the offsets where name (lowercase ASCII bytes) appears in the
+    # data, ignoring case. bytes.find is much faster than a case-insensitive
+    # regular expression.
+    def _Find(self, name):
+        lower_data = self._LowerData()
+        offset = lower_data.find(name)
+        while offset != -1:
+            yield offset
+            offset = lower_data.find(name, offset + 1)
+
+    def _LowerData(self):
+        if self._lower_data is None:
+            self._lower_data = self._data.lower()
+        return self._lower_data
+
+    # Returns the indexes of the blocks containing offsets, plus extra ones.
+    def _Blocks(self, offsets, extra=()):
+        blocks = set(extra)
+        for offset in offsets:
+            blocks.add(bisect.bisect_right(self._offsets, offset) - 1)
+        return sorted(blocks)
+
+    def _FindIncoming(self, name):
+        if not self._Contains(name) and name == "eof":
+            # Removed with eof.
+            return frozenset()
+        try:
+            offsets = list(self._Find(name.lower().encode("ascii")))
+        except UnicodeEncodeError:
+            return self.Evaluate().GetIncoming(name)
+        # The Kelvin sign is the only non-ASCII character which str.lower
+        # turns into an ASCII letter.
+        if "k" in name and not self._data.isascii():
+            offsets.extend(match.start() for match in _NON_ASCII.finditer(self._data))
+        index = self._index.get(name)
+        incoming = set()
+        for index in self._Blocks(offsets, [index - 1] if index else []):
+            node = self._Annotate(index)
+            for c in node.connections:
+                if c.dst == name:
+                    incoming.add(core.IncomingConnection(node.name, c.kind, c.line_number))
+        return incoming
+
+    # Returns the virtual eof node, or None if the script defines eof or does
+    # not call it (see CallGraph._PruneEof).
+    def _Eof(self):
+        if self._eof is None:
+            self._eof = False
+            if "eof" not in self._index:
+                lower_data = self._LowerData()
+                # Only the lines with a call before eof.
+                offsets = [offset for offset in self._Find(b"eof")
+                           if lower_data.find(b"call", lower_data.rfind(b"\n", 0, offset) + 1, offset) != -1]
+                for index in self._Blocks(offsets):
+                    if any(c.dst == "eof" for c in self._Parse(index).GetConnections("call")):
+                        self._eof = core.Node("eof")
+                        self._eof.is_exit_node = True
+                        break
+        return self._eof or None
@@ -0,0 +1,44 @@
+# Logging setup for cmd-call-graph.
+#
+# All modules log through loggers below the "callgraph" logger. Messages
+# emitted in hot loops (once per line or per connection) are guarded by a
+# level check evaluated once per call, so that when they are disabled no
+# string formatting happens at all.
+
+import logging
+
+LOGGER_NAME = "callgraph"
+
+# Level for very chatty messages, such as one per goto/call found.
+TRACE = 5
+logging.addLevelName(TRACE, "TRACE")
+
+# Logging level for each -v passed on the command line.
+VERBOSITY_LEVELS = [logging.WARNING, logging.INFO, logging.DEBUG, TRACE]
+
+
+def LevelForVerbosity(verbosity):
+    verbosity = max(0, min(verbosity, len(VERBOSITY_LEVELS) - 1))
+    return VERBOSITY_LEVELS[verbosity]
+
+
+# Sends all the messages of the "callgraph" logger at or above the level
+# corresponding to verbosity to stream. Returns the handler, which the caller
+# should pass to Unconfigure once done with stream.
+def Configure(stream, verbosity):
+    logger = logging.getLogger(LOGGER_NAME)
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(LevelForVerbosity(verbosity))
+    logger.propagate = False
+    return handler
+
+
+# Undoes Configure, restoring the default logging behavior.
+def Unconfigure(handler):
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.removeHandler(handler)
+    logger.setLevel(logging.NOTSET)
+    logger.propagate = True
+    handler.flush()
@@ -0,0 +1,118 @@
+# Parallel parsing of a single large script: the input is cut into shards at
+# label lines, the shards are decoded and tokenized in a pool of worker
+# processes, and the results are merged in order into a single call graph.
+#
+# Since every shard starts at a label line, the blocks never span two
+# shards, except for the label redefinitions which are merged exactly like
+# the sequential parser does. The steps which cross block boundaries
+# (nested connections, eof pruning, exit nodes) run after the merge, so the
+# resulting graph is the same as CallGraph.Build's.
+#
+# Workers send back the lines in a compact form (the texts joined in a single
+# string, flags in lists and only the commands of the lines which have some)
+# because pickling CodeLine objects would cost more than parsing. The main
+# process still creates the CodeLine objects, which bounds the speedup; the
+# cyclic garbage collector is paused meanwhile, since the millions of new
+# objects would otherwise trigger many useless full collections.
+
+import bisect
+import collections
+import concurrent.futures
+import gc
+import logging
+import mmap
+
+from . import core
+from . import reader
+from .profiling import NULL_PROFILER
+
+logger = logging.getLogger(__name__)
+
+# Shards smaller than this are not worth sending to a worker.
+MIN_SHARD_SIZE = 1024 * 1024
+
+# Number of shards per worker process, to balance the load when the blocks
+# have very different sizes.
+SHARDS_PER_JOB = 2
+
+# Lines of a shard, tokenized by _ParseShard. See CallGraph._AppendLines for
+# the meaning of the fields; text is the text of all the lines joined by
+# line feeds.
+ShardResult = collections.namedtuple("ShardResult", ["first_line_number", "text", "noops", "terminating",
+                                                     "commands", "labels"])
+
+
+# Returns the shards of buffer as (start offset, end offset, first line
+# number) tuples, cutting it at the label lines closest to num_shards equally
+# sized parts.
+def FindShards(buffer, num_shards):
+    size = len(buffer)
+    num_shards = min(num_shards, size // MIN_SHARD_SIZE)
+    if num_shards <= 1 or reader.HasBareCarriageReturns(buffer):
+        return [(0, size, 1)]
+
+    label_lines = reader.LabelLineOffsets(buffer)
+    offsets = [offset for _, offset in label_lines]
+
+    cuts = []
+    for i in range(1, num_shards):
+        position = bisect.bisect_left(offsets, size * i // num_shards)
+        if position < len(label_lines) and (not cuts or label_lines[position][1] > cuts[-1][1]):
+            cuts.append(label_lines[position])
+
+    shards = []
+    start, first_line_number = 0, 1
+    for line_number, offset in cuts:
+        if offset > start:
+            shards.append((start, offset, first_line_number))
+            start, first_line_number = offset, line_number
+    shards.append((start, size, first_line_number))
+    return shards
+
+
+# Decodes and tokenizes a shard of the file at path. Runs in the worker
+# processes.
+def _ParseShard(task):
+    path, encoding, start, end, first_line_number = task
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        data = buffer[start:end]
+
+    texts, noops, terminating, commands, labels = core.TokenizeLines(reader.IterDecodedLines(data, encoding))
+    return ShardResult(first_line_number, "\n".join(texts), noops, terminating, commands, labels)
+
+
+# Builds the call graph of the file at path like CallGraph.Build, parsing it
+# in shards with jobs worker processes. Small files, and files with lines
+# ended by a bare carriage return, are parsed sequentially.
+def BuildParallel(path, jobs, encoding=None, profiler=NULL_PROFILER):
+    with reader.MappedFile(path, encoding) as f:
+        shards = FindShards(f.buffer, jobs * SHARDS_PER_JOB)
+        if len(shards) <= 1:
+            logger.info("Parsing %s sequentially", path)
+            return core.CallGraph.Build(f, profiler=profiler)
+
+    logger.info("Parsing %s in %d shards with %d processes", path, len(shards), jobs)
+    tasks = [(path, encoding, start, end, first_line_number) for start, end, first_line_number in shards]
+
+    with profiler.Phase("parse") as phase:
+        call_graph = core.CallGraph._NewGraph()
+        cur_node = call_graph.first_node
+        command_lines = collections.defaultdict(list)
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+                for shard in executor.map(_ParseShard, tasks):
+                    texts = shard.text.split("\n") if shard.noops else []
+                    cur_node = call_graph._AppendLines(cur_node, shard.first_line_number, texts, shard.noops,
+                                                       shard.terminating, shard.commands, shard.labels,
+                                                       command_lines)
+        finally:
+            if gc_enabled:
+                gc.enable()
+        call_graph._SetSummaries(command_lines)
+        phase["lines"] = sum(node.loc for node in call_graph.nodes.values())
+        phase["nodes"] = len(call_graph.nodes)
+
+    call_graph._PostProcess(profiler)
+    return call_graph
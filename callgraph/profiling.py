@@ -0,0 +1,107 @@
+# Per-phase instrumentation of the processing: wall time, amount of data
+# processed, throughput and peak allocated memory of each phase.
+#
+# Usage:
+#
+#     profiler = Profiler(on_phase=callback)
+#     call_graph = CallGraph.Build(input_file, profiler=profiler)
+#     with profiler.Phase("render") as phase:
+#         PrintDot(call_graph, out_file)
+#         phase["nodes"] = len(call_graph.nodes)
+#     profiler.Close()
+#     print(profiler.Report())
+#
+# Memory is measured with tracemalloc, which slows down the processing
+# noticeably; pass trace_memory=False to only measure the time.
+
+import collections
+import contextlib
+import json
+import time
+import tracemalloc
+
+# Statistics about a phase. lines and nodes are None if they don't apply to
+# the phase; peak_memory_bytes is None if memory is not traced.
+PhaseStats = collections.namedtuple("PhaseStats", ["name", "seconds", "lines", "nodes", "peak_memory_bytes"])
+
+
+class Profiler:
+    # on_phase, if set, is called with the PhaseStats of each phase as soon as
+    # the phase ends.
+    def __init__(self, trace_memory=True, on_phase=None):
+        self.trace_memory = trace_memory
+        self.on_phase = on_phase
+        self.phases = []
+        self._started_tracing = False
+
+    # Context manager measuring a phase. The dictionary it returns can be
+    # used to record the number of "lines" and "nodes" processed.
+    @contextlib.contextmanager
+    def Phase(self, name):
+        counts = {}
+        baseline = 0
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+
+        start = time.perf_counter()
+        yield counts
+        seconds = time.perf_counter() - start
+
+        peak = None
+        if self.trace_memory:
+            peak = max(0, tracemalloc.get_traced_memory()[1] - baseline)
+
+        stats = PhaseStats(name, seconds, counts.get("lines"), counts.get("nodes"), peak)
+        self.phases.append(stats)
+        if self.on_phase:
+            self.on_phase(stats)
+
+    # Stops tracing the memory, if this profiler started it.
+    def Close(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def ToDict(self):
+        phases = []
+        for stats in self.phases:
+            phase = stats._asdict()
+            if stats.lines is not None and stats.seconds > 0:
+                phase["lines_per_second"] = stats.lines / stats.seconds
+            phases.append(phase)
+        return dict(phases=phases, total_seconds=sum(stats.seconds for stats in self.phases))
+
+    def ToJson(self):
+        return json.dumps(self.ToDict(), indent=2)
+
+    # Returns a human-readable table of the phases.
+    def Report(self):
+        rows = ["{:<20} {:>10} {:>10} {:>8} {:>12} {:>14}".format(
+            "phase", "time (ms)", "lines", "nodes", "lines/s", "peak mem (KB)")]
+        for phase in self.ToDict()["phases"]:
+            rows.append("{:<20} {:>10.1f} {:>10} {:>8} {:>12} {:>14}".format(
+                phase["name"], phase["seconds"] * 1000,
+                _OrDash(phase["lines"]), _OrDash(phase["nodes"]),
+                _OrDash(phase.get("lines_per_second"), "{:.0f}"),
+                _OrDash(phase["peak_memory_bytes"], "{:.0f}", 1 / 1024)))
+        rows.append("{:<20} {:>10.1f}".format("total", sum(p.seconds for p in self.phases) * 1000))
+        return "\n".join(rows)
+
+
+def _OrDash(value, fmt="{}", scale=1):
+    if value is None:
+        return "-"
+    return fmt.format(value * scale)
+
+
+# Profiler doing nothing, used when no profiling is requested.
+class NullProfiler:
+    def Phase(self, name):
+        return contextlib.nullcontext({})
+
+
+NULL_PROFILER = NullProfiler()
@@ -0,0 +1,243 @@
+# Whole-project call graphs: follows the external calls of a script (e.g.,
+# "call tools\sign.cmd") into the scripts they refer to, and links the call
+# graphs of all the scripts into a single graph.
+#
+# Each script is built exactly once, even if it is called from several
+# places or if scripts call each other in a cycle. The scripts found at the
+# same depth are built in parallel.
+
+import concurrent.futures
+import logging
+import os
+
+from . import cache
+from . import core
+from . import reader
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_EXTENSIONS = (".cmd", ".bat")
+
+# Separator between the file name and the label in the names of the nodes of
+# the linked graph, e.g. "tools/sign.cmd:main".
+NAME_SEPARATOR = ":"
+
+
+# Returns the entry of directory whose name matches name case-insensitively,
+# or None. CMD is case-insensitive, and the tokenizer lowercases everything,
+# so calls need to be matched this way on case-sensitive file systems.
+def _FindEntry(directory, name, listings):
+    if os.path.exists(os.path.join(directory, name)):
+        return name
+    if directory not in listings:
+        try:
+            listings[directory] = {entry.lower(): entry for entry in os.listdir(directory)}
+        except OSError:
+            listings[directory] = {}
+    return listings[directory].get(name.lower())
+
+
+def _FindFile(directory, relative_path, listings):
+    path = directory
+    for part in relative_path.split("/"):
+        if part in ("", "."):
+            continue
+        if part == "..":
+            path = os.path.dirname(path)
+            continue
+        entry = _FindEntry(path, part, listings)
+        if entry is None:
+            return None
+        path = os.path.join(path, entry)
+    return path if os.path.isfile(path) else None
+
+
+# Resolves the target of an external call found in the script at
+# calling_path to the path of a script, or returns None if it cannot be
+# resolved (e.g., it's an executable, or its name is built dynamically).
+# Targets are searched relative to the directory of the calling script, then
+# in each directory of search_path. listings caches directory listings.
+def ResolveCall(target, calling_path, search_path=(), listings=None):
+    if listings is None:
+        listings = {}
+
+    target = target.strip('"')
+    calling_dir = os.path.dirname(os.path.abspath(calling_path))
+
+    # %~dp0 expands to the directory of the calling script (with a trailing
+    # backslash).
+    if target.startswith("%~dp0"):
+        target = target[len("%~dp0"):]
+        search_dirs = [calling_dir]
+    else:
+        search_dirs = [calling_dir] + list(search_path)
+
+    if not target or "%" in target or "!" in target:
+        return None
+
+    target = target.replace("\\", "/")
+    extension = os.path.splitext(target)[1]
+    if extension in SCRIPT_EXTENSIONS:
+        candidates = [target]
+    elif not extension:
+        candidates = [target + ext for ext in SCRIPT_EXTENSIONS]
+    else:
+        return None
+
+    if os.path.isabs(target):
+        for candidate in candidates:
+            if os.path.isfile(candidate):
+                return os.path.normpath(candidate)
+        return None
+
+    for directory in search_dirs:
+        for candidate in candidates:
+            path = _FindFile(directory, candidate, listings)
+            if path is not None:
+                return os.path.normpath(os.path.abspath(path))
+    return None
+
+
+# Builds the call graph of a single script. Runs in the worker processes.
+# Returns the call graph and None, or None and the error if the script
+# cannot be read or decoded.
+def _BuildFile(task):
+    path, cache_options, (encoding, use_mmap) = task
+    try:
+        if cache_options is not None:
+            return cache.GetProcessCache(*cache_options).BuildFile(path, encoding), None
+        with reader.OpenInput(path, encoding, use_mmap) as f:
+            return core.CallGraph.Build(f), None
+    except (IOError, LookupError, ValueError) as e:
+        return None, e
+
+
+# Returns the external calls of call_graph as (node name, line number,
+# target) tuples, in a deterministic order.
+def _ExternalCalls(call_graph):
+    calls = []
+    for node in call_graph.nodes.values():
+        for line_number, target in node.summary.external_calls:
+            calls.append((node.name, line_number, target))
+    return sorted(calls)
+
+
+class ProjectGraph:
+    def __init__(self, entry_path):
+        self.entry_path = entry_path
+        # Call graph of each script, by absolute path.
+        self.graphs = {}
+        # Resolved external calls, as (src path, src node, line number,
+        # dst path) tuples.
+        self.links = []
+        # External calls which could not be resolved, as (src path, src node,
+        # line number, target) tuples. This includes the calls to scripts
+        # which could not be read or decoded.
+        self.unresolved = []
+        # Errors of the called scripts which could not be read or decoded, by
+        # absolute path.
+        self.errors = {}
+
+    # Builds the call graphs of the script at entry_path and of all the
+    # scripts it calls, directly or indirectly. jobs is the number of worker
+    # processes; cache_dir, if set, is the directory of a cache.ParseCache.
+    # encoding and use_mmap are passed to reader.OpenInput. Only the errors
+    # of the entry script are raised: a called script which cannot be read
+    # or decoded is logged, and the calls to it are left unresolved.
+    @staticmethod
+    def Build(entry_path, search_path=(), jobs=1, cache_dir=None, cache_max_size=cache.DEFAULT_MAX_SIZE,
+              encoding=None, use_mmap=False):
+        entry_path = os.path.normpath(os.path.abspath(entry_path))
+        project = ProjectGraph(entry_path)
+        cache_options = (cache_dir, cache_max_size) if cache_dir is not None else None
+        listings = {}
+
+        executor = None
+        if jobs > 1:
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+
+        # External calls, as (src path, src node, line number, target, dst
+        # path) tuples, with a dst path of None if the target is not resolved.
+        calls = []
+        try:
+            frontier = [entry_path]
+            seen = set(frontier)
+            while frontier:
+                tasks = [(path, cache_options, (encoding, use_mmap)) for path in frontier]
+                if executor is not None and len(tasks) > 1:
+                    results = list(executor.map(_BuildFile, tasks))
+                else:
+                    results = [_BuildFile(task) for task in tasks]
+
+                next_frontier = []
+                for path, (call_graph, error) in zip(frontier, results):
+                    if error is not None:
+                        if path == entry_path:
+                            raise error
+                        logger.warning("Cannot build %s, the calls to it are left unresolved: %s", path, error)
+                        project.errors[path] = error
+                        continue
+                    logger.info("Built %s (%d nodes)", path, len(call_graph.nodes))
+                    project.graphs[path] = call_graph
+                    for node_name, line_number, target in _ExternalCalls(call_graph):
+                        resolved = ResolveCall(target, path, search_path, listings)
+                        calls.append((path, node_name, line_number, target, resolved))
+                        if resolved is not None and resolved not in seen:
+                            seen.add(resolved)
+                            next_frontier.append(resolved)
+                frontier = next_frontier
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        for path, node_name, line_number, target, resolved in calls:
+            if resolved is None or resolved in project.errors:
+                project.unresolved.append((path, node_name, line_number, target))
+            else:
+                project.links.append((path, node_name, line_number, resolved))
+        return project
+
+    # Returns the name used for path in the linked graph: the path relative
+    # to the directory of the entry script, with forward slashes.
+    def FileName(self, path):
+        base = os.path.dirname(self.entry_path)
+        try:
+            path = os.path.relpath(path, base)
+        except ValueError:
+            # On Windows, path is on a different drive.
+            pass
+        return path.replace(os.sep, "/")
+
+    # Returns a single core.CallGraph with the nodes of all the scripts,
+    # named "<file name>:<label>". External calls between scripts become
+    # "call" connections to the first node of the called script.
+    def Link(self):
+        linked = core.CallGraph()
+        prefixes = {path: self.FileName(path) + NAME_SEPARATOR for path in self.graphs}
+
+        for path in sorted(self.graphs):
+            call_graph = self.graphs[path]
+            prefix = prefixes[path]
+            for node in call_graph.OrderedNodes():
+                linked.AddNode(_QualifiedCopy(node, prefix))
+            if path == self.entry_path:
+                linked.first_node = linked.nodes[prefix + call_graph.first_node.name]
+
+        for src_path, node_name, line_number, dst_path in self.links:
+            src = linked.nodes.get(prefixes[src_path] + node_name)
+            dst_graph = self.graphs[dst_path]
+            if src is None or dst_graph.first_node is None:
+                continue
+            linked.AddConnection(src, prefixes[dst_path] + dst_graph.first_node.name, "call", line_number)
+
+        return linked
+
+
+# Returns a copy of node, with prefix prepended to its name and to the names
+# of the destinations of its connections. The code is shared with node.
+def _QualifiedCopy(node, prefix):
+    copy = node.Copy(prefix + node.name)
+    copy.original_name = prefix + node.original_name
+    for connection in node.connections:
+        copy.AddConnection(prefix + connection.dst, connection.kind, connection.line_number)
+    return copy
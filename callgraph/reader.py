@@ -0,0 +1,163 @@
+# Input path working on raw bytes: the file is memory-mapped and decoded in
+# large chunks at once instead of going through a text-mode file object line
+# by line. Reading the lines this way is slower than with a text-mode file
+# object (see benchmarks/reader.py); what is faster is scanning the raw bytes
+# for labels (see ScanLabels), without decoding them.
+#
+# Chunks are always cut right after a line feed, which is only possible
+# because batch files use ASCII-compatible encodings (UTF-8 and the legacy
+# code pages, e.g. cp437, cp850, cp1252 or cp932), where the byte 0x0a is
+# never part of a multi-byte character. Other encodings (e.g., UTF-16) are
+# rejected.
+#
+# The lines are the same that iterating open(path, "r", encoding=encoding)
+# would produce (universal newlines: "\n", "\r\n" and "\r" all end a line),
+# without the line terminators.
+
+import codecs
+import collections
+import itertools
+import locale
+import mmap
+import re
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Label defined at a line of the input. name is the label as written in the
+# code, i.e. not lowercased.
+Label = collections.namedtuple("Label", ["line_number", "name"])
+
+# Same rules as CallGraph._ParseSource: a line starting with ":" (after
+# whitespace) but not with "::", whose first word is the label. Labels are
+# searched after each line feed, which is much faster than matching the
+# start of every line; the first line is matched separately.
+_LABEL = rb"[ \t\r\x0b\x0c]*:(?!:)[ \t\x0b\x0c]*([^\s]+)"
+_LABEL_RE = re.compile(rb"\n" + _LABEL)
+_FIRST_LABEL_RE = re.compile(_LABEL)
+
+
+# Returns the name of encoding (the locale's preferred encoding if None, as
+# for open()), or raises ValueError if it cannot be read by chunks.
+def CheckEncoding(encoding=None):
+    if encoding is None:
+        encoding = locale.getpreferredencoding(False)
+    name = codecs.lookup(encoding).name
+    sample = b"\r\n:label\n"
+    try:
+        compatible = sample.decode(name) == sample.decode("ascii")
+    except UnicodeDecodeError:
+        compatible = False
+    if not compatible:
+        raise ValueError("encoding {} is not supported: it must be ASCII-compatible".format(encoding))
+    return name
+
+
+# Yields the lines of buffer (bytes, or any object supporting slicing like an
+# mmap) in lists, decoding it with encoding chunk_size bytes at a time.
+def IterDecodedChunks(buffer, encoding=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    decoder = codecs.getincrementaldecoder(CheckEncoding(encoding))()
+    size = len(buffer)
+    start = 0
+    while start < size:
+        end = min(start + chunk_size, size)
+        if end < size:
+            newline = buffer.rfind(b"\n", start, end)
+            if newline < 0:
+                # A line longer than chunk_size: extend the chunk up to the
+                # end of the line.
+                newline = buffer.find(b"\n", end)
+                if newline < 0:
+                    newline = size - 1
+            end = newline + 1
+
+        text = decoder.decode(buffer[start:end], end == size)
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        lines = text.split("\n")
+        # The chunk ends with a line feed, except possibly at the end of the
+        # input; either way the last element is not a complete line unless
+        # it is non-empty.
+        if lines[-1] == "":
+            lines.pop()
+        yield lines
+        start = end
+
+
+# Returns an iterator over the lines of buffer (see IterDecodedChunks).
+def IterDecodedLines(buffer, encoding=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    return itertools.chain.from_iterable(IterDecodedChunks(buffer, encoding, chunk_size))
+
+
+# Memory-mapped input file. Like a text-mode file object, it is an iterable
+# of lines (without line terminators, though) and must be closed.
+class MappedFile:
+    def __init__(self, path, encoding=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.encoding = CheckEncoding(encoding)
+        self.chunk_size = chunk_size
+        self._file = open(path, "rb")
+        try:
+            self.buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped.
+            self.buffer = b""
+
+    def __iter__(self):
+        return IterDecodedLines(self.buffer, self.encoding, self.chunk_size)
+
+    def ScanLabels(self):
+        return ScanLabels(self.buffer, self.encoding)
+
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Opens the file at path for reading its lines, either memory-mapping it
+# (see MappedFile) or as a regular text-mode file object.
+def OpenInput(path, encoding=None, use_mmap=False):
+    if use_mmap:
+        return MappedFile(path, encoding)
+    return open(path, "r", encoding=encoding)
+
+
+# Yields (line number, offset of the line, match) for each label line of
+# buffer. Line numbers count line feeds, so they are only accurate for files
+# with "\n" or "\r\n" line endings (see HasBareCarriageReturns).
+def _IterLabelLines(buffer):
+    match = _FIRST_LABEL_RE.match(buffer)
+    if match:
+        yield 1, 0, match
+
+    line_number = 1
+    position = 0
+    for match in _LABEL_RE.finditer(buffer):
+        # match starts at the line feed ending the previous line.
+        line_number += buffer[position:match.start()].count(b"\n") + 1
+        position = match.start() + 1
+        yield line_number, position, match
+
+
+# Returns the labels defined in buffer (bytes or mmap), as a list of Label,
+# without decoding anything but the label names.
+def ScanLabels(buffer, encoding=None):
+    encoding = CheckEncoding(encoding)
+    return [Label(line_number, match.group(1).decode(encoding))
+            for line_number, _, match in _IterLabelLines(buffer)]
+
+
+# Returns the (line number, offset) of the start of each label line of buffer.
+def LabelLineOffsets(buffer):
+    return [(line_number, offset) for line_number, offset, _ in _IterLabelLines(buffer)]
+
+
+# Returns True if buffer contains lines ended by a carriage return alone,
+# whose line numbers cannot be computed by counting line feeds.
+def HasBareCarriageReturns(buffer):
+    return re.search(rb"\r(?!\n)", buffer) is not None
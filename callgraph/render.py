@@ -1,8 +1,17 @@
 from __future__ import print_function
 
+import collections
+import gzip
+import json
+import logging
 import sys
+from xml.sax.saxutils import escape, quoteattr
 
 from . import core
+from . import layout
+from .log import TRACE
+
+logger = logging.getLogger(__name__)
 
 def _Escape(input_string):
     return input_string.replace("%", r"\%")
@@ -13,9 +22,20 @@ COLORS = {
     'nested':       '"#008575"',  # Teal
     'call':         '"#0078d4"',  # Blue
     'terminating':  '"#e6e6e6"',  # Light gray
+    'unreachable':  '"#737373"',  # Dark gray
 }
 
-def PrintDot(call_graph, out_file=sys.stdout, log_file=sys.stderr, show_all_calls=True, show_node_stats=False, nodes_to_hide=None, represent_node_size=False, min_node_size=3, max_node_size=7, font_scale_factor=7):
+# Size of the blocks in which the DOT code is written by PrintDot.
+DEFAULT_BLOCK_SIZE = 1 << 20
+
+
+# Generates the DOT code for call_graph as a sequence of text chunks (one
+# per statement), so that it can be streamed anywhere without building the
+# whole document in memory.
+# If analysis (an analysis.Analysis of call_graph) is set, unreachable nodes
+# are dashed, nodes in cycles are marked as [recursive] or [loop] and the
+# connections inside cycles are drawn in bold.
+def GenerateDot(call_graph, show_all_calls=True, show_node_stats=False, nodes_to_hide=None, represent_node_size=False, min_node_size=3, max_node_size=7, font_scale_factor=7, analysis=None):
     if min_node_size > max_node_size:
         min_node_size, max_node_size = max_node_size, min_node_size
 
@@ -25,29 +45,35 @@ def PrintDot(call_graph, out_file=sys.stdout, log_file=sys.stderr, show_all_call
     if min_node_size < 1:
         min_node_size = 1
     
-    # Output the DOT code.
-    print(u"digraph g {", file=out_file)
+    trace = logger.isEnabledFor(TRACE)
 
-    max_node_loc = 0
+    unreachable = set()
+    cycle_of = {}
+    if analysis is not None:
+        unreachable = set(node.name for node in analysis.unreachable)
+        for cycle in analysis.cycles:
+            for member in cycle.nodes:
+                cycle_of[member] = cycle
 
-    for node in sorted(call_graph.nodes.values()):
-        if nodes_to_hide and (node.name in nodes_to_hide):
-            continue
-        
-        if node.loc > max_node_loc:
-            max_node_loc = node.loc
+    # Output the DOT code.
+    yield u"digraph g {\n"
 
-    for node in sorted(call_graph.nodes.values()):
-        if nodes_to_hide and (node.name in nodes_to_hide):
-            print(u"Skipping node {0}".format(node.name), file=log_file)
-            continue
+    nodes = _VisibleNodes(call_graph, nodes_to_hide)
+
+    max_node_loc = 0
+    if represent_node_size:
+        for node in nodes:
+            if node.loc > max_node_loc:
+                max_node_loc = node.loc
 
+    for node in nodes:
         name = node.name
         pretty_name = name
         if node.original_name != "":
             pretty_name = node.original_name
 
-        print(u"Processing node {0} (using name: {1})".format(node.name, pretty_name), file=log_file)
+        if trace:
+            logger.log(TRACE, "Processing node %s (using name: %s)", node.name, pretty_name)
 
         attributes = []
         label_lines = ["<b>{}</b>".format(pretty_name)]
@@ -57,8 +83,7 @@ def PrintDot(call_graph, out_file=sys.stdout, log_file=sys.stderr, show_all_call
 
         if show_node_stats:
             label_lines.append("<sub>[{} LOC]</sub>".format(node.loc))
-            command_count = node.GetCommandCount()
-            external_call_count = command_count["external_call"]
+            external_call_count = node.summary.Count("external_call")
 
             if external_call_count > 0:
                 text = "call" if external_call_count == 1 else "calls"
@@ -66,8 +91,19 @@ def PrintDot(call_graph, out_file=sys.stdout, log_file=sys.stderr, show_all_call
 
         if node.is_exit_node:
             attributes.append("color={}".format(COLORS["terminating"]))
-            attributes.append("style=filled")
+            attributes.append("style=\"filled,dashed\"" if name in unreachable else "style=filled")
             label_lines.append("<sub>[terminating]</sub>")
+        elif name in unreachable:
+            attributes.append("style=dashed")
+
+        if name in unreachable:
+            attributes.append("fontcolor={}".format(COLORS["unreachable"]))
+            label_lines.append("<sub>[unreachable]</sub>")
+
+        cycle = cycle_of.get(name)
+        if cycle is not None:
+            attributes.append("peripheries=2")
+            label_lines.append("<sub>[recursive]</sub>" if cycle.recursive else "<sub>[loop]</sub>")
 
         attributes.append("label=<{}>".format("<br/>".join(label_lines)))
 
@@ -82,24 +118,377 @@ def PrintDot(call_graph, out_file=sys.stdout, log_file=sys.stderr, show_all_call
             attributes.append("fontsize={}".format(nw * font_scale_factor))
 
         if attributes:
-            print(u"\"{}\" [{}]".format(name, ",".join(attributes)), file=out_file)
-
-        # De-duplicate connections by line number if show_all_calls is set to
-        # False.
-        connections = node.connections
-        if not show_all_calls:
-            connections = list(set(core.Connection(c.dst, c.kind, core.NO_LINE_NUMBER) for c in connections))
-
-        for c in sorted(connections):
-            # Remove EOF connections if necessary.
-            if nodes_to_hide and (c.dst in nodes_to_hide):
-                print(u"Skipping connection to node {0}".format(c.dst), file=log_file)
-                continue
+            yield u"\"{}\" [{}]\n".format(name, ",".join(attributes))
+
+        for c in _VisibleConnections(node, show_all_calls, nodes_to_hide, trace):
             label = "\" {}\"".format(c.kind)
             if c.line_number != core.NO_LINE_NUMBER:
                 label = "<<b>{}</b><br />(line {})>".format(c.kind, c.line_number)
             src_escaped_name = _Escape(name)
             dst_escaped_name = _Escape(c.dst)
-            print(u"\"{}\" -> \"{}\" [label={},color={}]".format(src_escaped_name, dst_escaped_name, label, COLORS[c.kind]), file=out_file)
+            extra = ""
+            if cycle is not None and cycle_of.get(c.dst) is cycle:
+                extra = ",penwidth=3"
+            yield u"\"{}\" -> \"{}\" [label={},color={}{}]\n".format(src_escaped_name, dst_escaped_name, label, COLORS[c.kind], extra)
+
+    yield u"}\n"
+
+
+# Returns the nodes of call_graph which are not in nodes_to_hide, sorted by
+# name.
+def _VisibleNodes(call_graph, nodes_to_hide):
+    nodes = []
+    for node in sorted(call_graph.nodes.values()):
+        if nodes_to_hide and (node.name in nodes_to_hide):
+            logger.debug("Skipping node %s", node.name)
+            continue
+        nodes.append(node)
+    return nodes
+
+
+# Returns the connections of node to be rendered, sorted. Connections are
+# de-duplicated by line number if show_all_calls is False.
+def _VisibleConnections(node, show_all_calls, nodes_to_hide, trace=False):
+    connections = node.connections
+    if not show_all_calls:
+        connections = set(core.Connection(c.dst, c.kind, core.NO_LINE_NUMBER) for c in connections)
+
+    visible = []
+    for c in sorted(connections):
+        # Remove EOF connections if necessary.
+        if nodes_to_hide and (c.dst in nodes_to_hide):
+            if trace:
+                logger.log(TRACE, "Skipping connection to node %s", c.dst)
+            continue
+        visible.append(c)
+    return visible
+
+
+def _LineNumberOrNone(line_number):
+    return None if line_number == core.NO_LINE_NUMBER else line_number
+
+
+# The machine-readable formats below take the same options as GenerateDot;
+# the options which only affect the DOT drawing (represent_node_size,
+# min_node_size, max_node_size, font_scale_factor, analysis) are accepted and
+# ignored.
+# Node statistics (loc, external_calls) are only output if show_node_stats is
+# set.
+
+# Generates call_graph as a JSON document:
+#   {"nodes": [{"name": ..., "original_name": ..., "line_number": ...,
+#               "is_exit_node": ..., "is_last_node": ...}, ...],
+#    "edges": [{"src": ..., "dst": ..., "kind": ..., "line_number": ...}, ...]}
+# line_number is null for virtual nodes and de-duplicated connections. Nodes
+# and edges are sorted, one per chunk.
+def GenerateJson(call_graph, show_all_calls=True, show_node_stats=False, nodes_to_hide=None, **layout_options):
+    nodes = _VisibleNodes(call_graph, nodes_to_hide)
+
+    yield u'{"nodes": [\n'
+    separator = u""
+    for node in nodes:
+        entry = collections.OrderedDict([
+            ("name", node.name),
+            ("original_name", node.original_name or node.name),
+            ("line_number", _LineNumberOrNone(node.line_number)),
+            ("is_exit_node", node.is_exit_node),
+            ("is_last_node", node.is_last_node),
+        ])
+        if show_node_stats:
+            entry["loc"] = node.loc
+            entry["external_calls"] = node.summary.Count("external_call")
+        yield separator + json.dumps(entry)
+        separator = u",\n"
+
+    yield u'\n], "edges": [\n'
+    separator = u""
+    for node in nodes:
+        for c in _VisibleConnections(node, show_all_calls, nodes_to_hide):
+            entry = collections.OrderedDict([
+                ("src", node.name),
+                ("dst", c.dst),
+                ("kind", c.kind),
+                ("line_number", _LineNumberOrNone(c.line_number)),
+            ])
+            yield separator + json.dumps(entry)
+            separator = u",\n"
+    yield u"\n]}\n"
+
+
+_GRAPHML_KEYS = [
+    # id, for, name, type
+    ("original_name", "node", "original_name", "string"),
+    ("line_number", "node", "line_number", "int"),
+    ("is_exit_node", "node", "is_exit_node", "boolean"),
+    ("is_last_node", "node", "is_last_node", "boolean"),
+    ("loc", "node", "loc", "int"),
+    ("external_calls", "node", "external_calls", "int"),
+    ("kind", "edge", "kind", "string"),
+    ("edge_line_number", "edge", "line_number", "int"),
+]
+
+
+def _GraphMLData(key, value):
+    if isinstance(value, bool):
+        value = "true" if value else "false"
+    return u'<data key="{}">{}</data>'.format(key, escape(str(value)))
+
+
+# Generates call_graph as a GraphML document, with the same attributes as
+# GenerateJson. line_number is omitted for virtual nodes and de-duplicated
+# connections.
+def GenerateGraphML(call_graph, show_all_calls=True, show_node_stats=False, nodes_to_hide=None, **layout_options):
+    yield u'<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield u'<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+    for key, domain, name, attr_type in _GRAPHML_KEYS:
+        yield u'<key id="{}" for="{}" attr.name="{}" attr.type="{}"/>\n'.format(key, domain, name, attr_type)
+    yield u'<graph id="G" edgedefault="directed">\n'
+
+    nodes = _VisibleNodes(call_graph, nodes_to_hide)
+    for node in nodes:
+        data = [_GraphMLData("original_name", node.original_name or node.name)]
+        if node.line_number != core.NO_LINE_NUMBER:
+            data.append(_GraphMLData("line_number", node.line_number))
+        data.append(_GraphMLData("is_exit_node", node.is_exit_node))
+        data.append(_GraphMLData("is_last_node", node.is_last_node))
+        if show_node_stats:
+            data.append(_GraphMLData("loc", node.loc))
+            data.append(_GraphMLData("external_calls", node.summary.Count("external_call")))
+        yield u"<node id={}>{}</node>\n".format(quoteattr(node.name), "".join(data))
+
+    # GraphML requires the targets of the edges to be declared as nodes, so
+    # the targets which are not blocks of the script (e.g., "goto %label%",
+    # or a call to a missing label) get a node with just their name.
+    names = set(node.name for node in nodes)
+    dangling = set()
+    for node in nodes:
+        for c in node.connections:
+            if c.dst not in names and not (nodes_to_hide and c.dst in nodes_to_hide):
+                dangling.add(c.dst)
+    for name in sorted(dangling):
+        yield u"<node id={}>{}</node>\n".format(quoteattr(name), _GraphMLData("original_name", name))
+
+    for node in nodes:
+        for c in _VisibleConnections(node, show_all_calls, nodes_to_hide):
+            data = [_GraphMLData("kind", c.kind)]
+            if c.line_number != core.NO_LINE_NUMBER:
+                data.append(_GraphMLData("edge_line_number", c.line_number))
+            yield u"<edge source={} target={}>{}</edge>\n".format(quoteattr(node.name), quoteattr(c.dst), "".join(data))
+
+    yield u"</graph>\n</graphml>\n"
+
+
+EDGE_LIST_HEADER = u"# cmd-call-graph edgelist 1\n"
+
+
+# Generates call_graph as a compact, tab-separated edge list which can be
+# loaded with a single split per line. After a header line, there is one
+# line per node:
+#   N <name> <original name> <line number> <is exit node> <is last node> [<loc> <external calls>]
+# followed by one line per connection:
+#   E <src> <dst> <kind> <line number>
+# Line numbers are -1 for virtual nodes and de-duplicated connections, flags
+# are 0 or 1, and the statistics are only present if show_node_stats is set.
+# Label names cannot contain whitespace, so no escaping is needed.
+def GenerateEdgeList(call_graph, show_all_calls=True, show_node_stats=False, nodes_to_hide=None, **layout_options):
+    yield EDGE_LIST_HEADER
+
+    nodes = _VisibleNodes(call_graph, nodes_to_hide)
+    for node in nodes:
+        fields = ["N", node.name, node.original_name or node.name, str(node.line_number),
+                  "1" if node.is_exit_node else "0", "1" if node.is_last_node else "0"]
+        if show_node_stats:
+            fields.append(str(node.loc))
+            fields.append(str(node.summary.Count("external_call")))
+        yield u"\t".join(fields) + u"\n"
+
+    for node in nodes:
+        for c in _VisibleConnections(node, show_all_calls, nodes_to_hide):
+            yield u"E\t{}\t{}\t{}\t{}\n".format(node.name, c.dst, c.kind, c.line_number)
+
+
+# Approximate size of the characters of the SVG labels, used to size the
+# nodes without measuring the text.
+SVG_FONT_SIZE = 12
+SVG_CHAR_WIDTH = 7
+SVG_LINE_HEIGHT = 15
+SVG_PADDING = 8
+SVG_EDGE_SPACING = 6
+
+
+def _SvgColor(kind):
+    return COLORS[kind].strip('"')
+
+
+# Returns the lines of the SVG label of node.
+def _SvgLabel(node, show_node_stats):
+    lines = [node.original_name or node.name]
+    if node.line_number != core.NO_LINE_NUMBER:
+        lines.append("(line {})".format(node.line_number))
+    if show_node_stats:
+        lines.append("[{} LOC]".format(node.loc))
+        external_call_count = node.summary.Count("external_call")
+        if external_call_count > 0:
+            lines.append("[{} external {}]".format(external_call_count, "call" if external_call_count == 1 else "calls"))
+    if node.is_exit_node:
+        lines.append("[terminating]")
+    return lines
+
+
+# Returns the SVG path of a connection from the box src to the box dst.
+# Connections going down leave from the bottom of src and enter the top of
+# dst; the others (towards nodes defined earlier) are drawn as arcs on the
+# right side of both nodes. offset separates parallel connections.
+def _SvgEdgePath(src, dst, offset=0):
+    if src is dst:
+        x = src.x + src.width / 2.0 + offset
+        return "M{:.1f},{:.1f} C{:.1f},{:.1f} {:.1f},{:.1f} {:.1f},{:.1f}".format(
+            x, src.y - 4, x + 30, src.y - 20, x + 30, src.y + 20, x, src.y + 4)
+    if dst.layer > src.layer:
+        x1, y1 = src.x + offset, src.y + src.height / 2.0
+        x2, y2 = dst.x + offset, dst.y - dst.height / 2.0
+        bend = (y2 - y1) / 2.0
+        return "M{:.1f},{:.1f} C{:.1f},{:.1f} {:.1f},{:.1f} {:.1f},{:.1f}".format(
+            x1, y1, x1, y1 + bend, x2, y2 - bend, x2, y2)
+    x1, y1 = src.x + src.width / 2.0, src.y + offset
+    x2, y2 = dst.x + dst.width / 2.0, dst.y + offset
+    bend = 40 + abs(y1 - y2) / 4.0 + offset
+    return "M{:.1f},{:.1f} C{:.1f},{:.1f} {:.1f},{:.1f} {:.1f},{:.1f}".format(
+        x1, y1, x1 + bend, y1, x2 + bend, y2, x2, y2)
+
+
+# Generates an SVG drawing of call_graph, laid out with layout.Layered
+# instead of Graphviz, so that it works without external programs and
+# scales to graphs with many thousands of nodes. Colors are the same as in
+# the DOT output; kinds and line numbers of the connections are shown as
+# tooltips. The options are the same as GenerateDot's, but only
+# show_all_calls, show_node_stats and nodes_to_hide are used.
+def GenerateSvg(call_graph, show_all_calls=True, show_node_stats=False, nodes_to_hide=None, **layout_options):
+    # Definition order, with the virtual nodes last.
+    nodes = sorted(_VisibleNodes(call_graph, nodes_to_hide),
+                   key=lambda node: (node.line_number == core.NO_LINE_NUMBER, node.line_number, node.name))
+    index = {node.name: i for i, node in enumerate(nodes)}
+
+    labels = []
+    sizes = []
+    for node in nodes:
+        lines = _SvgLabel(node, show_node_stats)
+        labels.append(lines)
+        sizes.append((max(len(line) for line in lines) * SVG_CHAR_WIDTH + 2 * SVG_PADDING,
+                      len(lines) * SVG_LINE_HEIGHT + 2 * SVG_PADDING))
+
+    connections = []
+    for i, node in enumerate(nodes):
+        for c in _VisibleConnections(node, show_all_calls, nodes_to_hide):
+            if c.dst in index:
+                connections.append((i, index[c.dst], c))
+
+    drawing = layout.Layered(sizes, [(src, dst) for src, dst, _ in connections])
+
+    yield (u'<?xml version="1.0" encoding="UTF-8"?>\n'
+           u'<svg xmlns="http://www.w3.org/2000/svg" width="{0:.0f}" height="{1:.0f}" viewBox="0 0 {0:.0f} {1:.0f}" '
+           u'font-family="sans-serif" font-size="{2}">\n').format(drawing.width, drawing.height, SVG_FONT_SIZE)
+    yield u"<defs>\n"
+    for kind in ["call", "goto", "nested"]:
+        yield (u'<marker id="arrow-{0}" viewBox="0 0 10 10" refX="10" refY="5" markerWidth="8" markerHeight="8" '
+               u'orient="auto"><path d="M0,0 L10,5 L0,10 z" fill="{1}"/></marker>\n').format(kind, _SvgColor(kind))
+    yield u"</defs>\n"
+
+    yield u'<g fill="none" stroke-width="1.5">\n'
+    parallel = collections.Counter()
+    for src, dst, c in connections:
+        offset = SVG_EDGE_SPACING * parallel[src, dst]
+        parallel[src, dst] += 1
+        title = c.kind if c.line_number == core.NO_LINE_NUMBER else "{} (line {})".format(c.kind, c.line_number)
+        yield u'<path d="{}" stroke="{}" marker-end="url(#arrow-{})"><title>{}</title></path>\n'.format(
+            _SvgEdgePath(drawing.boxes[src], drawing.boxes[dst], offset), _SvgColor(c.kind), c.kind, escape(title))
+    yield u"</g>\n"
+
+    for node, lines, box in zip(nodes, labels, drawing.boxes):
+        fill = _SvgColor("terminating") if node.is_exit_node else "white"
+        chunk = [u'<g><title>{}</title><rect x="{:.1f}" y="{:.1f}" width="{}" height="{}" rx="4" fill="{}" '
+                 u'stroke="black"/>'.format(escape(node.name), box.x - box.width / 2.0, box.y - box.height / 2.0,
+                                            box.width, box.height, fill)]
+        top = box.y - box.height / 2.0 + SVG_PADDING
+        for i, line in enumerate(lines):
+            weight = u' font-weight="bold"' if i == 0 else u""
+            chunk.append(u'<text x="{:.1f}" y="{:.1f}" text-anchor="middle"{}>{}</text>'.format(
+                box.x, top + (i + 1) * SVG_LINE_HEIGHT - 3, weight, escape(line)))
+        chunk.append(u"</g>\n")
+        yield u"".join(chunk)
+
+    yield u"</svg>\n"
+
+
+# Output format: generate is a function like GenerateDot, extension is the
+# extension of the output files in batch mode.
+Format = collections.namedtuple("Format", ["name", "generate", "extension"])
+
+FORMATS = collections.OrderedDict()
+
+DEFAULT_FORMAT = "dot"
+
+
+# Registers an output format, which can then be used by Render and by the
+# --format command-line option.
+def RegisterFormat(name, generate, extension):
+    FORMATS[name] = Format(name, generate, extension)
+
+
+RegisterFormat("dot", GenerateDot, ".dot")
+RegisterFormat("json", GenerateJson, ".json")
+RegisterFormat("graphml", GenerateGraphML, ".graphml")
+RegisterFormat("edgelist", GenerateEdgeList, ".tsv")
+RegisterFormat("svg", GenerateSvg, ".svg")
+
+
+def GetFormat(name):
+    if name not in FORMATS:
+        raise ValueError("unknown output format: {} (available: {})".format(name, ", ".join(FORMATS)))
+    return FORMATS[name]
+
+
+# Writes call_graph to out_file (stdout if not set) in output_format (one of
+# FORMATS). options are the same as GenerateDot's.
+def Render(call_graph, out_file=None, output_format=DEFAULT_FORMAT, **options):
+    generate = GetFormat(output_format).generate
+    if out_file is None:
+        out_file = sys.stdout
+    WriteChunks(out_file, generate(call_graph, **options))
+
+
+# Writes chunks of text to out_file, grouping them in blocks of about
+# block_size characters to avoid issuing a write for each chunk.
+def WriteChunks(out_file, chunks, block_size=DEFAULT_BLOCK_SIZE):
+    block = []
+    size = 0
+    for chunk in chunks:
+        block.append(chunk)
+        size += len(chunk)
+        if size >= block_size:
+            out_file.write(u"".join(block))
+            block = []
+            size = 0
+    if block:
+        out_file.write(u"".join(block))
+
+
+# Writes the DOT code for call_graph to out_file (stdout if not set). See
+# GenerateDot for the other arguments.
+# log_file is accepted for backwards compatibility but ignored: diagnostics
+# are sent to the "callgraph" logger (see log.py).
+def PrintDot(call_graph, out_file=None, log_file=None, show_all_calls=True, show_node_stats=False, nodes_to_hide=None, represent_node_size=False, min_node_size=3, max_node_size=7, font_scale_factor=7, analysis=None):
+    if out_file is None:
+        out_file = sys.stdout
+    WriteChunks(out_file, GenerateDot(call_graph, show_all_calls=show_all_calls, show_node_stats=show_node_stats,
+                                      nodes_to_hide=nodes_to_hide, represent_node_size=represent_node_size,
+                                      min_node_size=min_node_size, max_node_size=max_node_size,
+                                      font_scale_factor=font_scale_factor, analysis=analysis))
+
 
-    print(u"}", file=out_file)
+# Opens path for writing rendered output, in large buffered blocks. The
+# output is compressed with gzip if the name of the file ends with ".gz".
+def OpenOutput(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "wt")
+    return open(path, "w", buffering=DEFAULT_BLOCK_SIZE)
@@ -0,0 +1,350 @@
+# Long-running server mode (cmd-call-graph serve): keeps the call graphs it
+# builds in memory and answers requests to render and analyze them, so that
+# editors and hooks do not pay for starting the interpreter and parsing the
+# same scripts again on every request.
+#
+# The protocol is JSON-RPC 2.0 with one message per line, over the standard
+# input/output or over a Unix socket, where each client gets its own thread.
+# Scripts are given either as a path, in which case the graph is cached until
+# the modification time or the size of the file change, or as text, which is
+# cached by its hash. The cache is an LRU bounded by the number of graphs.
+#
+# Methods (params in parentheses; source is either "path" or "text", plus an
+# optional "encoding"):
+#  - render(source, format, focus, depth, direction, analyze and the fields
+#    of api.RenderOptions): {"output": rendered graph};
+#  - analyze(source): the analysis as returned by analysis.ToDict;
+#  - invalidate(path, optional): drops path, or everything, from the cache;
+#  - stats(): cache statistics.
+
+import argparse
+import collections
+import hashlib
+import json
+import logging
+import os
+import socket
+import socketserver
+import sys
+import threading
+
+from . import analysis
+from . import api
+from . import log
+from . import reader
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_GRAPHS = 64
+
+# JSON-RPC 2.0 error codes.
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+SERVER_ERROR = -32000
+
+
+class RequestError(Exception):
+    def __init__(self, code, message):
+        Exception.__init__(self, message)
+        self.code = code
+
+
+# In-memory LRU cache of call graphs, safe to use from several threads.
+# Graphs are never modified once built, so they can be rendered by several
+# threads at once.
+class GraphCache:
+    def __init__(self, max_graphs=DEFAULT_MAX_GRAPHS):
+        self.max_graphs = max_graphs
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Maps keys to (signature, call graph).
+        self._graphs = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    # Returns the graph stored for key if its signature is still signature,
+    # otherwise builds it with build() and stores it. Concurrent misses on
+    # the same key may build it more than once.
+    def Get(self, key, signature, build):
+        with self._lock:
+            entry = self._graphs.get(key)
+            if entry is not None and entry[0] == signature:
+                self._graphs.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        call_graph = build()
+
+        with self._lock:
+            self._graphs[key] = (signature, call_graph)
+            self._graphs.move_to_end(key)
+            while len(self._graphs) > self.max_graphs:
+                self._graphs.popitem(last=False)
+                self.evictions += 1
+        return call_graph
+
+    # Drops the graphs of path (all of them if None), returning how many were
+    # dropped.
+    def Invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                dropped = len(self._graphs)
+                self._graphs.clear()
+                return dropped
+            keys = [key for key in self._graphs if key[0] == "path" and key[1] == path]
+            for key in keys:
+                del self._graphs[key]
+            return len(keys)
+
+    def Stats(self):
+        with self._lock:
+            return dict(graphs=len(self._graphs), max_graphs=self.max_graphs, hits=self.hits, misses=self.misses,
+                        evictions=self.evictions)
+
+
+def _Param(params, name, types, default=None):
+    value = params.get(name, default)
+    if value is not None and not isinstance(value, types):
+        raise RequestError(INVALID_PARAMS, "invalid value for {}: {!r}".format(name, value))
+    return value
+
+
+# Handles the requests, independently of the transport.
+class Service:
+    def __init__(self, max_graphs=DEFAULT_MAX_GRAPHS, encoding=None):
+        self.cache = GraphCache(max_graphs)
+        self.encoding = encoding
+        self._methods = {
+            "render": self.Render,
+            "analyze": self.Analyze,
+            "invalidate": self.Invalidate,
+            "stats": self.Stats,
+        }
+
+    # Returns the call graph of the script given in params, from the cache
+    # if possible.
+    def _Graph(self, params):
+        encoding = _Param(params, "encoding", str, self.encoding)
+        path = _Param(params, "path", str)
+        text = _Param(params, "text", str)
+        if (path is None) == (text is None):
+            raise RequestError(INVALID_PARAMS, "exactly one of path and text is required")
+        if encoding is not None:
+            try:
+                encoding = reader.CheckEncoding(encoding)
+            except (LookupError, ValueError) as e:
+                raise RequestError(INVALID_PARAMS, str(e))
+
+        if text is not None:
+            digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            return self.cache.Get(("text", digest), None, lambda: api.BuildText(text))
+
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            raise RequestError(SERVER_ERROR, "cannot read {}: {}".format(path, e))
+        signature = (stat.st_mtime_ns, stat.st_size)
+        return self.cache.Get(("path", path, encoding), signature, lambda: api.BuildFile(path, encoding=encoding))
+
+    # Returns the part of the graph selected by the focus, depth and
+    # direction params, like the --focus option.
+    def _Focus(self, call_graph, params):
+        focus = _Param(params, "focus", (str, list))
+        if not focus:
+            return call_graph
+        if isinstance(focus, str):
+            focus = [focus]
+        depth = _Param(params, "depth", int, 1)
+        direction = _Param(params, "direction", str, "both")
+        try:
+            return call_graph.Neighborhood(focus, depth, direction)
+        except ValueError as e:
+            raise RequestError(INVALID_PARAMS, str(e))
+
+    def Render(self, params):
+        call_graph = self._Focus(self._Graph(params), params)
+        overrides = {}
+        for name in api.RenderOptions._fields:
+            if name in params:
+                overrides[name] = params[name]
+        if "format" in params:
+            overrides["output_format"] = params["format"]
+
+        graph_analysis = None
+        if params.get("analyze"):
+            graph_analysis = analysis.Analyze(call_graph)
+
+        try:
+            return {"output": api.Render(call_graph, analysis=graph_analysis, **overrides)}
+        except (TypeError, ValueError) as e:
+            raise RequestError(INVALID_PARAMS, str(e))
+
+    def Analyze(self, params):
+        call_graph = self._Focus(self._Graph(params), params)
+        return analysis.ToDict(call_graph, analysis.Analyze(call_graph))
+
+    def Invalidate(self, params):
+        path = _Param(params, "path", str)
+        if path is not None:
+            path = os.path.abspath(path)
+        return {"invalidated": self.cache.Invalidate(path)}
+
+    def Stats(self, params):
+        return self.cache.Stats()
+
+    # Handles a JSON-RPC request (already decoded), returning the response,
+    # or None for notifications (requests without an id), even if they fail.
+    def Handle(self, request):
+        response = self._Handle(request)
+        if isinstance(request, dict) and "id" not in request:
+            if "error" in response:
+                logger.info("Error handling notification %s: %s", request.get("method"), response["error"]["message"])
+            return None
+        return response
+
+    def _Handle(self, request):
+        request_id = None
+        try:
+            if not isinstance(request, dict) or request.get("jsonrpc") != "2.0" or \
+                    not isinstance(request.get("method"), str):
+                raise RequestError(INVALID_REQUEST, "invalid JSON-RPC 2.0 request")
+            request_id = request.get("id")
+            params = request.get("params", {})
+            if not isinstance(params, dict):
+                raise RequestError(INVALID_PARAMS, "params must be an object")
+            method = self._methods.get(request["method"])
+            if method is None:
+                raise RequestError(METHOD_NOT_FOUND, "unknown method: {}".format(request["method"]))
+            result = method(params)
+        except RequestError as e:
+            return _Error(request_id, e.code, str(e))
+        except OSError as e:
+            return _Error(request_id, SERVER_ERROR, str(e))
+        except Exception as e:
+            logger.exception("Error handling %s", request.get("method"))
+            return _Error(request_id, SERVER_ERROR, str(e))
+
+        return collections.OrderedDict([("jsonrpc", "2.0"), ("id", request_id), ("result", result)])
+
+    # Handles a line of the protocol, returning the response line (without
+    # line terminator) or None.
+    def HandleLine(self, line):
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            response = _Error(None, PARSE_ERROR, "invalid JSON: {}".format(e))
+        else:
+            response = self.Handle(request)
+        if response is None:
+            return None
+        return json.dumps(response)
+
+
+def _Error(request_id, code, message):
+    return collections.OrderedDict([("jsonrpc", "2.0"), ("id", request_id),
+                                    ("error", collections.OrderedDict([("code", code), ("message", message)]))])
+
+
+# Serves the requests read from in_file, one per line, writing the responses
+# to out_file, until the end of in_file.
+def ServeStream(service, in_file, out_file):
+    for line in in_file:
+        if not line.strip():
+            continue
+        response = service.HandleLine(line)
+        if response is not None:
+            out_file.write(response + "\n")
+            out_file.flush()
+
+
+class _StreamHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        logger.info("Client connected")
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            response = self.server.service.HandleLine(line.decode("utf-8"))
+            if response is not None:
+                self.wfile.write(response.encode("utf-8") + b"\n")
+                self.wfile.flush()
+        logger.info("Client disconnected")
+
+
+if hasattr(socket, "AF_UNIX"):
+    class UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+        def __init__(self, path, service):
+            self.service = service
+            socketserver.ThreadingUnixStreamServer.__init__(self, path, _StreamHandler)
+else:
+    UnixServer = None
+
+
+# Returns a server listening on the Unix socket at path, with a thread per
+# client. Call serve_forever on it, and server_close once done.
+def CreateUnixServer(path, service):
+    if UnixServer is None:
+        raise ValueError("Unix sockets are not supported on this platform")
+    return UnixServer(path, service)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="cmd-call-graph serve",
+                                     description="Serve JSON-RPC requests to render and analyze call graphs, keeping "
+                                     "them in memory.")
+    parser.add_argument("--socket", help="Listen on this Unix socket. If it's not set, requests are read from "
+                        "stdin and responses written to stdout.", type=str, dest="socket")
+    parser.add_argument("--max-graphs", help="Maximum number of call graphs kept in memory.", type=int,
+                        dest="maxgraphs", default=DEFAULT_MAX_GRAPHS)
+    parser.add_argument("--encoding", help="Default encoding of the input files.", type=str, dest="encoding")
+    parser.add_argument("-v", "--verbose", action="count", dest="verbose", default=0,
+                        help="Output extra information about what the program does.")
+    parser.add_argument("-l", "--log-file", help="Log file. If it's not set, stderr is used.",
+                        type=str, dest="logfile")
+    args = parser.parse_args(argv)
+
+    if args.maxgraphs < 1:
+        parser.error("--max-graphs should be at least 1")
+    if args.encoding is not None:
+        try:
+            reader.CheckEncoding(args.encoding)
+        except (LookupError, ValueError) as e:
+            parser.error(str(e))
+
+    log_file = sys.stderr
+    if args.logfile:
+        try:
+            log_file = open(args.logfile, 'w')
+        except IOError as e:
+            print(u"Error opening {}: {}".format(args.logfile, e), file=sys.stderr)
+            sys.exit(1)
+    log_handler = log.Configure(log_file, args.verbose)
+
+    service = Service(args.maxgraphs, args.encoding)
+    try:
+        if args.socket is None:
+            ServeStream(service, sys.stdin, sys.stdout)
+            return
+
+        try:
+            server = CreateUnixServer(args.socket, service)
+        except (OSError, ValueError) as e:
+            print(u"Error listening on {}: {}".format(args.socket, e), file=sys.stderr)
+            sys.exit(1)
+        logger.info("Listening on %s", args.socket)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            os.remove(args.socket)
+    finally:
+        log.Unconfigure(log_handler)
+        if args.logfile:
+            log_file.close()
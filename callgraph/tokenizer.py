@@ -0,0 +1,85 @@
+# Extraction of the commands that matter for the call graph (goto, call and
+# exit) from lines of code.
+#
+# The vast majority of the lines of real scripts contain none of these
+# commands nor comments, so each line first goes through a cheap pre-check
+# (a few substring searches, all done in C) and only the lines which pass it
+# are split into tokens and scanned.
+
+import collections
+import functools
+import sys
+
+Command = collections.namedtuple("Command", ["command", "target"])
+
+NO_COMMANDS = ()
+
+# Returns a Command, sharing the same instance (and the same interned target
+# string) among all the lines containing the same command. The most recently
+# used commands are kept, so that scripts with many distinct targets only pay
+# for evicting the least recently used one, not for clearing the whole cache.
+@functools.lru_cache(maxsize=4096)
+def MakeCommand(command, target):
+    return Command(command, sys.intern(target))
+
+
+# Returns True if text may contain a goto/call/exit command or a comment.
+# False positives (e.g., "recall") are fine, since they are handled by the
+# full scan.
+def MayContainCommands(text):
+    return "goto" in text or "call" in text or "exit" in text or "rem" in text or "::" in text
+
+
+# Tokenizes a line of code, which must be already stripped and lowercased.
+# Returns a (noop, commands) tuple: noop is True if the line is empty or a
+# comment, commands is a tuple of Command.
+def Tokenize(text):
+    if not MayContainCommands(text):
+        return not text, NO_COMMANDS
+
+    tokens = text.split()
+    if not tokens:
+        return True, NO_COMMANDS
+
+    commands = []
+    noop = False
+    last = len(tokens) - 1
+    for i, token in enumerate(tokens):
+        # Remove open/close parenthesis from the start/end of the command, to
+        # deal with inline commands enclosed in parentheses.
+        token = token.lstrip("(").rstrip(")")
+
+        # Comment; stop processing the rest of the line.
+        if token.startswith("::") or token == "rem" or token.startswith("@::") or token == "@rem":
+            noop = True
+            break
+
+        if token == "goto" or token == "@goto":
+            if i == last:
+                continue
+            block_name = tokens[i+1].lstrip("(").rstrip(")")[1:]
+            if block_name:
+                commands.append(MakeCommand("goto", block_name))
+            continue
+
+        if token == "call" or token == "@call":
+            if i == last:
+                continue
+            target = tokens[i+1].lstrip("(").rstrip(")")
+            if not target:
+                continue
+            if target[0] != ":":
+                commands.append(MakeCommand("external_call", target))
+                continue
+            block_name = target[1:]
+            if block_name:
+                commands.append(MakeCommand("call", block_name))
+            continue
+
+        if token == "exit" or token == "@exit":
+            target = ""
+            if i < last:
+                target = tokens[i+1]
+            commands.append(MakeCommand("exit", target))
+
+    return noop, tuple(commands) if commands else NO_COMMANDS
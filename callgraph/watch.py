@@ -0,0 +1,259 @@
+# Watch mode (--watch): polls a script and rebuilds its call graph whenever
+# it changes, re-parsing only the blocks whose lines changed.
+#
+# Changes are detected by polling the modification time and the size of the
+# file, which works everywhere without depending on the notification API of
+# each OS. The new lines are compared with the previous ones: everything
+# before the first and after the last different line is unchanged, so the
+# blocks made only of those lines keep their nodes, and only the blocks in
+# between are tokenized again. Their nodes are reused as they are (the
+# blocks after the change are just moved by the number of added or removed
+# lines); only the steps which cross the block boundaries (eof pruning,
+# nested connections, exit nodes) run again on the whole graph, and they
+# only look at nodes and connections, not at lines.
+#
+# Labels defined more than once make the blocks depend on each other (the
+# last definition wins), so scripts which have any are always rebuilt from
+# scratch, as are changes which define a label already defined elsewhere.
+
+import bisect
+import collections
+import logging
+import os
+import time
+
+from . import core
+from . import reader
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 0.5
+
+# Number of lines compared at once when looking for the first and the last
+# changed line.
+_COMPARE_CHUNK_SIZE = 1024
+
+
+def _IsLabel(line):
+    line = line.strip()
+    return line.startswith(":") and not line.startswith("::")
+
+
+# Returns the number of leading items which a and b have in common.
+def _CommonPrefix(a, b):
+    size = min(len(a), len(b))
+    start = 0
+    # Slices are compared in C, which is much faster than item by item.
+    while start < size:
+        end = min(start + _COMPARE_CHUNK_SIZE, size)
+        if a[start:end] != b[start:end]:
+            break
+        start = end
+    end = min(start + _COMPARE_CHUNK_SIZE, size)
+    while start < end and a[start] == b[start]:
+        start += 1
+    return start
+
+
+# Returns the number of trailing items which a and b have in common, up to
+# limit.
+def _CommonSuffix(a, b, limit):
+    count = 0
+    while count < limit:
+        size = min(_COMPARE_CHUNK_SIZE, limit - count)
+        if a[len(a) - count - size:len(a) - count] != b[len(b) - count - size:len(b) - count]:
+            break
+        count += size
+    end = min(count + _COMPARE_CHUNK_SIZE, limit)
+    while count < end and a[len(a) - count - 1] == b[len(b) - count - 1]:
+        count += 1
+    return count
+
+
+# Call graph of a script which changes over time, rebuilt incrementally by
+# Update. The nodes of the blocks which did not change are moved to the new
+# graph, so the graphs returned by previous calls are no longer valid.
+class IncrementalGraph:
+    def __init__(self):
+        self.lines = []
+        self.call_graph = None
+        # Number of lines tokenized by the last update.
+        self.reparsed_lines = 0
+        # Line index where each block starts, and the name of its node.
+        self._starts = []
+        self._names = []
+        # Line numbers of the "goto :eof" of each node, which are removed
+        # with eof if it is pruned, and must be restored when it is reused.
+        self._eof_gotos = {}
+        self._incremental = False
+
+    # Returns the call graph of lines (a list of str, like the lines of the
+    # file without line terminators), the same as CallGraph.Build(lines).
+    def Update(self, lines):
+        old_lines = self.lines
+        if self.call_graph is None or not self._incremental:
+            return self._Rebuild(lines)
+
+        prefix = _CommonPrefix(old_lines, lines)
+        if prefix == len(old_lines) == len(lines):
+            self.reparsed_lines = 0
+            return self.call_graph
+        suffix = _CommonSuffix(old_lines, lines, min(len(old_lines), len(lines)) - prefix)
+        old_end = len(old_lines) - suffix
+        delta = len(lines) - len(old_lines)
+
+        # The first block to parse again is the one with the first changed
+        # line, or the previous one if that line was a label and is not
+        # anymore.
+        first = max(bisect.bisect_right(self._starts, min(prefix, len(old_lines) - 1)) - 1, 0)
+        if first > 0 and self._starts[first] == prefix and prefix < len(lines) and not _IsLabel(lines[prefix]):
+            first -= 1
+        # The blocks starting after the last changed line are unchanged.
+        last = bisect.bisect_left(self._starts, old_end, first)
+        start = self._starts[first]
+        end = (self._starts[last] if last < len(self._starts) else len(old_lines)) + delta
+        while last < len(self._starts) and (end == 0 or self._names[last] == "__begin__"):
+            # The first line changed: whether __begin__ still exists depends
+            # on the new first block, which is parsed again anyway.
+            last += 1
+            end = (self._starts[last] if last < len(self._starts) else len(old_lines)) + delta
+
+        call_graph = self._Assemble(lines, start, end, first, last, delta)
+        if call_graph is None:
+            logger.info("A label is defined more than once, rebuilding the whole graph")
+            return self._Rebuild(lines)
+        return call_graph
+
+    def _Rebuild(self, lines):
+        self._starts = []
+        self._names = []
+        self._eof_gotos = {}
+        return self._Assemble(lines, 0, len(lines), 0, 0, 0)
+
+    # Builds the graph of lines, reusing the nodes of the blocks before first
+    # and from last on, and parsing the lines from start to end. Returns None
+    # if the new blocks define a label which is also defined by a reused one.
+    def _Assemble(self, lines, start, end, first, last, delta):
+        texts, noops, terminating, commands, labels = core.TokenizeLines(lines[start:end])
+        starts = self._starts[:first]
+        names = self._names[:first]
+        if start == 0 and not (labels and labels[0][0] == 0):
+            starts.append(0)
+            names.append("__begin__")
+        for index, _, name in labels:
+            starts.append(start + index)
+            names.append(name)
+        reused = self._names[:first] + self._names[last:]
+        starts.extend(line_index + delta for line_index in self._starts[last:])
+        names.extend(self._names[last:])
+
+        incremental = len(set(names)) == len(names)
+        if not incremental and reused:
+            return None
+
+        old_graph = self.call_graph
+        call_graph = core.CallGraph()
+        # The special nodes come first, as in CallGraph._NewGraph.
+        if start == 0:
+            cur_node = call_graph.GetOrCreateNode("__begin__")
+            call_graph.DefineNode(cur_node, 1)
+            call_graph.first_node = cur_node
+        elif names[0] == "__begin__":
+            call_graph.nodes["__begin__"] = old_graph.nodes["__begin__"]
+        if "eof" in reused:
+            call_graph.nodes["eof"] = old_graph.nodes["eof"]
+        else:
+            call_graph.GetOrCreateNode("eof").is_exit_node = True
+
+        for name in self._names[:first]:
+            cur_node = self._MoveNode(call_graph, old_graph.nodes[name], 0)
+        if first > 0:
+            call_graph.first_node = old_graph.nodes[self._names[0]]
+
+        command_lines = collections.defaultdict(list)
+        call_graph._AppendLines(cur_node, start + 1, texts, noops, terminating, commands, labels, command_lines)
+        call_graph._SetSummaries(command_lines)
+
+        for name in self._names[last:]:
+            self._MoveNode(call_graph, old_graph.nodes[name], delta)
+
+        eof_gotos = {}
+        for connection in call_graph.GetIncoming("eof"):
+            if connection.kind == "goto":
+                eof_gotos.setdefault(connection.src, []).append(connection.line_number)
+        call_graph._PostProcess()
+
+        self.lines = lines
+        self.call_graph = call_graph
+        self.reparsed_lines = end - start
+        self._starts = starts
+        self._names = names
+        self._eof_gotos = eof_gotos
+        self._incremental = incremental
+        return call_graph
+
+    # Adds node, taken from the previous graph, to call_graph, moving it by
+    # delta lines and dropping what the post-processing steps added to it.
+    def _MoveNode(self, call_graph, node, delta):
+        node.connections.difference_update(node.GetConnections("nested"))
+        for line_number in self._eof_gotos.get(node.name, ()):
+            node.AddConnection("eof", "goto", line_number)
+        node.is_exit_node = node.name == "eof"
+        node.is_last_node = False
+        if delta:
+            node.line_number += delta
+            for line in node.code:
+                line.number += delta
+            if node.summary.external_calls:
+                node.summary = node.summary._replace(external_calls=tuple(
+                    (line_number + delta, target) for line_number, target in node.summary.external_calls))
+            node.connections = set(core.Connection(c.dst, c.kind, c.line_number + delta) for c in node.connections)
+        call_graph.AddNode(node)
+        return node
+
+
+# Returns the lines of the file at path, like CallGraph.Build reads them.
+def ReadLines(path, encoding=None):
+    with open(path, "rb") as f:
+        data = f.read()
+    return list(reader.IterDecodedLines(data, encoding))
+
+
+# Polls the file at path every interval seconds, calling on_update with its
+# call graph at the start and whenever its modification time or size
+# change, until stop (a threading.Event) is set, or forever if None.
+# Errors reading the file (e.g., while an editor replaces it) are logged, and
+# the file is read again at the next poll; errors parsing it are logged, and
+# the file is parsed again once it changes.
+def Watch(path, on_update, encoding=None, interval=DEFAULT_INTERVAL, stop=None):
+    graph = IncrementalGraph()
+    signature = None
+    while stop is None or not stop.is_set():
+        lines = None
+        try:
+            stat = os.stat(path)
+            if (stat.st_mtime_ns, stat.st_size) != signature:
+                lines = ReadLines(path, encoding)
+                signature = (stat.st_mtime_ns, stat.st_size)
+        except (OSError, UnicodeDecodeError) as e:
+            logger.warning("Cannot read %s: %s", path, e)
+            signature = None
+
+        if lines is not None:
+            start_time = time.perf_counter()
+            try:
+                call_graph = graph.Update(lines)
+            except Exception as e:
+                # E.g. a line with a lone colon, while it is being typed.
+                # The previous lines are kept, and the next change is
+                # compared with them.
+                logger.error("Error processing %s: %s", path, e)
+            else:
+                logger.info("Rebuilt the graph of %s in %.1f ms, parsing %d of %d lines", path,
+                            (time.perf_counter() - start_time) * 1000, graph.reparsed_lines, len(lines))
+                on_update(call_graph)
+
+        if stop is None:
+            time.sleep(interval)
+        else:
+            stop.wait(interval)
@@ -0,0 +1,77 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+
+from callgraph import aio
+from callgraph import api
+
+
+CODE = b":Main\ncall :foo\ngoto :eof\n:foo\necho foo\nexit /b 1\n"
+
+
+def _Script(i, num_blocks=1):
+    code = [":Main"]
+    for j in range(num_blocks):
+        code += ["call :f{}_{}".format(i, j), ":f{}_{}".format(i, j), "echo {}".format(j)]
+    return ("\n".join(code) + "\n").encode("ascii")
+
+
+class AsyncRunnerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.root = tempfile.mkdtemp()
+        self.runner = aio.AsyncRunner(max_workers=4, max_pending=8)
+
+    async def asyncTearDown(self):
+        await self.runner.Close()
+        shutil.rmtree(self.root)
+
+    async def test_build_and_render(self):
+        path = os.path.join(self.root, "script.cmd")
+        with open(path, "wb") as f:
+            f.write(CODE)
+        expected = api.Render(api.Build(CODE), show_node_stats=True)
+
+        call_graph = await self.runner.Build(path)
+        self.assertEqual(expected, await self.runner.Render(call_graph, show_node_stats=True))
+        self.assertEqual(expected, await self.runner.RenderSource(CODE, render_options=api.RenderOptions(
+            show_node_stats=True)))
+
+    async def test_concurrent_requests(self):
+        sources = [_Script(i) for i in range(100)]
+        results = await asyncio.gather(*[self.runner.RenderSource(source) for source in sources])
+        self.assertEqual([api.Render(api.Build(source)) for source in sources], results)
+
+    async def test_stream(self):
+        call_graph = api.Build(_Script(0, 200))
+        expected = api.Render(call_graph, output_format="json")
+        blocks = [block async for block in self.runner.Stream(call_graph, output_format="json", block_size=256)]
+        self.assertGreater(len(blocks), 10)
+        self.assertEqual(expected, "".join(blocks))
+
+    async def test_stream_abandoned(self):
+        call_graph = api.Build(_Script(0, 500))
+        stream = self.runner.Stream(call_graph, block_size=16)
+        async for _ in stream:
+            break
+        await stream.aclose()
+        # The worker was released: other requests still complete.
+        self.assertEqual(api.Render(api.Build(CODE)), await asyncio.wait_for(self.runner.RenderSource(CODE), 10))
+
+    async def test_errors(self):
+        with self.assertRaises(OSError):
+            await self.runner.Build(os.path.join(self.root, "missing.cmd"))
+        with self.assertRaises(ValueError):
+            async for _ in self.runner.Stream(api.Build(CODE), output_format="no-such-format"):
+                pass
+
+    async def test_processes(self):
+        async with aio.AsyncRunner(max_workers=2, processes=True) as runner:
+            self.assertEqual(api.Render(api.Build(CODE)), await runner.RenderSource(CODE))
+            call_graph = await runner.Build(CODE)
+            self.assertEqual(["foo", "main"], sorted(call_graph.nodes))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import json
+import os
+import unittest
+
+from callgraph import analysis
+from callgraph.core import CallGraph
+from callgraph.render import GenerateDot
+
+
+class AnalysisTest(unittest.TestCase):
+    def setUp(self):
+        self.devnull = open(os.devnull, "w")
+
+    def tearDown(self):
+        self.devnull.close()
+
+    def _Build(self, code):
+        return CallGraph.Build(code.split("\n"), self.devnull)
+
+    def test_recursion_through_goto(self):
+        call_graph = self._Build("""call :a
+        exit /b
+        :a
+        goto :b
+        :b
+        call :a
+        exit /b
+        :dead
+        call :dead
+        exit /b
+        :loop
+        goto :loop
+        """)
+        result = analysis.Analyze(call_graph)
+
+        self.assertEqual(set(["__begin__", "a", "b"]), result.reachable)
+        self.assertEqual(["dead", "loop"], [node.name for node in result.unreachable])
+
+        cycles = {tuple(cycle.nodes): cycle for cycle in result.cycles}
+        self.assertEqual(set([("a", "b"), ("dead",), ("loop",)]), set(cycles))
+        self.assertTrue(cycles[("a", "b")].recursive)
+        self.assertEqual([("b", "a", 6)], cycles[("a", "b")].calls)
+        self.assertTrue(cycles[("dead",)].recursive)
+        self.assertFalse(cycles[("loop",)].recursive)
+
+    def test_components(self):
+        call_graph = self._Build("""call :a
+        exit /b
+        :a
+        call :b
+        exit /b
+        :b
+        exit /b
+        """)
+        components = analysis.StronglyConnectedComponents(call_graph)
+        self.assertEqual([["__begin__"], ["a"], ["b"]], sorted(components))
+        # Reverse topological order: b before a before __begin__.
+        order = [component[0] for component in components]
+        self.assertLess(order.index("b"), order.index("a"))
+        self.assertLess(order.index("a"), order.index("__begin__"))
+        self.assertEqual([], analysis.Cycles(call_graph))
+
+    def test_deep_chain(self):
+        # Much deeper than the recursion limit.
+        labels = 5000
+        lines = ["call :l0", "exit /b"]
+        for i in range(labels):
+            lines += [":l{}".format(i), "call :l{}".format(i + 1), "exit /b"]
+        lines += [":l{}".format(labels), "call :l0"]
+        call_graph = CallGraph.Build(lines, self.devnull)
+
+        result = analysis.Analyze(call_graph)
+        self.assertEqual(1, len(result.cycles))
+        self.assertEqual(labels + 1, len(result.cycles[0].nodes))
+        self.assertEqual([], result.unreachable)
+
+    def test_json(self):
+        call_graph = self._Build(""":a
+        call :a
+        :b
+        """)
+        result = json.loads(analysis.ToJson(call_graph, analysis.Analyze(call_graph)))
+        self.assertEqual("a", result["first_node"])
+        self.assertEqual([], result["unreachable"])
+        self.assertEqual([dict(nodes=["a"], recursive=True, calls=[dict(src="a", dst="a", line_number=2)])],
+                         result["cycles"])
+
+    def test_highlighted_dot(self):
+        call_graph = self._Build("""exit /b
+        :dead
+        goto :dead
+        """)
+        dot = "".join(GenerateDot(call_graph, analysis=analysis.Analyze(call_graph)))
+        self.assertIn("[unreachable]", dot)
+        self.assertIn("[loop]", dot)
+        self.assertIn("penwidth=3", dot)
+        self.assertNotIn("[unreachable]", "".join(GenerateDot(call_graph)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import concurrent.futures
+import io
+import os
+import pathlib
+import shutil
+import tempfile
+import unittest
+
+import callgraph
+from callgraph import api
+from callgraph.core import CallGraph
+from callgraph.render import PrintDot
+
+
+CODE = u":Main\r\ncall :foo\r\ngoto :eof\r\n:foo\r\necho café\r\nexit /b 1\r\n"
+
+
+class ApiTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, "script.cmd")
+        with open(self.path, "wb") as f:
+            f.write(CODE.encode("cp437"))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _Expected(self, **options):
+        with open(self.path, "r", encoding="cp437") as f:
+            call_graph = CallGraph.Build(f)
+        out = io.StringIO()
+        PrintDot(call_graph, out, **options)
+        return out.getvalue()
+
+    def test_sources(self):
+        expected = self._Expected()
+        options = callgraph.BuildOptions(encoding="cp437")
+        for source in [self.path, pathlib.Path(self.path), CODE.encode("cp437")]:
+            self.assertEqual(expected, callgraph.Render(callgraph.Build(source, options)))
+        for text in [CODE, CODE.encode("cp437")]:
+            self.assertEqual(expected, callgraph.Render(callgraph.BuildText(text, options)))
+        with open(self.path, "r", encoding="cp437") as f:
+            self.assertEqual(expected, callgraph.Render(callgraph.Build(f)))
+
+    def test_build_variants(self):
+        expected = self._Expected()
+        for overrides in [dict(use_mmap=True), dict(jobs=2), dict(cache_dir=os.path.join(self.root, "cache"))]:
+            call_graph = callgraph.Build(self.path, encoding="cp437", **overrides)
+            self.assertEqual(expected, callgraph.Render(call_graph), overrides)
+
+    def test_render_options(self):
+        call_graph = callgraph.BuildText(CODE)
+        options = callgraph.RenderOptions(show_node_stats=True, nodes_to_hide=["FOO"])
+        self.assertEqual(self._Expected(show_node_stats=True, nodes_to_hide={"foo"}),
+                         callgraph.Render(call_graph, options))
+        self.assertTrue(callgraph.Render(call_graph, options, output_format="json").startswith("{"))
+
+        out = io.StringIO()
+        self.assertIsNone(callgraph.Render(call_graph, out_file=out))
+        self.assertEqual(self._Expected(), out.getvalue())
+
+    def test_errors(self):
+        with self.assertRaises(OSError):
+            callgraph.Build(os.path.join(self.root, "missing.cmd"))
+        # A str is always a path.
+        with self.assertRaises(OSError):
+            callgraph.Build(CODE)
+        with self.assertRaises(ValueError):
+            callgraph.BuildText(CODE, follow_calls=True)
+        with self.assertRaises(ValueError):
+            callgraph.Build(self.path, encoding="utf-16")
+        with self.assertRaises(TypeError):
+            callgraph.Build(self.path, no_such_option=True)
+        call_graph = callgraph.BuildText(CODE)
+        with self.assertRaises(ValueError):
+            callgraph.Render(call_graph, output_format="no-such-format")
+        with self.assertRaises(ValueError):
+            callgraph.Render(call_graph, min_node_size=8)
+
+    def test_defaults_are_not_changed(self):
+        callgraph.Render(callgraph.BuildText(CODE), nodes_to_hide=["foo"], output_format="json")
+        self.assertEqual(callgraph.RenderOptions(), api.DEFAULT_RENDER_OPTIONS)
+        self.assertEqual((), api.DEFAULT_RENDER_OPTIONS.nodes_to_hide)
+
+    def test_threads(self):
+        sources = [CODE.replace("foo", "foo{}".format(i)) for i in range(16)]
+        expected = [callgraph.Render(callgraph.BuildText(source), show_node_stats=True) for source in sources]
+        options = callgraph.RenderOptions(show_node_stats=True)
+
+        def BuildAndRender(source):
+            return callgraph.Render(callgraph.BuildText(source), options)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+            for _ in range(4):
+                self.assertEqual(expected, list(executor.map(BuildAndRender, sources)))
+
+
+if __name__ == "__main__":
+    unittest.main()
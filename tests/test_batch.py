@@ -0,0 +1,135 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from callgraph import batch
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.input_dir = os.path.join(self.root, "in")
+        self.output_dir = os.path.join(self.root, "out")
+        self._WriteScript("a.cmd", "call :foo\nexit\n:foo\ngoto :eof\n")
+        self._WriteScript("b.bat", "echo hello\n")
+        self._WriteScript(os.path.join("sub", "c.cmd"), ":bar\ncall :bar\n")
+        self._WriteScript("notes.txt", "not a batch file\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _WriteScript(self, name, text):
+        path = os.path.join(self.input_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+
+    def test_find_inputs_directory(self):
+        found = batch.FindInputs([self.input_dir])
+        relative_paths = [relative for _, relative in found]
+        self.assertEqual(["a.cmd", "b.bat", os.path.join("sub", "c.cmd")], relative_paths)
+
+    def test_find_inputs_glob(self):
+        found = batch.FindInputs([os.path.join(self.input_dir, "**", "*.cmd")])
+        relative_paths = [relative for _, relative in found]
+        self.assertEqual(["a.cmd", os.path.join("sub", "c.cmd")], relative_paths)
+
+    def test_same_relative_paths(self):
+        other_dir = os.path.join(self.root, "other")
+        os.makedirs(other_dir)
+        with open(os.path.join(other_dir, "a.cmd"), "w") as f:
+            f.write(":other\n")
+        summary = batch.RunBatch([os.path.join(self.input_dir, "a.cmd"), os.path.join(other_dir, "a.cmd")],
+                                 self.output_dir, jobs=1)
+        self.assertEqual([os.path.join(self.output_dir, "a.cmd.dot"), os.path.join(self.output_dir, "a-2.cmd.dot")],
+                         [r.output for r in summary.results])
+        with open(os.path.join(self.output_dir, "a.cmd.dot")) as f:
+            self.assertIn('"foo"', f.read())
+        with open(os.path.join(self.output_dir, "a-2.cmd.dot")) as f:
+            self.assertIn('"other"', f.read())
+
+        # Directories with the same layout.
+        summary = batch.RunBatch([self.input_dir, other_dir, self.input_dir], self.output_dir, jobs=1)
+        outputs = [r.output for r in summary.results]
+        self.assertEqual(7, len(set(outputs)))
+
+    def _CheckOutputs(self, summary):
+        self.assertEqual(3, len(summary.results))
+        for result in summary.results:
+            self.assertIsNone(result.error)
+        with open(os.path.join(self.output_dir, "a.cmd.dot")) as f:
+            self.assertIn('"__begin__" -> "foo"', f.read())
+        self.assertTrue(os.path.isfile(os.path.join(self.output_dir, "sub", "c.cmd.dot")))
+        self.assertEqual(7, sum(r.lines for r in summary.results))
+
+    def test_sequential(self):
+        self._CheckOutputs(batch.RunBatch([self.input_dir], self.output_dir, jobs=1))
+
+    def test_process_pool(self):
+        self._CheckOutputs(batch.RunBatch([self.input_dir], self.output_dir, jobs=2))
+
+    def test_output_format(self):
+        summary = batch.RunBatch([self.input_dir], self.output_dir, jobs=1, output_format="json")
+        self.assertEqual(3, len(summary.results))
+        self.assertTrue(os.path.isfile(os.path.join(self.output_dir, "a.cmd.json")))
+        self.assertFalse(os.path.exists(os.path.join(self.output_dir, "a.cmd.dot")))
+
+    def test_failures_do_not_abort(self):
+        missing = os.path.join(self.root, "missing.cmd")
+        reported = []
+        summary = batch.RunBatch([missing, self.input_dir], self.output_dir, jobs=1, on_result=reported.append)
+
+        self.assertEqual(4, len(summary.results))
+        self.assertEqual(summary.results, reported)
+        errors = [r for r in summary.results if r.error is not None]
+        self.assertEqual(1, len(errors))
+        self.assertEqual(missing, errors[0].path)
+        self.assertIn("FileNotFoundError", errors[0].error)
+        self.assertIn("(1 failed)", batch.FormatSummary(summary))
+
+    def test_identical_files(self):
+        self._WriteScript(os.path.join("copy", "a.cmd"), "call :foo\nexit\n:foo\ngoto :eof\n")
+        reported = []
+        with patch.object(batch, "_FileKey", wraps=batch._FileKey) as file_key:
+            summary = batch.RunBatch([self.input_dir], self.output_dir, jobs=1, on_result=reported.append,
+                                     use_dedup=True)
+        # Only the files with the same size are hashed.
+        self.assertEqual(2, file_key.call_count)
+
+        self.assertEqual(4, len(summary.results))
+        self.assertEqual(summary.results, reported)
+        copies = [r for r in summary.results if r.duplicate_of is not None]
+        self.assertEqual(1, len(copies))
+        self.assertEqual(os.path.join(self.input_dir, "a.cmd"), copies[0].duplicate_of)
+        self.assertEqual(4, copies[0].reused_lines)
+        with open(os.path.join(self.output_dir, "a.cmd.dot")) as f, \
+                open(os.path.join(self.output_dir, "copy", "a.cmd.dot")) as g:
+            self.assertEqual(f.read(), g.read())
+        self.assertIn("dedup: 1 identical files, 4 of 11 lines reused", batch.FormatSummary(summary))
+
+    def test_no_dedup(self):
+        self._WriteScript(os.path.join("copy", "a.cmd"), "call :foo\nexit\n:foo\ngoto :eof\n")
+        # Off by default.
+        summary = batch.RunBatch([self.input_dir], self.output_dir, jobs=2)
+        self.assertEqual(4, len(summary.results))
+        self.assertFalse(any(r.duplicate_of is not None or r.reused_lines for r in summary.results))
+        self.assertNotIn("dedup", batch.FormatSummary(summary))
+
+    def test_dedup_with_cache(self):
+        self._WriteScript("d.cmd", "echo d\n:bar\ncall :bar\n")
+        cache_dir = os.path.join(self.root, "cache")
+        summary = batch.RunBatch([self.input_dir], self.output_dir, jobs=1, cache_dir=cache_dir, use_dedup=True)
+        self.assertEqual([False] * 4, [r.cache_hit for r in summary.results])
+        # The :bar block of d.cmd is the one of sub/c.cmd.
+        self.assertEqual(2, sum(r.reused_lines for r in summary.results))
+        with open(os.path.join(self.output_dir, "d.cmd.dot")) as f:
+            self.assertIn('"bar" -> "bar"', f.read())
+
+        summary = batch.RunBatch([self.input_dir], self.output_dir, jobs=1, cache_dir=cache_dir, use_dedup=True)
+        self.assertEqual([True] * 4, [r.cache_hit for r in summary.results])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import codecs
+import io
+import locale
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from callgraph import batch
+from callgraph.cache import ParseCache
+from callgraph.render import PrintDot
+
+
+class ParseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.root, "cache")
+        self.script = self._WriteScript("a.cmd", "call :foo\nexit\n:foo\ngoto :eof\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _WriteScript(self, name, text):
+        path = os.path.join(self.root, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def _Dot(self, call_graph):
+        f = io.StringIO()
+        PrintDot(call_graph, f)
+        return f.getvalue()
+
+    def test_hit_after_miss(self):
+        cache = ParseCache(self.cache_dir)
+        first = cache.BuildFile(self.script)
+        self.assertEqual(dict(hits=0, misses=1, evictions=0), cache.Stats())
+
+        second = ParseCache(self.cache_dir).BuildFile(self.script)
+        self.assertEqual(self._Dot(first), self._Dot(second))
+        self.assertEqual(sorted(first.nodes.keys()), sorted(second.nodes.keys()))
+
+    def test_content_change_is_a_miss(self):
+        cache = ParseCache(self.cache_dir)
+        cache.BuildFile(self.script)
+        self._WriteScript("a.cmd", "call :bar\nexit\n:bar\ngoto :eof\n")
+        call_graph = cache.BuildFile(self.script)
+        self.assertEqual(2, cache.misses)
+        self.assertIn("bar", call_graph.nodes)
+
+    def test_key_encoding(self):
+        data = b"call :foo\n"
+        default = locale.getpreferredencoding(False)
+        other = "cp437" if codecs.lookup(default).name != "cp437" else "cp1252"
+        self.assertEqual(ParseCache.Key(data, default), ParseCache.Key(data))
+        self.assertNotEqual(ParseCache.Key(data, other), ParseCache.Key(data))
+        with patch("locale.getpreferredencoding", return_value=other):
+            self.assertEqual(ParseCache.Key(data, other), ParseCache.Key(data))
+
+    def test_unreadable_entry_is_a_miss(self):
+        cache = ParseCache(self.cache_dir)
+        cache.BuildFile(self.script)
+        for name in os.listdir(self.cache_dir):
+            with open(os.path.join(self.cache_dir, name), "wb") as f:
+                f.write(b"garbage")
+        call_graph = cache.BuildFile(self.script)
+        self.assertEqual(2, cache.misses)
+        self.assertIn("foo", call_graph.nodes)
+
+    def test_lru_eviction(self):
+        paths = [self._WriteScript("{}.cmd".format(i), "call :f{0}\n:f{0}\n".format(i)) for i in range(5)]
+        cache = ParseCache(self.cache_dir)
+        cache.BuildFile(paths[0])
+        entry_size = sum(os.path.getsize(os.path.join(self.cache_dir, n)) for n in os.listdir(self.cache_dir))
+
+        cache = ParseCache(self.cache_dir, max_size=int(entry_size * 3.5))
+        for i, path in enumerate(paths[1:], 1):
+            cache.BuildFile(path)
+            # Make sure that modification times are strictly increasing.
+            with open(path, "rb") as f:
+                entry = os.path.join(self.cache_dir, ParseCache.Key(f.read()) + ".pickle")
+            if os.path.exists(entry):
+                os.utime(entry, (i * 1000, i * 1000))
+
+        self.assertGreater(cache.evictions, 0)
+        self.assertLessEqual(len(os.listdir(self.cache_dir)), 3)
+        # The most recently used entry is still there.
+        cache.BuildFile(paths[-1])
+        self.assertEqual(1, cache.hits)
+
+    def test_batch(self):
+        output_dir = os.path.join(self.root, "out")
+        first = batch.RunBatch([self.script], output_dir, jobs=1, cache_dir=self.cache_dir)
+        second = batch.RunBatch([self.script], output_dir, jobs=1, cache_dir=self.cache_dir)
+        self.assertEqual([False], [r.cache_hit for r in first.results])
+        self.assertEqual([True], [r.cache_hit for r in second.results])
+        self.assertIn("cache: 1 hits, 0 misses", batch.FormatSummary(second))
+
+
+if __name__ == "__main__":
+    unittest.main()
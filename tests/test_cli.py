@@ -1,6 +1,8 @@
+import gzip
 import io
 import os
 import sys
+import tempfile
 import unittest
 from unittest.mock import patch
 
@@ -37,6 +39,73 @@ class CLITest(unittest.TestCase):
         for part in parts:
             self.assertTrue(part.isdigit(), f"Version part '{part}' should be numeric")
 
+    def test_gzip_output(self):
+        """Test that outputs whose name ends with .gz are compressed."""
+        example = os.path.join(os.path.dirname(__file__), '..', 'examples', 'example1.cmd')
+        expected = os.path.join(os.path.dirname(__file__), '..', 'examples', 'example1-nodestats.dot')
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'graph.dot.gz')
+            with patch('sys.argv', ['cmd-call-graph', example, '-o', output]):
+                main()
+            with gzip.open(output, 'rt') as f, open(expected) as g:
+                self.assertEqual(g.read(), f.read())
+
+    def test_parallel_jobs(self):
+        """Test that --jobs gives the same output in single-file mode."""
+        example = os.path.join(os.path.dirname(__file__), '..', 'examples', 'example1.cmd')
+        expected = os.path.join(os.path.dirname(__file__), '..', 'examples', 'example1-nodestats.dot')
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'graph.dot')
+            with patch('sys.argv', ['cmd-call-graph', example, '-j', '2', '-o', output]):
+                main()
+            with open(output) as f, open(expected) as g:
+                self.assertEqual(g.read(), f.read())
+
+    def test_lazy_focus(self):
+        """Test that --focus, which builds the graph lazily, gives the same output as an eager build."""
+        example = os.path.join(os.path.dirname(__file__), '..', 'examples', 'example1.cmd')
+        outputs = []
+        with tempfile.TemporaryDirectory() as tmp:
+            for jobs in ['1', '2']:
+                output = os.path.join(tmp, 'graph{}.dot'.format(jobs))
+                with patch('sys.argv', ['cmd-call-graph', example, '--focus', 'BAZ', '-j', jobs, '-o', output]):
+                    main()
+                with open(output) as f:
+                    outputs.append(f.read())
+        self.assertIn('"baz"', outputs[0])
+        self.assertEqual(outputs[1], outputs[0])
+
+    def _RunMissingInput(self, *options):
+        with tempfile.TemporaryDirectory() as tmp:
+            missing = os.path.join(tmp, 'missing.cmd')
+            argv = ['cmd-call-graph', missing, '-o', os.path.join(tmp, 'graph.dot')] + \
+                [option.format(tmp=tmp) for option in options]
+            with patch('sys.argv', argv), patch('sys.stdout', new=io.StringIO()) as mock_stdout, \
+                    patch('sys.stderr', new=io.StringIO()) as mock_stderr:
+                with self.assertRaises(SystemExit) as cm:
+                    main()
+        self.assertEqual(cm.exception.code, 1)
+        self.assertIn('Error opening {}'.format(missing), mock_stderr.getvalue())
+        self.assertEqual('', mock_stdout.getvalue())
+
+    def test_missing_input(self):
+        """Test that a missing input is reported on stderr with exit code 1 in every build mode."""
+        for options in [[], ['-j', '2'], ['--cache-dir', '{tmp}'], ['--follow-calls'], ['--focus', 'foo']]:
+            with self.subTest(options=options):
+                self._RunMissingInput(*options)
+
+
+    def test_profile_in_batch_mode(self):
+        """Test that --profile is rejected in batch mode rather than ignored."""
+        with tempfile.TemporaryDirectory() as tmp:
+            argv = ['cmd-call-graph', '--profile', '--output-dir', os.path.join(tmp, 'out'), tmp]
+            with patch('sys.argv', argv), patch('sys.stderr', new=io.StringIO()) as mock_stderr:
+                with self.assertRaises(SystemExit) as cm:
+                    main()
+            self.assertFalse(os.path.exists(os.path.join(tmp, 'out')))
+        self.assertEqual(cm.exception.code, 2)
+        self.assertIn('--profile is not supported in batch mode', mock_stderr.getvalue())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -15,6 +15,12 @@ class CodeLineTest(unittest.TestCase):
         self.assertEqual(2, line.commands_counter["goto"])
         self.assertEqual(1, line.commands_counter["external_call"])
 
+    def test_compact_layout(self):
+        line = CodeLine(0, "foo")
+        self.assertFalse(hasattr(line, "__dict__"))
+        self.assertEqual((), line.commands)
+        self.assertEqual(0, len(line.commands_counter))
+
 class CallGraphTest(unittest.TestCase):
     def setUp(self):
         self.devnull = open(os.devnull, "w")
@@ -390,5 +396,153 @@ class BasicBuildTests(CallGraphTest):
         connection_dsts = [conn.dst for conn in begin_node.connections]
         self.assertIn("label", connection_dsts)
 
+class GraphIndexTests(CallGraphTest):
+    code = """:main
+    call :foo
+    goto :bar
+    :foo
+    echo foo
+    :bar
+    call :foo
+    goto :eof
+    """.split("\n")
+
+    def test_nodes_in_order(self):
+        call_graph = CallGraph.Build(self.code, self.devnull)
+        self.assertEqual(["main", "foo", "bar"], [n.name for n in call_graph.nodes_in_order])
+
+    def test_redefined_label_order(self):
+        code = """:a
+        :b
+        :a
+        """.split("\n")
+        call_graph = CallGraph.Build(code, self.devnull)
+        self.assertEqual(["b", "a"], [n.name for n in call_graph.nodes_in_order])
+
+    def test_incoming(self):
+        call_graph = CallGraph.Build(self.code, self.devnull)
+        foo_incoming = set((c.src, c.kind) for c in call_graph.GetIncoming("foo"))
+        self.assertEqual(set([("main", "call"), ("bar", "call")]), foo_incoming)
+        bar_incoming = set((c.src, c.kind) for c in call_graph.GetIncoming("bar"))
+        self.assertEqual(set([("main", "goto"), ("foo", "nested")]), bar_incoming)
+
+        # eof has been pruned, together with its incoming connections.
+        self.assertNotIn("eof", call_graph.nodes)
+        self.assertEqual(0, len(call_graph.GetIncoming("eof")))
+
+    def test_connections_by_kind(self):
+        call_graph = CallGraph.Build(self.code, self.devnull)
+        for node in call_graph.nodes.values():
+            by_kind = set()
+            for kind in ("call", "goto", "nested"):
+                for c in node.GetConnections(kind):
+                    self.assertEqual(kind, c.kind)
+                    by_kind.add(c)
+            self.assertEqual(node.connections, by_kind)
+
+    def test_remove_node(self):
+        call_graph = CallGraph.Build(self.code, self.devnull)
+        call_graph.RemoveNode("foo")
+        self.assertEqual(["main", "bar"], [n.name for n in call_graph.nodes_in_order])
+        self.assertEqual(0, len(call_graph.GetIncoming("foo")))
+        for node in call_graph.nodes.values():
+            self.assertEqual(0, len(node.GetConnections("call")))
+            self.assertNotIn("foo", [c.dst for c in node.connections])
+
+class NodeSummaryTests(CallGraphTest):
+    def test_summary(self):
+        code = """:main
+        call :foo
+        call tools\\build.cmd
+        call :foo
+        :foo
+        exit /b 1
+        :bar
+        goto :eof
+        :baz
+        exit
+        :empty
+        """.split("\n")
+        call_graph = CallGraph.Build(code, self.devnull)
+
+        main = call_graph.nodes["main"].summary
+        self.assertEqual(2, main.Count("call"))
+        self.assertEqual(1, main.Count("external_call"))
+        self.assertEqual(0, main.Count("goto"))
+        self.assertEqual(((3, "tools\\build.cmd"),), main.external_calls)
+        self.assertFalse(main.has_exit)
+        self.assertFalse(main.has_terminating)
+
+        foo = call_graph.nodes["foo"].summary
+        self.assertFalse(foo.has_exit)
+        self.assertTrue(foo.has_terminating)
+
+        self.assertTrue(call_graph.nodes["bar"].summary.has_terminating)
+        self.assertTrue(call_graph.nodes["baz"].summary.has_exit)
+        self.assertEqual(0, len(call_graph.nodes["empty"].summary.command_counts))
+
+        self.assertEqual(2, call_graph.nodes["main"].GetCommandCount()["call"])
+
+    def test_redefined_label(self):
+        code = """:a
+        exit
+        :b
+        :a
+        call x.cmd
+        """.split("\n")
+        call_graph = CallGraph.Build(code, self.devnull)
+        summary = call_graph.nodes["a"].summary
+        self.assertTrue(summary.has_exit)
+        self.assertEqual(((5, "x.cmd"),), summary.external_calls)
+
+class NeighborhoodTests(CallGraphTest):
+    # a -> b -> c -> d, and e -> c.
+    code = """:a
+    call :b
+    exit /b
+    :b
+    call :c
+    exit /b
+    :c
+    call :d
+    exit /b
+    :d
+    exit /b
+    :e
+    call :c
+    """.split("\n")
+
+    def setUp(self):
+        CallGraphTest.setUp(self)
+        self.call_graph = CallGraph.Build(self.code, self.devnull)
+
+    def test_both(self):
+        subgraph = self.call_graph.Neighborhood(["C"], 1)
+        self.assertEqual(["b", "c", "d", "e"], [n.name for n in subgraph.nodes_in_order])
+        self.assertEqual(set(["b", "e"]), set(c.src for c in subgraph.GetIncoming("c") if c.kind == "call"))
+        self.assertEqual("b", subgraph.first_node.name)
+
+    def test_callees(self):
+        subgraph = self.call_graph.Neighborhood(["a"], None, "callees")
+        self.assertEqual(["a", "b", "c", "d"], [n.name for n in subgraph.nodes_in_order])
+        self.assertEqual("a", subgraph.first_node.name)
+
+    def test_callers(self):
+        subgraph = self.call_graph.Neighborhood(["c"], 2, "callers")
+        self.assertEqual(["a", "b", "c", "e"], [n.name for n in subgraph.nodes_in_order])
+
+    def test_connections_inside_neighborhood(self):
+        subgraph = self.call_graph.Neighborhood(["b"], 0)
+        self.assertEqual(["b"], list(subgraph.nodes))
+        self.assertEqual(0, len(subgraph.nodes["b"].connections))
+        # The original graph is not modified.
+        self.assertEqual(1, len(self.call_graph.nodes["b"].connections))
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            self.call_graph.Neighborhood(["nope"])
+        with self.assertRaises(ValueError):
+            self.call_graph.Neighborhood(["a"], 1, "sideways")
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
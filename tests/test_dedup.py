@@ -0,0 +1,66 @@
+import random
+import unittest
+
+from callgraph import dedup
+from callgraph.core import CallGraph
+from callgraph.profiling import Profiler
+
+from .test_watch import LINE_POOL, SCRIPT, _Snapshot
+
+
+class BlockTableTest(unittest.TestCase):
+    def test_same_as_build(self):
+        table = dedup.BlockTable()
+        self.assertEqual(_Snapshot(CallGraph.Build(SCRIPT)), _Snapshot(table.Build(SCRIPT)))
+        # Built again from the table.
+        self.assertEqual(_Snapshot(CallGraph.Build(SCRIPT)), _Snapshot(table.Build(SCRIPT)))
+        self.assertEqual(4, table.hits)
+        self.assertEqual(4, table.misses)
+        self.assertEqual(len(SCRIPT), table.reused_lines)
+        self.assertGreater(table.hash_time, 0.0)
+        self.assertAlmostEqual(table.ReusedTime() - table.hash_time, table.SavedTime())
+
+    def test_phases(self):
+        expected = Profiler(trace_memory=False)
+        CallGraph.Build(SCRIPT, profiler=expected)
+        profiler = Profiler(trace_memory=False)
+        dedup.BlockTable().Build(SCRIPT, profiler=profiler)
+        self.assertEqual([phase.name for phase in expected.phases], [phase.name for phase in profiler.phases])
+        self.assertEqual(len(SCRIPT), profiler.phases[0].lines)
+        self.assertEqual(len(SCRIPT), profiler.phases[1].lines)
+
+    def test_random_scripts(self):
+        rng = random.Random(0)
+        table = dedup.BlockTable(max_entries=8)
+        for _ in range(300):
+            lines = [rng.choice(LINE_POOL + ["  :A extra", "  CALL :A  "]) for _ in range(rng.randint(0, 20))]
+            try:
+                expected = CallGraph.Build(lines)
+            except IndexError:
+                # A lone colon.
+                with self.assertRaises(IndexError):
+                    table.Build(lines)
+                continue
+            self.assertEqual(_Snapshot(expected), _Snapshot(table.Build(lines)), lines)
+
+    def test_shared_blocks(self):
+        usage = [":usage", "echo usage: %0 [options]", "exit /b 1"]
+        table = dedup.BlockTable()
+        table.Build(["@echo off", "call :usage", "goto :eof"] + usage)
+        # Indented differently, at other line numbers.
+        call_graph = table.Build(["call :main", "goto :eof", ":main", "call :usage", "exit /b 0"] +
+                                 ["  " + line for line in usage])
+        self.assertEqual(1, table.hits)
+        self.assertEqual(3, table.reused_lines)
+        self.assertEqual(6, call_graph.nodes["usage"].line_number)
+        self.assertEqual([7, 8], [line.number for line in call_graph.nodes["usage"].code[1:]])
+
+    def test_max_entries(self):
+        table = dedup.BlockTable(max_entries=1)
+        table.Build(SCRIPT)
+        table.Build(SCRIPT)
+        self.assertEqual(0, table.hits)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from callgraph import diff
+from callgraph.callgraph import main
+from callgraph.core import CallGraph
+
+
+OLD = [
+    "@echo off",
+    "call :foo",
+    "goto :eof",
+    ":bar",
+    "echo bar",
+    "call :baz",
+    ":baz",
+    "echo baz",
+    "exit /b 0",
+    ":foo",
+    "goto :bar",
+]
+
+NEW = [
+    "@echo off",
+    "rem a new line moves all the blocks",
+    "call :foo",
+    "goto :eof",
+    ":baz",
+    "echo baz",
+    "exit /b 0",
+    ":foo",
+    "call :qux",
+    "call :qux",
+    "goto :eof",
+    ":qux",
+    "echo qux",
+]
+
+
+class DiffTest(unittest.TestCase):
+    def setUp(self):
+        self.graph_diff = diff.Diff(CallGraph.Build(OLD), CallGraph.Build(NEW))
+
+    def test_fingerprint_ignores_line_numbers(self):
+        old = CallGraph.Build(OLD).nodes["baz"]
+        new = CallGraph.Build(NEW).nodes["baz"]
+        self.assertNotEqual(old.line_number, new.line_number)
+        self.assertEqual(diff.Fingerprint(old), diff.Fingerprint(new))
+        self.assertNotEqual(diff.Fingerprint(old), diff.Fingerprint(CallGraph.Build(OLD).nodes["bar"]))
+
+    def test_nodes(self):
+        statuses = dict((delta.name, delta.status) for delta in self.graph_diff.nodes)
+        self.assertEqual({"__begin__": diff.CHANGED, "bar": diff.REMOVED, "baz": diff.UNCHANGED,
+                          "foo": diff.CHANGED, "qux": diff.ADDED}, statuses)
+
+    def test_edges(self):
+        edges = [tuple(delta) for delta in self.graph_diff.edges]
+        self.assertEqual([
+            ("__begin__", "foo", "call", diff.UNCHANGED, 1, 1),
+            ("bar", "baz", "call", diff.REMOVED, 1, 0),
+            ("bar", "baz", "nested", diff.REMOVED, 1, 0),
+            ("foo", "bar", "goto", diff.REMOVED, 1, 0),
+            ("foo", "qux", "call", diff.ADDED, 0, 2),
+        ], edges)
+
+    def test_changed_edge_count(self):
+        graph_diff = diff.Diff(CallGraph.Build([":a", "call :b", ":b"]),
+                               CallGraph.Build([":a", "call :b", "call :b", ":b"]))
+        self.assertIn(("a", "b", "call", diff.CHANGED, 1, 2), [tuple(delta) for delta in graph_diff.edges])
+
+    def test_identical(self):
+        graph_diff = diff.Diff(CallGraph.Build(OLD), CallGraph.Build(OLD))
+        self.assertTrue(all(delta.status == diff.UNCHANGED for delta in graph_diff.nodes + graph_diff.edges))
+
+    def test_json(self):
+        document = json.loads("".join(diff.GenerateJson(self.graph_diff, show_unchanged=False)))
+        self.assertEqual({"added": 1, "removed": 1, "changed": 2, "unchanged": 1}, document["summary"]["nodes"])
+        self.assertEqual(["__begin__", "bar", "foo", "qux"], [node["name"] for node in document["nodes"]])
+        self.assertEqual({"name": "foo", "status": "changed", "old_line_number": 10, "new_line_number": 8},
+                         document["nodes"][2])
+        self.assertEqual(4, len(document["edges"]))
+
+    def test_dot(self):
+        dot = "".join(diff.GenerateDot(self.graph_diff, show_unchanged=False))
+        self.assertTrue(dot.startswith("digraph g {\n") and dot.endswith("}\n"))
+        self.assertIn('"bar" [color={},'.format(diff.DIFF_COLORS[diff.REMOVED]), dot)
+        self.assertIn('(line 7 &rarr; 5)', dot)
+        # Unchanged, but connected to the changed "bar".
+        self.assertIn('"baz" [label=', dot)
+        self.assertNotIn('"__begin__" -> "foo"', dot)
+
+    def test_cli(self):
+        root = tempfile.mkdtemp()
+        try:
+            paths = []
+            for name, code in [("old.cmd", OLD), ("new.cmd", NEW)]:
+                paths.append(os.path.join(root, name))
+                with open(paths[-1], "w") as f:
+                    f.write("\n".join(code))
+            with patch("sys.argv", ["cmd-call-graph", "diff", "--format", "json"] + paths):
+                with patch("sys.stdout", new=io.StringIO()) as stdout:
+                    main()
+            self.assertEqual(5, len(json.loads(stdout.getvalue())["nodes"]))
+        finally:
+            shutil.rmtree(root)
+
+    def test_cli_errors(self):
+        root = tempfile.mkdtemp()
+        try:
+            good = os.path.join(root, "good.cmd")
+            with open(good, "w") as f:
+                f.write("\n".join(OLD))
+            bad = os.path.join(root, "bad.cmd")
+            with open(bad, "wb") as f:
+                f.write(b"@echo off\necho \xff\xfe\n")
+            for path, message in [(bad, "Error reading " + bad), (os.path.join(root, "missing.cmd"), "Error opening")]:
+                with self.subTest(path=path):
+                    argv = ["cmd-call-graph", "diff", "--encoding", "utf-8", good, path]
+                    with patch("sys.argv", argv), patch("sys.stdout", new=io.StringIO()) as stdout, \
+                            patch("sys.stderr", new=io.StringIO()) as stderr:
+                        with self.assertRaises(SystemExit) as cm:
+                            main()
+                    self.assertEqual(1, cm.exception.code)
+                    self.assertIn(message, stderr.getvalue())
+                    self.assertEqual("", stdout.getvalue())
+        finally:
+            shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    unittest.main()
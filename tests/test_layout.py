@@ -0,0 +1,84 @@
+import io
+import unittest
+import xml.etree.ElementTree as ElementTree
+
+from callgraph import layout
+from callgraph import render
+from callgraph.core import CallGraph
+
+
+class LayeredTest(unittest.TestCase):
+    def test_empty(self):
+        drawing = layout.Layered([], [])
+        self.assertEqual([], drawing.boxes)
+
+    def test_edges_go_down(self):
+        # A chain, with a back edge and a self-loop.
+        edges = [(0, 1), (1, 2), (2, 3), (3, 1), (2, 2)]
+        drawing = layout.Layered([(50, 20)] * 4, edges)
+        self.assertEqual([0, 1, 2, 3], [box.layer for box in drawing.boxes])
+        ys = [box.y for box in drawing.boxes]
+        self.assertEqual(sorted(ys), ys)
+
+    def test_bounded_layers(self):
+        # A star: without a bound, all leaves would be in the same layer.
+        edges = [(0, i) for i in range(1, 17)]
+        drawing = layout.Layered([(50, 20)] * 17, edges, max_layer_size=4)
+        layers = [box.layer for box in drawing.boxes]
+        for layer in set(layers):
+            self.assertLessEqual(layers.count(layer), 4)
+        self.assertTrue(all(layer > 0 for layer in layers[1:]))
+
+    def test_sources_above_successors(self):
+        # 1 and 2 are only called by each other's successors.
+        edges = [(0, 3), (1, 3), (2, 4), (3, 4)]
+        drawing = layout.Layered([(50, 20)] * 5, edges)
+        for src, dst in edges:
+            self.assertLess(drawing.boxes[src].layer, drawing.boxes[dst].layer)
+
+    def test_no_overlaps(self):
+        sizes = [(10 + 7 * (i % 5), 20) for i in range(30)]
+        edges = [(i, (i * 7 + 3) % 30) for i in range(30)]
+        drawing = layout.Layered(sizes, edges, node_gap=5)
+        by_layer = {}
+        for box in drawing.boxes:
+            by_layer.setdefault(box.layer, []).append(box)
+        for boxes in by_layer.values():
+            boxes.sort(key=lambda box: box.x)
+            for left, right in zip(boxes, boxes[1:]):
+                self.assertLessEqual(left.x + left.width / 2.0 + 5, right.x - right.width / 2.0 + 1e-6)
+        for box in drawing.boxes:
+            self.assertGreaterEqual(box.x - box.width / 2.0, 0)
+            self.assertLessEqual(box.x + box.width / 2.0, drawing.width)
+            self.assertLessEqual(box.y + box.height / 2.0, drawing.height)
+
+    def test_crossings_reduced(self):
+        # In the order of definition, 1 -> 4 and 2 -> 3 would cross.
+        edges = [(0, 1), (0, 2), (1, 4), (2, 3)]
+        drawing = layout.Layered([(50, 20)] * 5, edges, max_layer_size=2)
+        boxes = drawing.boxes
+        self.assertEqual([0, 1, 1, 2, 2], [box.layer for box in boxes])
+        self.assertEqual(boxes[1].x < boxes[2].x, boxes[4].x < boxes[3].x)
+
+
+class SvgTest(unittest.TestCase):
+    def test_svg(self):
+        code = [":Main", "call :foo", "goto :eof", ":foo", "echo <&>", "goto :Main", "exit"]
+        call_graph = CallGraph.Build(code)
+        out = io.StringIO()
+        render.Render(call_graph, out, "svg", show_node_stats=True)
+
+        root = ElementTree.fromstring(out.getvalue())
+        ns = "{http://www.w3.org/2000/svg}"
+        titles = [g.find(ns + "title").text for g in root.iter(ns + "g") if g.find(ns + "rect") is not None]
+        self.assertEqual(["main", "foo"], titles)
+        strokes = sorted(path.get("stroke") for path in root.iter(ns + "path") if path.get("marker-end"))
+        self.assertEqual(sorted([render.COLORS["call"].strip('"'), render.COLORS["goto"].strip('"')]), strokes)
+        self.assertIn("[terminating]", [text.text for text in root.iter(ns + "text")])
+
+    def test_registered(self):
+        self.assertEqual(".svg", render.GetFormat("svg").extension)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import random
+import tempfile
+import unittest
+
+from callgraph import lazy
+from callgraph import profiling
+from callgraph import reader
+from callgraph.core import CallGraph
+
+from .test_watch import LINE_POOL, SCRIPT, _Snapshot
+
+
+def _Lazy(lines):
+    return lazy.LazyCallGraph("\r\n".join(lines).encode("utf-8"), "utf-8")
+
+
+# The eager graph of the same script as _Lazy(lines).
+def _Build(lines):
+    return CallGraph.Build(reader.IterDecodedLines("\r\n".join(lines).encode("utf-8"), "utf-8"))
+
+
+def _Neighborhood(call_graph, label, depth, direction):
+    return _Snapshot(call_graph.Neighborhood([label], depth, direction))
+
+
+class LazyCallGraphTest(unittest.TestCase):
+    def test_same_as_build(self):
+        self.assertEqual(_Snapshot(_Build(SCRIPT)), _Snapshot(_Lazy(SCRIPT).Evaluate()))
+
+    def test_random_scripts(self):
+        rng = random.Random(0)
+        for _ in range(300):
+            lines = [rng.choice(LINE_POOL) for _ in range(rng.randint(1, 20))]
+            try:
+                expected = _Build(lines)
+            except IndexError:
+                # A lone colon.
+                continue
+            label = rng.choice(list(expected.nodes))
+            depth = rng.choice([1, 2, None])
+            direction = rng.choice(["both", "callers", "callees"])
+            self.assertEqual(_Neighborhood(expected, label, depth, direction),
+                             _Neighborhood(_Lazy(lines), label, depth, direction), lines)
+            self.assertEqual(_Snapshot(expected), _Snapshot(_Lazy(lines).Evaluate()), lines)
+
+    def test_labels(self):
+        call_graph = _Lazy(SCRIPT)
+        self.assertEqual([reader.Label(4, "foo"), reader.Label(8, "bar"), reader.Label(10, "baz")],
+                         call_graph.Labels())
+        self.assertTrue(call_graph.HasLabel("FOO"))
+        self.assertFalse(call_graph.HasLabel("qux"))
+        self.assertFalse(call_graph.HasLabel("__begin__"))
+        self.assertEqual((0, 4), call_graph.AnnotatedBlocks())
+
+    def test_focus_annotates_few_blocks(self):
+        lines = ["@echo off", "call :function0", "goto :eof"]
+        for i in range(100):
+            lines += [":function{}".format(i), "echo {}".format(i), "call :function{}".format(i + 1), "exit /b 0"]
+        call_graph = _Lazy(lines)
+        neighborhood = call_graph.Neighborhood(["function50"], 1, "both")
+        self.assertEqual(["function49", "function50", "function51"], sorted(neighborhood.nodes))
+        annotated, total = call_graph.AnnotatedBlocks()
+        self.assertEqual(101, total)
+        self.assertLess(annotated, 10)
+
+    def test_read_only(self):
+        with self.assertRaises(TypeError):
+            _Lazy(SCRIPT).AddConnection("foo", "bar", "call")
+
+    def test_duplicate_labels(self):
+        lines = SCRIPT + [":foo", "echo redefined"]
+        call_graph = _Lazy(lines)
+        # Built eagerly.
+        self.assertEqual((4, 4), call_graph.AnnotatedBlocks())
+        self.assertEqual(_Snapshot(_Build(lines)), _Snapshot(call_graph.Evaluate()))
+        self.assertTrue(call_graph.HasLabel("foo"))
+
+    def test_from_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "script.cmd")
+            with open(path, "w") as f:
+                f.write("\n".join(SCRIPT) + "\n")
+            call_graph = lazy.LazyCallGraph.FromFile(path)
+        self.assertEqual(_Snapshot(CallGraph.Build(SCRIPT)), _Snapshot(call_graph.Evaluate()))
+
+    def test_profiler(self):
+        profiler = profiling.Profiler(trace_memory=False)
+        lazy.LazyCallGraph("\n".join(SCRIPT).encode("utf-8"), "utf-8", profiler)
+        self.assertEqual(["scan_labels"], [phase.name for phase in profiler.phases])
+        self.assertEqual(3, profiler.phases[0].nodes)
+
+        # Built eagerly, with the phases of CallGraph.Build.
+        profiler = profiling.Profiler(trace_memory=False)
+        lazy.LazyCallGraph("\n".join(SCRIPT + [":foo"]).encode("utf-8"), "utf-8", profiler)
+        self.assertEqual(["scan_labels", "parse"], [phase.name for phase in profiler.phases][:2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import io
+import logging
+import unittest
+
+from callgraph import log
+from callgraph.core import CallGraph
+from callgraph.render import PrintDot
+
+
+class LogTest(unittest.TestCase):
+    code = """
+    call :foo
+    goto :eof
+    :foo
+    goto :eof
+    """.split("\n")
+
+    def setUp(self):
+        self.stream = io.StringIO()
+
+    def _BuildWithVerbosity(self, verbosity):
+        handler = log.Configure(self.stream, verbosity)
+        try:
+            call_graph = CallGraph.Build(self.code)
+            PrintDot(call_graph, io.StringIO())
+        finally:
+            log.Unconfigure(handler)
+        return self.stream.getvalue()
+
+    def test_verbosity_levels(self):
+        self.assertEqual(logging.WARNING, log.LevelForVerbosity(0))
+        self.assertEqual(logging.INFO, log.LevelForVerbosity(1))
+        self.assertEqual(logging.DEBUG, log.LevelForVerbosity(2))
+        self.assertEqual(log.TRACE, log.LevelForVerbosity(3))
+        self.assertEqual(log.TRACE, log.LevelForVerbosity(10))
+
+    def test_quiet(self):
+        self.assertEqual("", self._BuildWithVerbosity(0))
+
+    def test_info(self):
+        output = self._BuildWithVerbosity(1)
+        self.assertIn("is the last node", output)
+        self.assertNotIn("Annotating node", output)
+
+    def test_trace(self):
+        output = self._BuildWithVerbosity(3)
+        self.assertIn("Annotating node", output)
+        self.assertIn("Line 2 has a goto towards: <foo>", output)
+        self.assertIn("Processing node foo", output)
+
+    def test_unconfigure(self):
+        self._BuildWithVerbosity(3)
+        before = self.stream.getvalue()
+        CallGraph.Build(self.code)
+        self.assertEqual(before, self.stream.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from callgraph import parallel
+from callgraph.core import CallGraph
+from callgraph.render import GenerateJson
+
+
+class ParallelTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.min_shard_size = parallel.MIN_SHARD_SIZE
+        # Small shards, so that even tiny scripts are split.
+        parallel.MIN_SHARD_SIZE = 16
+
+    def tearDown(self):
+        parallel.MIN_SHARD_SIZE = self.min_shard_size
+        shutil.rmtree(self.root)
+
+    def _Write(self, data):
+        path = os.path.join(self.root, "script.cmd")
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def _AssertSameGraph(self, data, jobs=4):
+        path = self._Write(data)
+        self.assertGreater(len(parallel.FindShards(data, jobs * parallel.SHARDS_PER_JOB)), 1)
+        with open(path, "r") as f:
+            expected = CallGraph.Build(f)
+        actual = parallel.BuildParallel(path, jobs)
+
+        self.assertEqual([n.name for n in expected.nodes_in_order], [n.name for n in actual.nodes_in_order])
+        self.assertEqual(expected.first_node.name, actual.first_node.name)
+        for name, node in expected.nodes.items():
+            other = actual.nodes[name]
+            self.assertEqual(node.code, other.code, name)
+            self.assertEqual([l.commands for l in node.code], [l.commands for l in other.code], name)
+            self.assertEqual(node.connections, other.connections, name)
+            self.assertEqual(node.summary, other.summary, name)
+            self.assertEqual(node.is_exit_node, other.is_exit_node, name)
+            self.assertEqual(node.is_last_node, other.is_last_node, name)
+        self.assertEqual("".join(GenerateJson(expected, show_node_stats=True)),
+                         "".join(GenerateJson(actual, show_node_stats=True)))
+
+    def test_same_graph_as_sequential(self):
+        code = ["@echo off", "call :a", "goto :b"]
+        for i in range(20):
+            code += [":f{}".format(i), "echo {}".format(i), "call :f{}".format(i + 1),
+                     "if errorlevel 1 exit /b 1"]
+        code += [":a", "echo a", ":b", "echo b", "goto :eof"]
+        self._AssertSameGraph("\n".join(code).encode("ascii"))
+
+    def test_label_on_first_line_and_crlf(self):
+        code = [":Main", "call :Sub"]
+        for i in range(20):
+            code += [":Sub", "echo redefined {}".format(i), "goto :eof"]
+        code += [":eof", "echo after eof"]
+        self._AssertSameGraph("\r\n".join(code).encode("ascii") + b"\r\n")
+
+    def test_fall_through_across_shards(self):
+        code = []
+        for i in range(30):
+            code += [":block{}".format(i), "echo {}".format(i)]
+        self._AssertSameGraph("\n".join(code).encode("ascii"))
+
+    def test_small_input_is_sequential(self):
+        parallel.MIN_SHARD_SIZE = self.min_shard_size
+        path = self._Write(b":a\r\ncall :b\r\n:b\r\necho b\r\n")
+        with open(path, "rb") as f:
+            self.assertEqual([(0, os.path.getsize(path), 1)], parallel.FindShards(f.read(), 8))
+        call_graph = parallel.BuildParallel(path, 4)
+        self.assertEqual(["a", "b"], [n.name for n in call_graph.nodes_in_order])
+
+    def test_bare_carriage_returns(self):
+        data = b":a\recho a\r" * 20
+        self.assertEqual([(0, len(data), 1)], parallel.FindShards(data, 8))
+
+
+if __name__ == "__main__":
+    unittest.main()
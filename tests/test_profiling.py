@@ -0,0 +1,54 @@
+import io
+import json
+import tracemalloc
+import unittest
+
+from callgraph.core import CallGraph
+from callgraph.profiling import Profiler
+from callgraph.render import PrintDot
+
+
+class ProfilerTest(unittest.TestCase):
+    code = """
+    call :foo
+    exit
+    :foo
+    goto :eof
+    """.split("\n")
+
+    def test_build_phases(self):
+        seen = []
+        profiler = Profiler(on_phase=seen.append)
+        call_graph = CallGraph.Build(self.code, profiler=profiler)
+        with profiler.Phase("render") as phase:
+            PrintDot(call_graph, io.StringIO())
+            phase["nodes"] = len(call_graph.nodes)
+        profiler.Close()
+
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertEqual(["parse", "annotate", "prune_eof", "nested_connections", "mark_exit_nodes", "render"],
+                         [stats.name for stats in profiler.phases])
+        self.assertEqual(profiler.phases, seen)
+
+        parse = profiler.phases[0]
+        self.assertEqual(6, parse.lines)
+        self.assertEqual(3, parse.nodes)
+        self.assertGreater(parse.peak_memory_bytes, 0)
+        annotate = profiler.phases[1]
+        self.assertEqual(6, annotate.lines)
+        self.assertEqual(3, annotate.nodes)
+        self.assertEqual(2, profiler.phases[-1].nodes)
+
+        report = json.loads(profiler.ToJson())
+        self.assertIn("lines_per_second", report["phases"][0])
+        self.assertIn("render", profiler.Report())
+
+    def test_without_memory(self):
+        profiler = Profiler(trace_memory=False)
+        CallGraph.Build(self.code, profiler=profiler)
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertTrue(all(stats.peak_memory_bytes is None for stats in profiler.phases))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from callgraph.project import ProjectGraph, ResolveCall
+from callgraph.render import PrintDot
+
+
+class ProjectGraphTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.main = self._WriteScript("main.cmd", "call :build\nexit /b 0\n:build\ncall Tools\\Sign.cmd\ncall powershell.exe foo\ncall common\n")
+        self.sign = self._WriteScript(os.path.join("tools", "sign.cmd"), "call %~dp0..\\main.cmd\ngoto :eof\n")
+        self.lib = os.path.join(self.root, "lib")
+        self.common = self._WriteScript(os.path.join("lib", "common.bat"), ":log\necho log\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _WriteScript(self, name, text):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+        return os.path.normpath(os.path.abspath(path))
+
+    def test_resolve(self):
+        self.assertEqual(self.sign, ResolveCall("tools\\sign.cmd", self.main))
+        self.assertEqual(self.main, ResolveCall("%~dp0..\\main.cmd", self.sign))
+        self.assertEqual(self.common, ResolveCall("common", self.main, [self.lib]))
+        self.assertIsNone(ResolveCall("common", self.main))
+        self.assertIsNone(ResolveCall("powershell.exe", self.main))
+        self.assertIsNone(ResolveCall("%tool%.cmd", self.main))
+
+    def _CheckProject(self, project):
+        self.assertEqual({self.main, self.sign, self.common}, set(project.graphs))
+        self.assertEqual([(self.main, "build", 5, "powershell.exe")], project.unresolved)
+
+        linked = project.Link()
+        self.assertEqual("main.cmd:__begin__", linked.first_node.name)
+        self.assertIn("lib/common.bat:log", linked.nodes)
+
+        build = linked.nodes["main.cmd:build"]
+        targets = set((c.dst, c.kind, c.line_number) for c in build.connections)
+        self.assertEqual({("tools/sign.cmd:__begin__", "call", 4), ("lib/common.bat:log", "call", 6)}, targets)
+
+        # The cycle between main.cmd and tools/sign.cmd is linked both ways.
+        sign = linked.nodes["tools/sign.cmd:__begin__"]
+        self.assertIn(("main.cmd:__begin__", "call", 1), set((c.dst, c.kind, c.line_number) for c in sign.connections))
+
+        f = io.StringIO()
+        PrintDot(linked, f)
+        self.assertIn('"main.cmd:build" -> "tools/sign.cmd:__begin__"', f.getvalue())
+
+    def test_build_sequential(self):
+        self._CheckProject(ProjectGraph.Build(self.main, [self.lib]))
+
+    def test_build_parallel(self):
+        self._CheckProject(ProjectGraph.Build(self.main, [self.lib], jobs=2))
+
+    def test_unreadable_called_script(self):
+        with open(self.common, "wb") as f:
+            f.write(b":log\necho \xff\xfe\n")
+        for jobs in (1, 2):
+            with self.subTest(jobs=jobs):
+                with self.assertLogs("callgraph.project", "WARNING") as logs:
+                    project = ProjectGraph.Build(self.main, [self.lib], jobs=jobs, encoding="utf-8")
+                self.assertIn(self.common, logs.output[0])
+                self.assertEqual({self.main, self.sign}, set(project.graphs))
+                self.assertEqual([self.common], list(project.errors))
+                self.assertEqual([(self.main, "build", 5, "powershell.exe"), (self.main, "build", 6, "common")],
+                                 project.unresolved)
+
+                # The call stays an external call of main.cmd:build.
+                build = project.Link().nodes["main.cmd:build"]
+                self.assertEqual({"tools/sign.cmd:__begin__"}, set(c.dst for c in build.connections))
+                self.assertEqual(3, build.summary.Count("external_call"))
+
+    def test_unreadable_entry_script(self):
+        with open(self.main, "wb") as f:
+            f.write(b"call common\necho \xff\xfe\n")
+        with self.assertRaises(UnicodeDecodeError):
+            ProjectGraph.Build(self.main, [self.lib], encoding="utf-8")
+
+
+if __name__ == "__main__":
+    unittest.main()
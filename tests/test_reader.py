@@ -0,0 +1,74 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from callgraph import reader
+from callgraph.core import CallGraph
+from callgraph.render import PrintDot
+
+
+class ReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _Write(self, data):
+        path = os.path.join(self.root, "script.cmd")
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def _TextLines(self, path, encoding):
+        with open(path, "r", encoding=encoding) as f:
+            return [line.rstrip("\n") for line in f]
+
+    def test_same_lines_as_text_mode(self):
+        data = b":Main\r\necho one\r\n\r\ncall :foo\n:foo\rexit /b\n\nlast line without newline"
+        path = self._Write(data)
+        expected = self._TextLines(path, "utf-8")
+        for chunk_size in [1, 7, 1024]:
+            self.assertEqual(expected, list(reader.IterDecodedLines(data, "utf-8", chunk_size)))
+        with reader.MappedFile(path, "utf-8", chunk_size=5) as f:
+            self.assertEqual(expected, list(f))
+
+    def test_legacy_code_page(self):
+        text = ":Men\u00fa\r\necho \u2500\u2500 caf\u00e9 \u2500\u2500\r\n"
+        path = self._Write(text.encode("cp437"))
+        with reader.MappedFile(path, "cp437") as f:
+            self.assertEqual([":Men\u00fa", "echo \u2500\u2500 caf\u00e9 \u2500\u2500"], list(f))
+            self.assertEqual([reader.Label(1, "Men\u00fa")], f.ScanLabels())
+
+    def test_unsupported_encoding(self):
+        with self.assertRaises(ValueError):
+            reader.CheckEncoding("utf-16")
+        with self.assertRaises(LookupError):
+            reader.CheckEncoding("no-such-encoding")
+
+    def test_empty_file(self):
+        with reader.MappedFile(self._Write(b"")) as f:
+            self.assertEqual([], list(f))
+            self.assertEqual([], f.ScanLabels())
+
+    def test_scan_labels(self):
+        data = b"  :First\r\n::comment\r\necho :notalabel\n\t: Second extra\r\n:\n:third\n"
+        self.assertEqual([(1, "First"), (4, "Second"), (6, "third")],
+                         [tuple(label) for label in reader.ScanLabels(data, "ascii")])
+
+    def test_build_same_as_text_mode(self):
+        path = os.path.join(os.path.dirname(__file__), "..", "examples", "example1.cmd")
+        outputs = []
+        for use_mmap in [False, True]:
+            with reader.OpenInput(path, use_mmap=use_mmap) as f:
+                call_graph = CallGraph.Build(f)
+            out = io.StringIO()
+            PrintDot(call_graph, out, show_node_stats=True)
+            outputs.append(out.getvalue())
+        self.assertEqual(outputs[0], outputs[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
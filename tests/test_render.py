@@ -1,8 +1,10 @@
 import io
+import json
 import os
 import unittest
+import xml.etree.ElementTree as ElementTree
 
-from callgraph.render import PrintDot
+from callgraph.render import FORMATS, GenerateDot, PrintDot, Render, WriteChunks
 from callgraph.core import CallGraph
 
 class RenderTest(unittest.TestCase):
@@ -131,5 +133,120 @@ class ParenthesisLabelRenderTest(RenderTest):
         self.assertIn('"bar"', dot, "Node 'bar' should be defined")
 
 
+class StreamingRenderTest(RenderTest):
+    def setUp(self):
+        RenderTest.setUp(self)
+        code = """
+        call :foo
+        call powershell.exe something.ps1
+        exit
+        :foo
+        goto :eof
+        """.split("\n")
+        self.call_graph = CallGraph.Build(code, self.devnull)
+
+    def test_generate_matches_print(self):
+        f = io.StringIO()
+        PrintDot(self.call_graph, f, show_node_stats=True)
+        chunks = list(GenerateDot(self.call_graph, show_node_stats=True))
+        self.assertEqual(f.getvalue(), "".join(chunks))
+        self.assertEqual("digraph g {\n", chunks[0])
+        self.assertEqual("}\n", chunks[-1])
+
+    def test_write_chunks_in_blocks(self):
+        class CountingFile(io.StringIO):
+            writes = 0
+
+            def write(self, text):
+                self.writes += 1
+                return io.StringIO.write(self, text)
+
+        f = CountingFile()
+        WriteChunks(f, ["abc"] * 10, block_size=7)
+        self.assertEqual("abc" * 10, f.getvalue())
+        self.assertEqual(4, f.writes)
+
+
+class FormatsTest(RenderTest):
+    def setUp(self):
+        RenderTest.setUp(self)
+        code = """
+        call :foo
+        call :foo
+        call powershell.exe something.ps1
+        exit
+        :foo
+        goto :eof
+        """.split("\n")
+        self.call_graph = CallGraph.Build(code, self.devnull)
+
+    def _Render(self, output_format, **options):
+        f = io.StringIO()
+        Render(self.call_graph, f, output_format, **options)
+        return f.getvalue()
+
+    def test_dot_is_default(self):
+        f = io.StringIO()
+        PrintDot(self.call_graph, f)
+        self.assertEqual(f.getvalue(), self._Render("dot"))
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            self._Render("png")
+
+    def test_json(self):
+        graph = json.loads(self._Render("json", show_node_stats=True))
+        nodes = {node["name"]: node for node in graph["nodes"]}
+        self.assertEqual(["__begin__", "foo"], sorted(nodes))
+        self.assertEqual(1, nodes["__begin__"]["line_number"])
+        self.assertEqual(1, nodes["__begin__"]["external_calls"])
+        self.assertEqual(5, nodes["__begin__"]["loc"])
+        self.assertTrue(nodes["__begin__"]["is_exit_node"])
+        self.assertEqual([2, 3], sorted(e["line_number"] for e in graph["edges"]))
+
+    def test_json_options(self):
+        graph = json.loads(self._Render("json", show_all_calls=False, nodes_to_hide=set(["__begin__"])))
+        self.assertEqual(["foo"], [node["name"] for node in graph["nodes"]])
+        self.assertNotIn("loc", graph["nodes"][0])
+        self.assertEqual([], graph["edges"])
+
+        graph = json.loads(self._Render("json", show_all_calls=False))
+        self.assertEqual([dict(src="__begin__", dst="foo", kind="call", line_number=None)], graph["edges"])
+
+    def test_graphml(self):
+        ns = "{http://graphml.graphdrawing.org/xmlns}"
+        root = ElementTree.fromstring(self._Render("graphml", show_node_stats=True))
+        graph = root.find(ns + "graph")
+        self.assertEqual(["__begin__", "foo"], [n.get("id") for n in graph.findall(ns + "node")])
+        edges = graph.findall(ns + "edge")
+        self.assertEqual(2, len(edges))
+        self.assertEqual(("__begin__", "foo"), (edges[0].get("source"), edges[0].get("target")))
+
+    def test_graphml_dangling_edges(self):
+        ns = "{http://graphml.graphdrawing.org/xmlns}"
+        call_graph = CallGraph.Build(["goto %x%", "call :missing", ":foo", "exit"])
+        f = io.StringIO()
+        Render(call_graph, f, "graphml")
+        graph = ElementTree.fromstring(f.getvalue()).find(ns + "graph")
+        node_ids = [n.get("id") for n in graph.findall(ns + "node")]
+        self.assertEqual(["__begin__", "foo", "missing", "x%"], node_ids)
+        targets = [e.get("target") for e in graph.findall(ns + "edge")]
+        self.assertEqual(["foo", "missing", "x%"], targets)
+        # Each node is declared before the edges.
+        self.assertLess(f.getvalue().rindex("<node "), f.getvalue().index("<edge "))
+
+    def test_edge_list(self):
+        lines = self._Render("edgelist", show_all_calls=False).splitlines()
+        self.assertTrue(lines[0].startswith("#"))
+        rows = [line.split("\t") for line in lines[1:]]
+        self.assertEqual([["N", "__begin__", "__begin__", "1", "1", "0"], ["N", "foo", "foo", "6", "0", "1"],
+                          ["E", "__begin__", "foo", "call", "-1"]], rows)
+
+    def test_all_formats_stream(self):
+        for name, output_format in FORMATS.items():
+            chunks = list(output_format.generate(self.call_graph, show_node_stats=True, represent_node_size=True))
+            self.assertGreater(len(chunks), 1, name)
+            self.assertEqual(self._Render(name, show_node_stats=True, represent_node_size=True), "".join(chunks))
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
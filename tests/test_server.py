@@ -0,0 +1,135 @@
+import io
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+from callgraph import api
+from callgraph import server
+
+
+CODE = u":Main\ncall :foo\ngoto :eof\n:foo\necho foo\n"
+
+
+def _Request(request_id, method, **params):
+    return json.dumps({"jsonrpc": "2.0", "id": request_id, "method": method, "params": params})
+
+
+class ServiceTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, "script.cmd")
+        with open(self.path, "w") as f:
+            f.write(CODE)
+        self.service = server.Service(max_graphs=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _Call(self, method, **params):
+        return json.loads(self.service.HandleLine(_Request(1, method, **params)))
+
+    def test_render(self):
+        expected = api.Render(api.BuildText(CODE), show_node_stats=True, output_format="json")
+        for source in [dict(path=self.path), dict(text=CODE)]:
+            response = self._Call("render", show_node_stats=True, format="json", **source)
+            self.assertEqual(1, response["id"])
+            self.assertEqual(expected, response["result"]["output"])
+
+        response = self._Call("render", path=self.path, focus="FOO", depth=0, analyze=True)
+        self.assertEqual(api.Render(api.BuildText(CODE).Neighborhood(["foo"], 0)), response["result"]["output"])
+
+    def test_cache(self):
+        self._Call("analyze", path=self.path)
+        self._Call("analyze", path=self.path)
+        self.assertEqual(dict(graphs=1, max_graphs=2, hits=1, misses=1, evictions=0), self._Call("stats")["result"])
+
+        # A modified file is built again.
+        with open(self.path, "a") as f:
+            f.write(":bar\n")
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+        self.assertIn("bar", self._Call("render", path=self.path, format="edgelist")["result"]["output"])
+        self.assertEqual(2, self._Call("stats")["result"]["misses"])
+
+        self._Call("analyze", text=CODE)
+        self._Call("analyze", text=CODE + "\n")
+        stats = self._Call("stats")["result"]
+        self.assertEqual((2, 1), (stats["graphs"], stats["evictions"]))
+
+        self.assertEqual(0, self._Call("invalidate", path=self.path)["result"]["invalidated"])
+        self.assertEqual(2, self._Call("invalidate")["result"]["invalidated"])
+
+    def test_errors(self):
+        self.assertEqual(server.PARSE_ERROR, json.loads(self.service.HandleLine("{"))["error"]["code"])
+        self.assertEqual(server.INVALID_REQUEST, json.loads(self.service.HandleLine("[]"))["error"]["code"])
+        self.assertEqual(server.METHOD_NOT_FOUND, self._Call("no_such_method")["error"]["code"])
+        self.assertEqual(server.INVALID_PARAMS, self._Call("render")["error"]["code"])
+        self.assertEqual(server.INVALID_PARAMS, self._Call("render", text=CODE, format="no-such-format")["error"]["code"])
+        self.assertEqual(server.INVALID_PARAMS, self._Call("render", text=CODE, focus="missing")["error"]["code"])
+        self.assertEqual(server.SERVER_ERROR,
+                         self._Call("render", path=os.path.join(self.root, "missing.cmd"))["error"]["code"])
+
+    def test_notification(self):
+        self.assertIsNone(self.service.HandleLine(json.dumps({"jsonrpc": "2.0", "method": "stats"})))
+        # Failed notifications get no response either.
+        for notification in [{"jsonrpc": "2.0", "method": "no_such_method"},
+                             {"jsonrpc": "2.0", "method": "render"},
+                             {"jsonrpc": "2.0", "method": "render", "params": []},
+                             {"jsonrpc": "2.0", "method": "render", "params": {"path": os.path.join(self.root, "x")}},
+                             {"method": "stats"}]:
+            self.assertIsNone(self.service.HandleLine(json.dumps(notification)), notification)
+
+        in_file = io.StringIO(json.dumps({"jsonrpc": "2.0", "method": "no_such_method"}) + "\n" +
+                              _Request(1, "stats") + "\n")
+        out_file = io.StringIO()
+        server.ServeStream(self.service, in_file, out_file)
+        self.assertEqual([1], [json.loads(line)["id"] for line in out_file.getvalue().splitlines()])
+
+    def test_stream(self):
+        in_file = io.StringIO(_Request(1, "stats") + "\n\n" + _Request(2, "analyze", text=CODE) + "\n")
+        out_file = io.StringIO()
+        server.ServeStream(self.service, in_file, out_file)
+        responses = [json.loads(line) for line in out_file.getvalue().splitlines()]
+        self.assertEqual([1, 2], [response["id"] for response in responses])
+        self.assertEqual(["foo", "main"], responses[1]["result"]["reachable"])
+
+    @unittest.skipUnless(hasattr(socket, "AF_UNIX"), "requires Unix sockets")
+    def test_unix_socket_concurrent_clients(self):
+        socket_path = os.path.join(self.root, "server.sock")
+        unix_server = server.CreateUnixServer(socket_path, self.service)
+        thread = threading.Thread(target=unix_server.serve_forever)
+        thread.start()
+        expected = api.Render(api.BuildText(CODE))
+        results = []
+
+        def Client(client_id):
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                client.connect(socket_path)
+                with client.makefile("rwb") as f:
+                    for i in range(5):
+                        f.write(_Request(i, "render", path=self.path).encode("utf-8") + b"\n")
+                        f.flush()
+                        response = json.loads(f.readline().decode("utf-8"))
+                        results.append((client_id, response["id"], response["result"]["output"]))
+
+        try:
+            clients = [threading.Thread(target=Client, args=(i,)) for i in range(4)]
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+        finally:
+            unix_server.shutdown()
+            unix_server.server_close()
+            thread.join()
+
+        self.assertEqual(20, len(results))
+        self.assertTrue(all(output == expected for _, _, output in results))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+
+from callgraph.tokenizer import Command, MayContainCommands, Tokenize
+
+
+class TokenizeTest(unittest.TestCase):
+    def test_plain_code(self):
+        self.assertFalse(MayContainCommands("set foo=bar"))
+        self.assertEqual((False, ()), Tokenize("set foo=bar"))
+
+    def test_empty(self):
+        self.assertEqual((True, ()), Tokenize(""))
+
+    def test_comments(self):
+        for text in [":: goto :foo", "@:: call :foo", "rem call :foo", "@rem exit"]:
+            self.assertEqual((True, ()), Tokenize(text), text)
+
+    def test_false_positive(self):
+        self.assertTrue(MayContainCommands("echo recall"))
+        self.assertEqual((False, ()), Tokenize("echo recall"))
+
+    def test_commands(self):
+        noop, commands = Tokenize("call :foo & call bar.cmd & @goto :baz & exit /b 1")
+        self.assertFalse(noop)
+        self.assertEqual((Command("call", "foo"), Command("external_call", "bar.cmd"),
+                          Command("goto", "baz"), Command("exit", "/b")), commands)
+
+    def test_exit_without_target(self):
+        self.assertEqual((False, (Command("exit", ""),)), Tokenize("@exit"))
+
+    def test_parentheses(self):
+        noop, commands = Tokenize("if foo==bar (call :foo) else ((goto :bar))")
+        self.assertEqual((Command("call", "foo"), Command("goto", "bar")), commands)
+
+    def test_missing_target(self):
+        self.assertEqual((False, ()), Tokenize("goto"))
+        self.assertEqual((False, ()), Tokenize("if x (call )"))
+
+    def test_shared_commands(self):
+        _, first = Tokenize("goto :eof")
+        _, second = Tokenize("  goto :eof".strip())
+        self.assertIs(first[0], second[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+import os
+import queue
+import random
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from callgraph import watch
+from callgraph.callgraph import main
+from callgraph.core import CallGraph
+
+
+SCRIPT = [
+    "@echo off",
+    "call :foo",
+    "goto :eof",
+    ":foo",
+    "echo foo",
+    "call :bar",
+    "exit /b 0",
+    ":bar",
+    "rem nested into baz",
+    ":baz",
+    "call other.cmd",
+    "goto :foo",
+]
+
+LINE_POOL = ["echo hi", "call :a", "goto :b", "goto :eof", "exit /b 0", "exit", "rem comment", "", ":: comment",
+             "call :eof", "call other.cmd", ":a", ":b", ":c", ":eof", "set x=1", "call :c"]
+
+
+# Everything the parser and the processing steps set in a graph.
+def _Snapshot(call_graph):
+    nodes = []
+    for node in call_graph.OrderedNodes():
+        code = [(line.number, line.text, line.terminating, line.noop, tuple(line.commands)) for line in node.code]
+        nodes.append((node.name, node.original_name, node.line_number, node.is_exit_node, node.is_last_node,
+                      node.loc, sorted(node.connections), code, node.summary))
+    incoming = sorted((name, sorted(connections)) for name, connections in call_graph.incoming.items() if connections)
+    return list(call_graph.nodes), call_graph.first_node.name, nodes, incoming
+
+
+class IncrementalGraphTest(unittest.TestCase):
+    def assertUpdate(self, graph, lines):
+        self.assertEqual(_Snapshot(CallGraph.Build(lines)), _Snapshot(graph.Update(lines)))
+
+    def test_edits(self):
+        graph = watch.IncrementalGraph()
+        self.assertUpdate(graph, SCRIPT)
+        edits = [
+            lambda lines: lines.insert(5, "call :baz"),
+            lambda lines: lines.__delitem__(5),
+            lambda lines: lines.__setitem__(7, ":qux"),
+            lambda lines: lines.insert(0, ":start"),
+            lambda lines: lines.__delitem__(0),
+            lambda lines: lines.__setitem__(len(lines) - 1, "exit /b 0"),
+            lambda lines: lines.append("call :eof"),
+            lambda lines: lines.__setitem__(8, "echo no longer nested"),
+            lambda lines: lines.__delitem__(slice(3, 7)),
+            lambda lines: lines.clear(),
+            lambda lines: lines.extend(SCRIPT),
+        ]
+        lines = list(SCRIPT)
+        for edit in edits:
+            edit(lines)
+            self.assertUpdate(graph, list(lines))
+
+    def test_random_edits(self):
+        rng = random.Random(0)
+        for _ in range(100):
+            lines = [rng.choice(LINE_POOL) for _ in range(rng.randint(0, 20))]
+            graph = watch.IncrementalGraph()
+            graph.Update(list(lines))
+            for _ in range(10):
+                position = rng.randint(0, len(lines))
+                action = rng.random()
+                if action < 0.3:
+                    lines[position:position] = [rng.choice(LINE_POOL) for _ in range(rng.randint(1, 3))]
+                elif action < 0.6:
+                    del lines[position:position + rng.randint(1, 3)]
+                elif lines:
+                    lines[min(position, len(lines) - 1)] = rng.choice(LINE_POOL)
+                self.assertUpdate(graph, list(lines))
+
+    def test_only_changed_blocks_are_parsed(self):
+        graph = watch.IncrementalGraph()
+        graph.Update(SCRIPT)
+        self.assertEqual(len(SCRIPT), graph.reparsed_lines)
+
+        lines = list(SCRIPT)
+        lines[4] = "echo changed"
+        graph.Update(lines)
+        # Only the block of foo.
+        self.assertEqual(4, graph.reparsed_lines)
+
+        graph.Update(list(lines))
+        self.assertEqual(0, graph.reparsed_lines)
+
+    def test_moved_blocks(self):
+        graph = watch.IncrementalGraph()
+        graph.Update(SCRIPT)
+        lines = list(SCRIPT)
+        lines.insert(1, "rem moves everything")
+        call_graph = graph.Update(lines)
+        # Only the block of __begin__.
+        self.assertEqual(4, graph.reparsed_lines)
+        self.assertEqual(11, call_graph.nodes["baz"].line_number)
+        self.assertEqual(((12, "other.cmd"),), call_graph.nodes["baz"].summary.external_calls)
+
+    def test_duplicate_labels(self):
+        graph = watch.IncrementalGraph()
+        lines = SCRIPT + [":foo", "echo redefined"]
+        self.assertUpdate(graph, lines)
+        lines[4] = "echo changed"
+        self.assertUpdate(graph, lines)
+        self.assertEqual(len(lines), graph.reparsed_lines)
+
+        # A new label defined elsewhere as well.
+        graph = watch.IncrementalGraph()
+        graph.Update(SCRIPT)
+        lines = list(SCRIPT)
+        lines[8] = ":foo"
+        self.assertUpdate(graph, lines)
+
+
+class WatchTest(unittest.TestCase):
+    def test_watch(self):
+        updates = queue.Queue()
+        stop = threading.Event()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "script.cmd")
+            with open(path, "w") as f:
+                f.write("\n".join(SCRIPT) + "\n")
+            thread = threading.Thread(target=watch.Watch, args=(path, updates.put),
+                                      kwargs=dict(interval=0.01, stop=stop))
+            thread.start()
+            try:
+                call_graph = updates.get(timeout=10)
+                self.assertIn("foo", call_graph.nodes)
+
+                with open(path, "a") as f:
+                    f.write(":qux\r\necho qux\r\n")
+                call_graph = updates.get(timeout=10)
+                self.assertEqual(len(SCRIPT) + 1, call_graph.nodes["qux"].line_number)
+            finally:
+                stop.set()
+                thread.join()
+
+    def test_requires_output(self):
+        with patch("sys.argv", ["cmd-call-graph", "script.cmd", "--watch"]):
+            with patch("sys.stderr"):
+                with self.assertRaises(SystemExit):
+                    main()
+
+
+if __name__ == "__main__":
+    unittest.main()